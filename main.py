@@ -1,38 +1,129 @@
+import argparse
+import asyncio
+import atexit
+import contextlib
+import functools
 import logging
 import os
 import re
+import subprocess
+import sys
+import time
 import urllib.parse
-from datetime import datetime, timezone
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import DuplicateKeyError
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import ApplicationBuilder, MessageHandler, ContextTypes, filters
-
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest
+from telegram.ext import ApplicationBuilder, MessageHandler, ContextTypes, TypeHandler, filters
+
+from mywin_download import configure_client as configure_download_client, download_bounded, warm_up as warm_up_downloads
+from mywin_admins import AdminExemptions
+from mywin_album import MediaGroupBuffer
+from mywin_games import GameStatsBuffer
+from mywin_lanes import LaneDispatcher
+from mywin_pools import MongoPoolListener, PooledHTTPXRequest, PoolWaitStats
+from mywin_catchup import MAX_GET_UPDATES_LIMIT, InsertBatcher, drain_pending_updates
+from mywin_logging import QueueLogging, parse_sample_rates
+from mywin_loopmon import LoopMonitor, update_id_var
+from mywin_tracing import JsonlTraceExporter, MongoSpanListener, Tracer, TracingHTTPXRequest
+from mywin_load import LoadShedder
+from mywin_members import KnownMemberCache
+from mywin_ratelimit import SubmissionRateLimiter
+from mywin_reanalysis import ReanalysisQueue
+from mywin_settle import SettleJob, SettleScheduler
+from mywin_xp import (
+    XpTotalsBuffer,
+    active_xp_writers,
+    heartbeat_xp_writer,
+    reconcile_xp_totals,
+    release_xp_writer,
+    settle_xp_snapshots,
+)
 from mywin_quality import (
+    ImageTooLarge,
+    MyWinImageMetrics,
     analyze_mywin_image,
     decide_mywin_image_quality,
-    is_near_duplicate_hash,
     load_mywin_quality_config,
+    find_near_duplicate_hashes,
     log_mywin_quality,
+    preload_image_analysis,
     store_hash_record,
 )
+from mywin_retention import ensure_hash_retention_index, hash_retention_days, prune_image_hashes
 # ----------------------------
 # Config
 # ----------------------------
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
 MONGO_URL = os.environ.get("MONGO_URL")
 
+# head-sampled per-submission traces (see mywin_tracing); off unless the rate is > 0
+MYWIN_TRACE_SAMPLE_RATE = float(os.environ.get("MYWIN_TRACE_SAMPLE_RATE") or 0)
+tracer = (
+    Tracer(JsonlTraceExporter(os.environ.get("MYWIN_TRACE_FILE", "mywin_traces.jsonl")), MYWIN_TRACE_SAMPLE_RATE)
+    if MYWIN_TRACE_SAMPLE_RATE > 0
+    else None
+)
+
 # ----------------------------
 # MongoDB Setup
 # ----------------------------
-client = MongoClient(MONGO_URL)
+# connection-pool waits of the Telegram request pools and Mongo, logged as [POOLS]
+pool_waits = PoolWaitStats()
+# file downloads get their own pool (mywin_download), sized apart from Bot API calls
+configure_download_client(
+    pool_size=int(os.environ.get("MYWIN_DOWNLOAD_POOL_SIZE", "32")),
+    pool_timeout=float(os.environ.get("MYWIN_DOWNLOAD_POOL_TIMEOUT", "10")),
+    wait_stats=pool_waits,
+)
+
+client = MongoClient(
+    MONGO_URL,
+    maxPoolSize=int(os.environ.get("MYWIN_MONGO_MAX_POOL_SIZE", "100")),
+    # kept open (and opened at boot) by pymongo's pool maintenance
+    minPoolSize=int(os.environ.get("MYWIN_MONGO_MIN_POOL_SIZE", "4")),
+    # a saturated pool fails the operation instead of queueing it forever
+    waitQueueTimeoutMS=int(os.environ.get("MYWIN_MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+    event_listeners=[MongoPoolListener(pool_waits)] + ([MongoSpanListener()] if tracer is not None else []),
+)
 db = client["referral_bot"]
 mywin_posts = db["mywin_posts"]  # track valid mywin/comeback posts
 xp_events = db["xp_events"]
+xp_totals = db["xp_totals"]  # per-user totals materialized from xp_events
+xp_snapshots = db["xp_snapshots"]  # per-user, per-day XP settled from xp_events
+game_stats = db["game_stats"]  # per-game day/week submission counters
+job_leases = db["job_leases"]
+job_checkpoints = db["job_checkpoints"]
+job_runs = db["job_runs"]
 events = db["events"]
 members = db["members"]
 admin_cache = db["admin_cache"]
 mywin_image_hashes = db["mywin_image_hashes"]
+mywin_reanalysis_queue = db["mywin_reanalysis_queue"]  # images whose hot-path analysis was skipped or failed
+schema_migrations = db["schema_migrations"]  # versions of one-off data migrations already applied
+
+# XP/KPI increments waiting for the next batched $inc flush
+xp_totals_buffer = XpTotalsBuffer()
+
+# per-game counters waiting for the next batched $inc flush
+game_stats_buffer = GameStatsBuffer()
+
+# uids already present in members; lets accepted submissions skip the upsert
+known_members = KnownMemberCache(max_size=int(os.environ.get("MYWIN_MEMBER_CACHE_SIZE", "50000")))
+
+# Readiness gate for handlers that touch Mongo. None means no background
+# startup is in progress (tests, CLI jobs); the bot sets an asyncio.Event in
+# post_init and releases it once the DB is reachable and indexes are ensured.
+_db_ready = None
+_background_tasks = set()
+
+# queue-backed root logging installed by main(); None in tests and imports
+_queue_logging = None
+
+# xp/event inserts collected while the startup catch-up drains the backlog;
+# None during normal operation (one insert_one per write)
+_catchup_writes = None
 
 # ----------------------------
 # Caption parsing / playback link validation
@@ -57,6 +148,17 @@ def is_valid_game_name(name):
     return True
 
 
+def normalize_game_key(name):
+    """Fold a game name to a stable key: casefolded, whitespace collapsed.
+
+    "  Zeus   RISING " and "zeus rising" both map to "zeus rising".
+    """
+    if not name:
+        return None
+    key = " ".join(name.casefold().split())
+    return key or None
+
+
 def validate_playback_url(value):
     """Validate an AdvantPlay Replay playback URL.
 
@@ -130,6 +232,7 @@ def parse_mywin_caption(caption):
             return {
                 "tag": m.group("tag").lower(),
                 "game_name": game_name,
+                "game_key": normalize_game_key(game_name),
                 "playback_url": None,
                 "playback_id": None,
                 "submission_format": "tag_and_game",
@@ -140,6 +243,7 @@ def parse_mywin_caption(caption):
             return {
                 "tag": "mywin",
                 "game_name": None,
+                "game_key": None,
                 "playback_url": validated["canonical_url"],
                 "playback_id": validated["playback_id"],
                 "submission_format": "playback_url_only",
@@ -164,6 +268,7 @@ def parse_mywin_caption(caption):
     return {
         "tag": m.group("tag").lower(),
         "game_name": game_name,
+        "game_key": normalize_game_key(game_name),
         "playback_url": validated["canonical_url"],
         "playback_id": validated["playback_id"],
         "submission_format": "tag_game_and_playback",
@@ -208,61 +313,335 @@ def _migrate_duplicate_playback_ids():
         )
 
 
+def _migration_unique_playback_id():
+    """Clear duplicate playback_id values, then create the unique partial index.
+
+    Deployments that already have uq_mywin_playback_id are consistent by
+    construction, so the full-collection audit is skipped for them.
+    """
+    if "uq_mywin_playback_id" in mywin_posts.index_information():
+        return
+    _migrate_duplicate_playback_ids()
+    mywin_posts.create_index(
+        [("playback_id", ASCENDING)],
+        unique=True,
+        partialFilterExpression={
+            "playback_id": {
+                "$exists": True,
+                "$type": "string",
+            }
+        },
+        name="uq_mywin_playback_id",
+    )
+
+
+# Ordered, idempotent migrations. Each version runs once and is then recorded
+# in schema_migrations; never renumber or remove an entry.
+SCHEMA_MIGRATIONS = [
+    ("0001_unique_playback_id", _migration_unique_playback_id),
+]
+
+
+def apply_schema_migrations():
+    applied = {doc["_id"] for doc in schema_migrations.find({}, {"_id": 1})}
+    for version, migrate in SCHEMA_MIGRATIONS:
+        if version in applied:
+            continue
+        started = time.monotonic()
+        try:
+            migrate()
+        except Exception:
+            logging.exception("[MYWIN_MIGRATION] failed version=%s", version)
+            raise
+        duration_ms = int((time.monotonic() - started) * 1000)
+        schema_migrations.update_one(
+            {"_id": version},
+            {"$setOnInsert": {"applied_at": datetime.now(timezone.utc), "duration_ms": duration_ms}},
+            upsert=True,
+        )
+        logging.info("[MYWIN_MIGRATION] applied version=%s duration_ms=%s", version, duration_ms)
+
+
+def _ensure_index(collection, keys, name, **kwargs):
+    """Create an index unless one with this name or this key pattern already exists.
+
+    index_information() is a cheap listIndexes call, so a normal boot issues no
+    createIndexes commands at all. An index on the same keys under another
+    name (e.g. created by hand) is kept: creating ours would fail with
+    IndexOptionsConflict.
+    """
+    existing = collection.index_information()
+    if name in existing:
+        return False
+    wanted = _index_key(keys)
+    for other_name, info in existing.items():
+        if "key" in info and _index_key(info["key"]) == wanted:
+            logging.warning(
+                "[MYWIN_INDEX] index_exists_under_other_name collection=%s name=%s existing=%s",
+                collection.name, name, other_name,
+            )
+            return False
+    collection.create_index(keys, name=name, **kwargs)
+    logging.info("[MYWIN_INDEX] index_created collection=%s name=%s", collection.name, name)
+    return True
+
+
+def _index_key(keys):
+    return [(field, int(direction) if isinstance(direction, float) else direction) for field, direction in keys]
+
+
 def ensure_indexes():
     try:
-        xp_events.create_index(
+        _ensure_index(
+            xp_events,
             [("user_id", ASCENDING), ("unique_key", ASCENDING)],
             unique=True,
             name="uq_xp_user_unique_key",
         )
-        events.create_index(
+        _ensure_index(
+            events,
             [("type", ASCENDING), ("uid", ASCENDING), ("chat_id", ASCENDING), ("message_id", ASCENDING)],
             unique=True,
             name="uq_events_type_uid_chat_message",
         )
-        members.create_index(
+        _ensure_index(
+            members,
             [("uid", ASCENDING)],
             unique=True,
             name="uq_members_uid",
         )
-        mywin_image_hashes.create_index(
-            [("created_at", ASCENDING)],
-            name="idx_mywin_image_hashes_created_at",
+        # TTL on created_at: hashes older than the dedup lookback (plus margin)
+        # are never queried, so let Mongo expire them
+        ensure_hash_retention_index(
+            mywin_image_hashes,
+            hash_retention_days(load_mywin_quality_config()),
+        )
+        # compound partitions for the per-chat / per-user duplicate scopes
+        _ensure_index(
+            mywin_image_hashes,
+            [("chat_id", ASCENDING), ("created_at", ASCENDING)],
+            name="idx_mywin_image_hashes_chat_created_at",
+        )
+        _ensure_index(
+            mywin_image_hashes,
+            [("user_id", ASCENDING), ("created_at", ASCENDING)],
+            name="idx_mywin_image_hashes_user_created_at",
+        )
+        # repost checks look up posts by file_id / album_file_ids
+        _ensure_index(
+            mywin_posts,
+            [("file_id", ASCENDING)],
+            name="idx_mywin_posts_file_id",
+        )
+        _ensure_index(
+            mywin_posts,
+            [("album_file_ids", ASCENDING)],
+            partialFilterExpression={"album_file_ids": {"$exists": True}},
+            name="idx_mywin_posts_album_file_ids",
+        )
+        _ensure_index(
+            game_stats,
+            [("period", ASCENDING), ("period_start", ASCENDING), ("submissions", DESCENDING)],
+            name="idx_game_stats_period_rank",
+        )
+        _ensure_index(
+            xp_snapshots,
+            [("user_id", ASCENDING), ("day", ASCENDING)],
+            name="idx_xp_snapshots_user_day",
+        )
+        _ensure_index(
+            mywin_reanalysis_queue,
+            [("status", ASCENDING), ("enqueued_at", ASCENDING)],
+            name="idx_mywin_reanalysis_queue_status_enqueued_at",
+        )
+        _ensure_index(
+            mywin_reanalysis_queue,
+            [("finished_at", ASCENDING)],
+            expireAfterSeconds=30 * 24 * 3600,
+            name="ttl_mywin_reanalysis_queue_finished_at",
+        )
+        _ensure_index(
+            job_runs,
+            [("started_at", ASCENDING)],
+            expireAfterSeconds=30 * 24 * 3600,
+            name="ttl_job_runs_started_at",
         )
     except DuplicateKeyError:
         pass
 
-    try:
-        _migrate_duplicate_playback_ids()
-        mywin_posts.create_index(
-            [("playback_id", ASCENDING)],
-            unique=True,
-            partialFilterExpression={
-                "playback_id": {
-                    "$exists": True,
-                    "$type": "string",
-                }
-            },
-            name="uq_mywin_playback_id",
-        )
-    except Exception:
-        logging.exception("[MYWIN_INDEX] failed to create uq_mywin_playback_id index")
-        raise
+    apply_schema_migrations()
 
 
 def _parse_bool(value: str) -> bool:
     return (value or "").lower() in {"1", "true", "yes", "on"}
 
 
+def _parse_float_env(name: str, default: float) -> float:
+    raw = os.environ.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        logging.warning("[CONFIG] invalid float %s=%r, using %s", name, raw, default)
+        return default
+
+
+def _is_rate_limited(uid, now):
+    """Check uid against the persisted members.moderation.last_submission_at.
+
+    Returns (limited, seconds_since_last_submission). Costs a read, plus a
+    write when the submission is allowed, so it only seeds the in-memory
+    limiter the first time a uid is seen by this process.
+    """
+    interval = _parse_float_env("MYWIN_RATE_LIMIT_INTERVAL_SECONDS", 10.0)
+    doc = members.find_one({"uid": uid}, {"moderation.last_submission_at": 1}) or {}
+    last_submission = (doc.get("moderation") or {}).get("last_submission_at")
+    if last_submission is None:
+        members.update_one({"uid": uid}, {"$set": {"moderation.last_submission_at": now}})
+        return False, 0.0
+
+    if last_submission.tzinfo is None:
+        # pymongo returns naive UTC datetimes unless tz_aware=True
+        last_submission = last_submission.replace(tzinfo=timezone.utc)
+    delta = (now - last_submission).total_seconds()
+    if delta < interval:
+        return True, delta
+    members.update_one({"uid": uid}, {"$set": {"moderation.last_submission_at": now}})
+    return False, delta
+
+
+def _build_rate_limiter():
+    if not _parse_bool(os.environ.get("MYWIN_RATE_LIMIT_ENABLED", "0")):
+        return None
+    persist = _parse_bool(os.environ.get("MYWIN_RATE_LIMIT_PERSIST", "1"))
+    return SubmissionRateLimiter(
+        interval_seconds=_parse_float_env("MYWIN_RATE_LIMIT_INTERVAL_SECONDS", 10.0),
+        burst=int(_parse_float_env("MYWIN_RATE_LIMIT_BURST", 3)),
+        seed=_is_rate_limited if persist else None,
+    )
+
+
+# per-user submission limiter; None when MYWIN_RATE_LIMIT_ENABLED is off
+submission_limiter = _build_rate_limiter()
+
+def _parse_thresholds_env(name: str, default):
+    raw = os.environ.get(name)
+    if not raw:
+        return default
+    try:
+        values = tuple(float(v) for v in raw.split(","))
+    except ValueError:
+        values = ()
+    if len(values) != len(default):
+        logging.warning("[CONFIG] invalid thresholds %s=%r, using %s", name, raw, default)
+        return default
+    return values
+
+
+def _build_load_shedder():
+    if not _parse_bool(os.environ.get("MYWIN_LOAD_SHEDDING_ENABLED", "0")):
+        return None
+    return LoadShedder(
+        inflight_thresholds=_parse_thresholds_env("MYWIN_LOAD_INFLIGHT_THRESHOLDS", (8, 16, 32)),
+        queue_age_thresholds=_parse_thresholds_env("MYWIN_LOAD_QUEUE_AGE_THRESHOLDS", (5.0, 10.0, 20.0)),
+        exit_ratio=_parse_float_env("MYWIN_LOAD_EXIT_RATIO", 0.5),
+        min_dwell_seconds=_parse_float_env("MYWIN_LOAD_MIN_DWELL_SECONDS", 10.0),
+    )
+
+
+# picks a cheaper analysis mode under backlog; None when MYWIN_LOAD_SHEDDING_ENABLED is off
+load_shedder = _build_load_shedder()
+
+def _build_lane_dispatcher():
+    if not _parse_bool(os.environ.get("MYWIN_PRIORITY_LANES_ENABLED", "0")):
+        return None
+    return LaneDispatcher({
+        "delete": int(_parse_float_env("MYWIN_LANE_DELETE_CONCURRENCY", 8)),
+        "accept": int(_parse_float_env("MYWIN_LANE_ACCEPT_CONCURRENCY", 8)),
+        "analysis": int(_parse_float_env("MYWIN_LANE_ANALYSIS_CONCURRENCY", 2)),
+    })
+
+
+# per-lane concurrency budgets for submissions; None (inline processing) when
+# MYWIN_PRIORITY_LANES_ENABLED is off
+lane_dispatcher = _build_lane_dispatcher()
+
+def _build_loop_monitor():
+    if not _parse_bool(os.environ.get("MYWIN_LOOP_MONITOR_ENABLED", "0")):
+        return None
+    return LoopMonitor(
+        lag_threshold_seconds=_parse_float_env("MYWIN_LOOP_LAG_THRESHOLD_MS", 200.0) / 1000,
+        slow_threshold_seconds=_parse_float_env("MYWIN_SLOW_UPDATE_THRESHOLD_MS", 2000.0) / 1000,
+    )
+
+
+# event-loop lag / slow-update sampler; None when MYWIN_LOOP_MONITOR_ENABLED is off
+loop_monitor = _build_loop_monitor()
+
+def _build_cache_sync():
+    if not _parse_bool(os.environ.get("MYWIN_CACHE_SYNC_ENABLED", "0")):
+        return None, None, None
+    from mywin_cachesync import CacheSync, PostedFileIds, RecentHashIndex
+
+    cfg = load_mywin_quality_config()
+    hash_index = RecentHashIndex(
+        cfg.duplicate_lookback_days,
+        max_size=int(_parse_float_env("MYWIN_HASH_INDEX_MAX_SIZE", 200_000)),
+    )
+    posted = PostedFileIds(max_size=int(_parse_float_env("MYWIN_POSTED_CACHE_SIZE", 100_000)))
+    sync = CacheSync(
+        poll_interval_seconds=_parse_float_env("MYWIN_CACHE_SYNC_POLL_SECONDS", 1.0),
+        max_lag_seconds=_parse_float_env("MYWIN_CACHE_SYNC_MAX_LAG_SECONDS", 5.0),
+        seed_limit=hash_index.max_size,
+    )
+    sync.add(
+        mywin_image_hashes,
+        hash_index.add,
+        seed_query={
+            "created_at": {"$gte": datetime.now(timezone.utc) - timedelta(days=cfg.duplicate_lookback_days)},
+            "hash": {"$exists": True},
+        },
+        seed=hash_index.seed,
+    )
+    sync.add(mywin_posts, posted.add_post)
+    return sync, hash_index, posted
+
+
+# local views of mywin_image_hashes / mywin_posts kept current across
+# instances; all None when MYWIN_CACHE_SYNC_ENABLED is off
+cache_sync, hash_index, posted_file_ids = _build_cache_sync()
+
+# admins (cached per chat, persisted to admin_cache) and whitelisted uids skip image moderation
+admin_exemptions = AdminExemptions(
+    admin_cache,
+    ttl_seconds=_parse_float_env("MYWIN_ADMIN_CACHE_TTL_SECONDS", 600.0),
+    whitelist={int(uid) for uid in os.environ.get("MYWIN_EXEMPT_USER_IDS", "").split(",") if uid.strip()},
+)
+
+
+reanalysis_queue = ReanalysisQueue(
+    mywin_reanalysis_queue,
+    max_attempts=int(_parse_float_env("MYWIN_REANALYSIS_MAX_ATTEMPTS", 5)),
+    retry_delay_seconds=_parse_float_env("MYWIN_REANALYSIS_RETRY_DELAY_SECONDS", 60.0),
+)
+
+settle_scheduler = SettleScheduler(job_leases, job_checkpoints, job_runs)
+XP_WRITER_HEARTBEAT_SECONDS = 30.0
+
+SETTLE_JOBS = [
+    SettleJob(
+        name="settle_xp_snapshots",
+        collection=xp_events,
+        process_batch=functools.partial(settle_xp_snapshots, xp_snapshots),
+        interval_seconds=_parse_float_env("MYWIN_SETTLE_XP_SNAPSHOTS_SECONDS", 300.0),
+    ),
+]
+
+
 def _run_settle_jobs():
-    for name in (
-        "settle_pending_referrals_with_cache_clear",
-        "settle_referral_snapshots_with_cache_clear",
-        "settle_xp_snapshots_with_cache_clear",
-    ):
-        func = globals().get(name)
-        if callable(func):
-            func()
+    """Run one bounded, checkpointed pass of every settle job (under its lease)."""
+    return [settle_scheduler.run_once(job) for job in SETTLE_JOBS]
 
 
 def _is_playback_duplicate_error(exc: DuplicateKeyError) -> bool:
@@ -311,6 +690,201 @@ async def _send_playback_button(message, playback_url):
         )
 
 
+def _has_image(message):
+    return bool(
+        message.photo
+        or (message.document and message.document.mime_type and message.document.mime_type.startswith("image"))
+    )
+
+
+def _unique_file_id(message):
+    if message.photo:
+        return message.photo[-1].file_unique_id  # highest quality photo
+    if message.document:
+        return message.document.file_unique_id
+    return None
+
+
+def _media_file_id(message):
+    return message.photo[-1].file_id if message.photo else message.document.file_id
+
+
+async def _delete_all(messages):
+    for message in messages:
+        await message.delete()
+
+
+async def _analyze_message_image(context, message, cfg, mode="full"):
+    if mode == "metadata_only":
+        return _declared_metrics(message)
+    return await _download_and_analyze(context.bot, _media_file_id(message), cfg, hash_only=mode == "hash_only")
+
+
+async def _download_and_analyze(bot, media_file_id, cfg, hash_only=False):
+    telegram_file = await bot.get_file(media_file_id)
+    with _span("telegram.download_file"):
+        image_file = await download_bounded(telegram_file, cfg.max_download_bytes)
+    with image_file, _span("analyze_image"):
+        return await asyncio.to_thread(
+            analyze_mywin_image,
+            image_file,
+            max_pixels=cfg.max_image_pixels,
+            hash_only=hash_only,
+        )
+
+
+def _declared_metrics(message):
+    """Metrics from what Telegram reports about the file, without downloading it."""
+    if message.photo:
+        photo = message.photo[-1]
+        width, height, file_size = photo.width, photo.height, photo.file_size
+    else:
+        width = height = None
+        file_size = message.document.file_size
+    return MyWinImageMetrics(
+        width=width,
+        height=height,
+        file_size=file_size,
+        blur_score=None,
+        blank_stddev=None,
+        saturation_mean=None,
+        image_hash=None,
+    )
+
+
+def _analysis_mode(message):
+    if load_shedder is None:
+        return "full"
+    # during catch-up message.date measures the downtime, not the bot's backlog
+    if message.date is not None and _catchup_writes is None:
+        load_shedder.observe_queue_age((datetime.now(timezone.utc) - message.date).total_seconds())
+    return load_shedder.select_mode()
+
+
+def _find_duplicates(image_hashes, cfg, chat_id, user_id):
+    """Near-duplicate flags for ``image_hashes``, from the synced local index when it is current."""
+    if (
+        hash_index is not None
+        and cache_sync.is_fresh()
+        and hash_index.covers(cfg.duplicate_lookback_days)
+    ):
+        return hash_index.find_near(
+            image_hashes,
+            cfg.duplicate_hamming_threshold,
+            cfg.duplicate_lookback_days,
+            scope=cfg.duplicate_scope,
+            chat_id=chat_id,
+            user_id=user_id,
+        )
+    return find_near_duplicate_hashes(
+        mywin_image_hashes,
+        image_hashes,
+        cfg.duplicate_hamming_threshold,
+        cfg.duplicate_lookback_days,
+        scope=cfg.duplicate_scope,
+        chat_id=chat_id,
+        user_id=user_id,
+    )
+
+
+def _store_hash(user_id, message_id, image_hash, decision, chat_id, metrics=None, duplicate_match=None):
+    record = store_hash_record(
+        mywin_image_hashes,
+        user_id,
+        message_id,
+        image_hash,
+        decision,
+        chat_id=chat_id,
+        metrics=metrics,
+        duplicate_match=duplicate_match,
+    )
+    if hash_index is not None:
+        # visible to this instance's next check without waiting for the change stream
+        hash_index.add(record)
+
+
+async def _quality_decisions(context, messages, cfg, mode="full"):
+    """Download and analyze every image in parallel.
+
+    Returns ({message_id: PASS|IGNORE|REJECT}, failed messages). All hashes
+    are checked against mywin_image_hashes with one candidate query.
+    Analysis failures pass (reason=analysis_error) and are returned so they
+    can be queued for re-analysis; oversized images are rejected. ``mode`` is
+    a load-shedding mode other than "defer": hash_only skips the pixel
+    metrics, metadata_only skips the download and the duplicate check.
+    """
+    decisions = {}
+    failed = []
+    analyzed = []
+    with load_shedder.track() if load_shedder is not None else contextlib.nullcontext():
+        results = await asyncio.gather(
+            *(_analyze_message_image(context, m, cfg, mode) for m in messages),
+            return_exceptions=True,
+        )
+    for message, result in zip(messages, results):
+        if isinstance(result, ImageTooLarge):
+            logging.info(
+                "[MYWIN][QUALITY] decision=REJECT reason=%s user_id=%s size=%s limit=%s",
+                result.reason,
+                message.from_user.id,
+                result.size,
+                result.limit,
+            )
+            decisions[message.message_id] = "REJECT"
+        elif isinstance(result, Exception):
+            logging.error(
+                "[MYWIN][QUALITY] decision=PASS reason=analysis_error user_id=%s err=%s",
+                message.from_user.id,
+                result,
+                exc_info=result,
+            )
+            decisions[message.message_id] = "PASS"
+            failed.append(message)
+        else:
+            analyzed.append((message, result))
+    if not analyzed:
+        return decisions, failed
+    if mode == "metadata_only":
+        for message, metrics in analyzed:
+            decision = decide_mywin_image_quality(metrics, False, cfg)
+            log_mywin_quality(message.from_user.id, decision)
+            decisions[message.message_id] = decision.decision
+        return decisions, failed
+
+    first = analyzed[0][0]
+    try:
+        duplicate_matches = _find_duplicates(
+            [metrics.image_hash for _, metrics in analyzed],
+            cfg,
+            chat_id=first.chat_id,
+            user_id=first.from_user.id,
+        )
+        for (message, metrics), duplicate_match in zip(analyzed, duplicate_matches):
+            decision = decide_mywin_image_quality(metrics, duplicate_match, cfg)
+            log_mywin_quality(message.from_user.id, decision)
+            _store_hash(
+                message.from_user.id,
+                message.message_id,
+                metrics.image_hash,
+                decision.decision,
+                chat_id=message.chat_id,
+                metrics=metrics,
+                duplicate_match=duplicate_match,
+            )
+            decisions[message.message_id] = decision.decision
+    except Exception as exc:
+        logging.exception(
+            "[MYWIN][QUALITY] decision=PASS reason=analysis_error user_id=%s err=%s",
+            first.from_user.id,
+            exc,
+        )
+        for message, _ in analyzed:
+            if message.message_id not in decisions:
+                decisions[message.message_id] = "PASS"
+                failed.append(message)
+    return decisions, failed
+
+
 # ----------------------------
 # MyWin / ComebackIsReal Media Handler
 # ----------------------------
@@ -318,95 +892,233 @@ async def filter_mywin_media(update: Update, context: ContextTypes.DEFAULT_TYPE)
     message = update.message
     if not message:
         return
+    # tasks spawned below (album flush, lanes) copy the update id with the context
+    token = update_id_var.set(update.update_id)
+    try:
+        if message.media_group_id:
+            # album: collect the other items first, then moderate them as one unit
+            media_group_buffer.add((message.chat_id, message.media_group_id), message, context)
+            return
+
+        await _dispatch_submission([message], context)
+    finally:
+        update_id_var.reset(token)
+
+
+def _submission_lane(messages):
+    """Classify a submission by the work it needs: delete, accept or analysis."""
+    message = next((m for m in messages if m.caption), messages[0])
+    parsed = parse_mywin_caption(message.caption or "")
+    if not (parsed and _has_image(message) and _unique_file_id(message)):
+        return "delete"
+    if parsed["tag"] == "mywin" and load_mywin_quality_config().enabled:
+        return "analysis"
+    return "accept"
+
+
+async def _dispatch_submission(messages, context):
+    if lane_dispatcher is None:
+        await process_submission(messages, context)
+        return
+    lane_dispatcher.submit(_submission_lane(messages), process_submission, messages, context)
 
-    caption_raw = message.caption or ""  # keep original case/lines for parsing
 
-    # detect if it has image
-    has_image = bool(
-        message.photo
-        or (message.document and message.document.mime_type and message.document.mime_type.startswith("image"))
-    )
+def _stage(name):
+    """Mark the stage the current update is in (loop monitor sampling, trace stage spans)."""
+    if loop_monitor is not None:
+        loop_monitor.mark_stage(name)
+    if tracer is not None:
+        tracer.mark_stage(name)
+
+
+def _span(name):
+    return tracer.span(name) if tracer is not None else contextlib.nullcontext()
 
-    # extract unique file id
-    file_id = None
-    if message.photo:
-        file_id = message.photo[-1].file_unique_id  # highest quality photo
-    elif message.document:
-        file_id = message.document.file_unique_id
+
+async def process_submission(messages, context):
+    """Moderate one submission: a single message or every message of an album.
+
+    The captioned message is the submission (it gets the post record, XP and
+    event); other album images are kept only if they individually pass.
+    """
+    with contextlib.ExitStack() as stack:
+        if loop_monitor is not None:
+            stack.enter_context(loop_monitor.track_update(update_id_var.get()))
+        if tracer is not None:
+            stack.enter_context(tracer.trace(
+                "mywin.submission",
+                update_id=update_id_var.get(),
+                chat_id=messages[0].chat_id,
+                user_id=messages[0].from_user.id,
+                album_size=len(messages),
+            ))
+        await _moderate_submission(messages, context)
+
+
+async def _moderate_submission(messages, context):
+    _stage("parse")
+    message = next((m for m in messages if m.caption), messages[0])
+    caption_raw = message.caption or ""  # keep original case/lines for parsing
 
     # validate caption against accepted formats
     parsed = parse_mywin_caption(caption_raw)
-    if not (has_image and file_id and parsed):
+    file_id = _unique_file_id(message)
+    if not (_has_image(message) and file_id and parsed):
         # delete anything else
-        await message.delete()
+        await _delete_all(messages)
         return
+    extras = [m for m in messages if m is not message]
+    non_images = [m for m in extras if not (_has_image(m) and _unique_file_id(m))]
+    if non_images:
+        await _delete_all(non_images)
+        extras = [m for m in extras if m not in non_images]
+
+    _stage("wait_for_db")
+    await _wait_for_db()
+
+    # rate limiting runs before any download or analysis
+    _stage("rate_limit")
+    if submission_limiter is not None:
+        # charged at the time the user posted, so a replayed backlog keeps its original spacing
+        limited, retry_after = submission_limiter.check(
+            message.from_user.id, message.date or datetime.now(timezone.utc)
+        )
+        if limited:
+            logging.info(
+                "[MYWIN_MODERATION] reason=rate_limited user_id=%s retry_after_s=%.1f",
+                message.from_user.id,
+                retry_after,
+            )
+            await _delete_all([message] + extras)
+            return
 
     tag = parsed["tag"]                       # "mywin" or "comebackisreal"
-    game_name = parsed["game_name"]            # preserve user's casing, or None
-    playback_url = parsed["playback_url"]
-    playback_id = parsed["playback_id"]
-    submission_format = parsed["submission_format"]
     quality_decision = "PASS"
+    analysis_mode = "full"
+    reanalyze = {}  # message_id -> why its hot-path analysis is incomplete
 
     if tag == "mywin":
+        _stage("quality")
         cfg = load_mywin_quality_config()
-        if cfg.enabled:
-            try:
-                media_file_id = message.photo[-1].file_id if message.photo else message.document.file_id
-                telegram_file = await context.bot.get_file(media_file_id)
-                image_bytes = bytes(await telegram_file.download_as_bytearray())
-                metrics = analyze_mywin_image(image_bytes)
-                duplicate_match = is_near_duplicate_hash(
-                    mywin_image_hashes,
-                    metrics.image_hash,
-                    cfg.duplicate_hamming_threshold,
-                    cfg.duplicate_lookback_days,
+        if cfg.enabled and await admin_exemptions.is_exempt(context.bot, message.chat_id, message.from_user.id):
+            logging.info(
+                "[MYWIN][QUALITY] decision=PASS reason=exempt user_id=%s chat_id=%s",
+                message.from_user.id,
+                message.chat_id,
+            )
+        elif cfg.enabled:
+            analysis_mode = _analysis_mode(message)
+            if analysis_mode == "defer":
+                logging.info(
+                    "[MYWIN][QUALITY] decision=IGNORE reason=deferred user_id=%s chat_id=%s",
+                    message.from_user.id,
+                    message.chat_id,
                 )
-                decision = decide_mywin_image_quality(metrics, duplicate_match, cfg)
-                quality_decision = decision.decision
-                log_mywin_quality(message.from_user.id, decision)
+                quality_decision = "IGNORE"
+            else:
+                decisions, failed = await _quality_decisions(context, [message] + extras, cfg, analysis_mode)
+                reanalyze = {m.message_id: "analysis_error" for m in failed}
+                quality_decision = decisions[message.message_id]
                 if quality_decision == "REJECT":
-                    store_hash_record(
-                        mywin_image_hashes,
-                        message.from_user.id,
-                        message.message_id,
-                        metrics.image_hash,
-                        quality_decision,
-                    )
-                    await message.delete()
+                    # the captioned image carries the submission; without it the album goes
+                    await _delete_all([message] + extras)
                     return
-                store_hash_record(
-                    mywin_image_hashes,
-                    message.from_user.id,
-                    message.message_id,
-                    metrics.image_hash,
-                    quality_decision,
-                )
-            except Exception as exc:
-                logging.exception(
-                    "[MYWIN][QUALITY] decision=PASS reason=analysis_error user_id=%s err=%s",
-                    message.from_user.id,
-                    exc,
-                )
+                rejected = [m for m in extras if decisions[m.message_id] == "REJECT"]
+                if rejected:
+                    await _delete_all(rejected)
+                    extras = [m for m in extras if m not in rejected]
+            if analysis_mode != "full":
+                for m in [message] + extras:
+                    reanalyze.setdefault(m.message_id, analysis_mode)
 
     # early playback-id lookup for a faster rejection (final enforcement is the
-    # unique partial index on mywin_posts.playback_id, see below)
+    # unique partial index on mywin_posts.playback_id, see _record_submission)
+    _stage("dedup")
+    playback_id = parsed["playback_id"]
     if playback_id and mywin_posts.find_one({"playback_id": playback_id}):
-        await _reject_duplicate_playback_link(message, playback_id, playback_url)
+        await _reject_duplicate_playback_link(message, playback_id, parsed["playback_url"])
+        await _delete_all(extras)
         return
 
-    # check duplicate by file_id
-    if mywin_posts.find_one({"file_id": file_id}):
-        await message.delete()
+    # check duplicates by file_id, one query for the whole album
+    extra_file_ids = [_unique_file_id(m) for m in extras]
+    posted = _already_posted_file_ids([file_id] + extra_file_ids)
+    if file_id in posted:
+        await _delete_all([message] + extras)
         return
+    reposted = [m for m in extras if _unique_file_id(m) in posted]
+    if reposted:
+        await _delete_all(reposted)
+        extras = [m for m in extras if m not in reposted]
+
+    _stage("record")
+    await _record_submission(message, parsed, file_id, quality_decision, extras, analysis_mode, reanalyze)
+
+
+media_group_buffer = MediaGroupBuffer(
+    _parse_float_env("MYWIN_ALBUM_WINDOW_SECONDS", 1.0),
+    _dispatch_submission,
+)
+
+
+def _already_posted_file_ids(file_ids):
+    if posted_file_ids is not None and posted_file_ids.contains_all(file_ids):
+        return set(file_ids)
+    # an image counts as posted whether it was a post's captioned image or an album extra
+    posted = set()
+    query = {"$or": [{"file_id": {"$in": file_ids}}, {"album_file_ids": {"$in": file_ids}}]}
+    for doc in mywin_posts.find(query, {"file_id": 1, "album_file_ids": 1}):
+        posted.add(doc.get("file_id"))
+        posted.update(doc.get("album_file_ids") or [])
+    return posted & set(file_ids)
+
+
+def _enqueue_reanalysis(messages, primary, post_file_id, reasons):
+    """Queue images whose hot-path analysis was skipped or failed for a full analysis.
+
+    ``reasons`` maps message_id to the load-shedding mode or "analysis_error".
+    ``post_file_id`` links each item back to the mywin_posts record the later
+    decision applies to; only the ``primary`` (captioned) image carries XP.
+    """
+    items = [
+        {
+            "chat_id": m.chat_id,
+            "message_id": m.message_id,
+            "user_id": m.from_user.id,
+            "file_id": _media_file_id(m),
+            "file_unique_id": _unique_file_id(m),
+            "post_file_id": post_file_id,
+            "primary": m is primary,
+            "reason": reasons[m.message_id],
+        }
+        for m in messages
+    ]
+    try:
+        reanalysis_queue.enqueue(items)
+    except Exception:
+        logging.exception("[MYWIN][REANALYSIS] enqueue_failed post_file_id=%s items=%s", post_file_id, len(items))
+        return
+    logging.info("[MYWIN][REANALYSIS] enqueued post_file_id=%s items=%s", post_file_id, len(items))
+
+
+async def _record_submission(message, parsed, file_id, quality_decision, extras=(), analysis_mode="full", reanalyze=None):
+    tag = parsed["tag"]
+    game_name = parsed["game_name"]            # preserve user's casing, or None
+    game_key = parsed["game_key"]              # case/whitespace-folded game_name, or None
+    playback_url = parsed["playback_url"]
+    playback_id = parsed["playback_id"]
+    submission_format = parsed["submission_format"]
 
     # insert record
     now = datetime.now(timezone.utc)
     post_doc = {
         "file_id": file_id,
+        # the downloadable id (file_id above is the unique id): offline backfills fetch by it
+        "media_file_id": _media_file_id(message),
         "user_id": message.from_user.id,
         "tag": tag,
         "game_name": game_name,
+        "game_key": game_key,
         "submission_format": submission_format,
         "quality_decision": quality_decision,
         "ts": now,
@@ -415,34 +1127,49 @@ async def filter_mywin_media(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if playback_id:
         post_doc["playback_url"] = playback_url
         post_doc["playback_id"] = playback_id
+    if message.media_group_id:
+        post_doc["media_group_id"] = message.media_group_id
+        post_doc["album_file_ids"] = [_unique_file_id(m) for m in extras]
+    if analysis_mode != "full":
+        post_doc["analysis_mode"] = analysis_mode
 
     try:
         mywin_posts.insert_one(post_doc)
+        if posted_file_ids is not None:
+            posted_file_ids.add_post(post_doc)
     except DuplicateKeyError as exc:
         if playback_id and _is_playback_duplicate_error(exc):
             await _reject_duplicate_playback_link(message, playback_id, playback_url)
         else:
             await message.delete()
+        await _delete_all(extras)
         return
 
-    member_result = members.update_one(
-        {"uid": message.from_user.id},
-        {
-            "$setOnInsert": {
-                "uid": message.from_user.id,
-                "level": 1,
-                "role": "member",
-                "affiliate_status": "none",
-                "kpi": {
-                    "mywin": 0,
-                    "cbir": 0,
-                },
-            }
-        },
-        upsert=True,
-    )
-    if member_result.upserted_id is not None:
-        logging.info("member_upsert=1 uid=%s", message.from_user.id)
+    if reanalyze:
+        queued = [m for m in (message, *extras) if m.message_id in reanalyze]
+        if queued:
+            _enqueue_reanalysis(queued, message, file_id, reanalyze)
+
+    if not known_members.check(message.from_user.id):
+        member_result = members.update_one(
+            {"uid": message.from_user.id},
+            {
+                "$setOnInsert": {
+                    "uid": message.from_user.id,
+                    "level": 1,
+                    "role": "member",
+                    "affiliate_status": "none",
+                    "kpi": {
+                        "mywin": 0,
+                        "cbir": 0,
+                    },
+                }
+            },
+            upsert=True,
+        )
+        known_members.add(message.from_user.id)
+        if member_result.upserted_id is not None:
+            logging.info("member_upsert=1 uid=%s", message.from_user.id)
 
     if quality_decision == "PASS":
         reason = "mywin_submission" if tag == "mywin" else "comeback_submission"
@@ -457,51 +1184,224 @@ async def filter_mywin_media(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 "file_id": file_id,
                 "tag": tag,
                 "game_name": game_name,
+                "game_key": game_key,
                 "playback_url": playback_url,
                 "playback_id": playback_id,
                 "submission_format": submission_format,
             },
         }
+        _insert_unique(
+            xp_events,
+            xp_event,
+            functools.partial(xp_totals_buffer.record, message.from_user.id, xp_event["xp"], reason),
+        )
+
+        event_doc = _mywin_valid_event(
+            message.from_user.id,
+            message.chat_id,
+            message.message_id,
+            now,
+            tag=tag,
+            game_name=game_name,
+            game_key=game_key,
+            playback_url=playback_url,
+            playback_id=playback_id,
+            submission_format=submission_format,
+        )
+        _insert_unique(
+            events,
+            event_doc,
+            functools.partial(_valid_event_written, event_doc),
+            functools.partial(_valid_event_dedup, event_doc),
+        )
+
+        if playback_url:
+            await _send_playback_button(message, playback_url)
+
+
+def _mywin_valid_event(uid, chat_id, message_id, now, **meta):
+    """The MYWIN_VALID event of an accepted submission; ``meta`` holds tag, game and playback fields."""
+    return {
+        "type": "MYWIN_VALID",
+        "uid": uid,
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "ts": now,
+        "tags": ["mywin"] if meta["tag"] == "mywin" else ["cbir"],
+        "meta": meta,
+    }
+
+
+def _valid_event_written(event_doc, stats_ts=None):
+    meta = event_doc["meta"]
+    game_stats_buffer.record(meta["game_key"], meta["game_name"], meta["tag"], stats_ts or event_doc["ts"])
+    logging.info(
+        "event_written=1 type=%s uid=%s chat_id=%s message_id=%s",
+        event_doc["type"],
+        event_doc["uid"],
+        event_doc["chat_id"],
+        event_doc["message_id"],
+    )
+
+
+def _valid_event_dedup(event_doc):
+    logging.info(
+        "event_dedup=1 type=%s uid=%s chat_id=%s message_id=%s",
+        event_doc["type"],
+        event_doc["uid"],
+        event_doc["chat_id"],
+        event_doc["message_id"],
+    )
+
+def _insert_unique(collection, doc, on_inserted, on_duplicate=None):
+    """insert_one with DuplicateKeyError as "already recorded"; batched while catching up."""
+    if _catchup_writes is not None:
+        _catchup_writes.add(collection, doc, on_inserted, on_duplicate)
+        return
+    try:
+        collection.insert_one(doc)
+    except DuplicateKeyError:
+        if on_duplicate is not None:
+            on_duplicate()
+        return
+    on_inserted()
+
+
+async def _reanalyze_item(bot, item):
+    """Run the full analysis on one queued image and apply its decision retroactively.
+
+    A rejected image is deleted from the chat. For the captioned image the
+    outcome matches the hot path: a rejected post's record is deleted (its
+    file and playback ids are free again) and XP it got is reversed; a
+    deferred post that now passes gets the XP, the MYWIN_VALID event and the
+    game_stats count it was held back. Returns the outcome for the queue.
+    """
+    post = await asyncio.to_thread(mywin_posts.find_one, {"file_id": item["post_file_id"]})
+    if post is None:
+        return "post_missing"
+    cfg = load_mywin_quality_config()
+    try:
+        metrics = await _download_and_analyze(bot, item["file_id"], cfg)
+    except ImageTooLarge as exc:
+        decision, reason = "REJECT", exc.reason
+    else:
+        # hash_only already ran the duplicate check and stored this hash
+        duplicate_match = False
+        if item["reason"] != "hash_only":
+            duplicate_match = (await asyncio.to_thread(
+                find_near_duplicate_hashes,
+                mywin_image_hashes,
+                [metrics.image_hash],
+                cfg.duplicate_hamming_threshold,
+                cfg.duplicate_lookback_days,
+                scope=cfg.duplicate_scope,
+                chat_id=item["chat_id"],
+                user_id=item["user_id"],
+            ))[0]
+        result = decide_mywin_image_quality(metrics, duplicate_match, cfg)
+        log_mywin_quality(item["user_id"], result)
+        decision, reason = result.decision, result.reason
+        if item["reason"] != "hash_only":
+            await asyncio.to_thread(
+                store_hash_record,
+                mywin_image_hashes,
+                item["user_id"],
+                item["message_id"],
+                metrics.image_hash,
+                decision,
+                chat_id=item["chat_id"],
+                metrics=metrics,
+                duplicate_match=duplicate_match,
+            )
+
+    if decision == "REJECT":
         try:
-            xp_events.insert_one(xp_event)
-        except DuplicateKeyError:
-            pass
-
-        event_doc = {
-            "type": "MYWIN_VALID",
-            "uid": message.from_user.id,
-            "chat_id": message.chat_id,
-            "message_id": message.message_id,
-            "ts": now,
-            "tags": ["mywin"] if tag == "mywin" else ["cbir"],
+            await bot.delete_message(item["chat_id"], item["message_id"])
+        except BadRequest as exc:
+            logging.info("[MYWIN][REANALYSIS] delete_skipped id=%s err=%s", item["_id"], exc)
+    if item["primary"]:
+        await asyncio.to_thread(_apply_reanalysis_decision, post, decision, reason, item)
+    elif decision == "REJECT":
+        await asyncio.to_thread(
+            mywin_posts.update_one,
+            {"_id": post["_id"]},
+            {"$pull": {"album_file_ids": item["file_unique_id"]}},
+        )
+    logging.info(
+        "[MYWIN][REANALYSIS] applied id=%s queued_reason=%s decision=%s reason=%s previous=%s",
+        item["_id"], item["reason"], decision, reason, post.get("quality_decision") if item["primary"] else "-",
+    )
+    return f"{decision}:{reason}"
+
+
+def _apply_reanalysis_decision(post, decision, reason, item):
+    now = datetime.now(timezone.utc)
+    if decision == "REJECT":
+        # a hot-path REJECT is never recorded; don't keep the ids reserved
+        mywin_posts.delete_one({"_id": post["_id"]})
+        if posted_file_ids is not None:
+            posted_file_ids.discard_post(post)
+    else:
+        mywin_posts.update_one(
+            {"_id": post["_id"]},
+            {"$set": {"quality_decision": decision, "reanalysis_reason": reason, "reanalyzed_at": now}},
+        )
+    awarded = post.get("quality_decision") == "PASS"
+    if awarded == (decision == "PASS"):
+        return
+    file_id = post["file_id"]
+    if awarded:
+        original = xp_events.find_one({"user_id": post["user_id"], "unique_key": f"mywin:{file_id}"}) or {}
+        xp_event = {
+            "user_id": post["user_id"],
+            "xp": -(original.get("xp") or 20),
+            "reason": "mywin_quality_reversal",
+            "unique_key": f"mywin_reversal:{file_id}",
+            "meta": {"file_id": file_id, "decision": decision, "reason": reason},
+        }
+    else:
+        xp_event = {
+            "user_id": post["user_id"],
+            "xp": 20,
+            "reason": "mywin_submission",
+            "unique_key": f"mywin:{file_id}",
             "meta": {
-                "tag": tag,
-                "game_name": game_name,
-                "playback_url": playback_url,
-                "playback_id": playback_id,
-                "submission_format": submission_format,
+                "file_id": file_id,
+                "tag": post.get("tag"),
+                "game_name": post.get("game_name"),
+                "game_key": post.get("game_key"),
+                "playback_url": post.get("playback_url"),
+                "playback_id": post.get("playback_id"),
+                "submission_format": post.get("submission_format"),
+                "reanalyzed": True,
             },
         }
-        try:
-            events.insert_one(event_doc)
-            logging.info(
-                "event_written=1 type=%s uid=%s chat_id=%s message_id=%s",
-                event_doc["type"],
-                event_doc["uid"],
-                event_doc["chat_id"],
-                event_doc["message_id"],
-            )
-        except DuplicateKeyError:
-            logging.info(
-                "event_dedup=1 type=%s uid=%s chat_id=%s message_id=%s",
-                event_doc["type"],
-                event_doc["uid"],
-                event_doc["chat_id"],
-                event_doc["message_id"],
-            )
+    xp_event["ts"] = xp_event["created_at"] = now
+    try:
+        xp_events.insert_one(xp_event)
+        xp_totals_buffer.record(post["user_id"], xp_event["xp"], xp_event["reason"])
+    except DuplicateKeyError:
+        pass
+    if awarded:
+        return
+
+    event_doc = _mywin_valid_event(
+        post["user_id"],
+        item["chat_id"],
+        item["message_id"],
+        now,
+        **{field: post.get(field) for field in (
+            "tag", "game_name", "game_key", "playback_url", "playback_id", "submission_format",
+        )},
+    )
+    try:
+        events.insert_one(event_doc)
+    except DuplicateKeyError:
+        _valid_event_dedup(event_doc)
+    else:
+        # counted in the period the submission was made
+        _valid_event_written(event_doc, stats_ts=post.get("created_at"))
 
-        if playback_url:
-            await _send_playback_button(message, playback_url)
 
 # ----------------------------
 # Run Bot
@@ -517,34 +1417,460 @@ async def _telegram_error_handler(update, context):
         context.error,
     )
 
-def main():
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(message)s"
-    )
+@contextlib.contextmanager
+def _boot_phase(name):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        logging.info("[BOOT] phase=%s duration_ms=%d", name, (time.monotonic() - started) * 1000)
 
+
+async def _wait_for_db():
+    gate = _db_ready
+    if gate is None or gate.is_set():
+        return
+    started = time.monotonic()
+    await gate.wait()
+    logging.info("[BOOT] db_gate_released waited_ms=%d", (time.monotonic() - started) * 1000)
+
+
+async def _prepare_db(boot_started, retry_delay=1.0):
+    """Warm the Mongo connection and run index maintenance, then open the gate.
+
+    Connection and server-selection errors are retried with capped backoff
+    instead of crashing: updates that need no DB (invalid captions) keep being
+    handled while Mongo is unreachable. Any other failure (e.g. an index
+    conflict) would fail the same way on every retry, so it is logged as an
+    error and the gate is opened without the missing indexes.
+    """
+    delay = retry_delay
+    while True:
+        try:
+            with _boot_phase("mongo_ping"):
+                await asyncio.to_thread(client.admin.command, "ping")
+            with _boot_phase("ensure_indexes"):
+                await asyncio.to_thread(ensure_indexes)
+            break
+        except ConnectionFailure:
+            logging.exception("[BOOT] db_prepare_failed retry_in_s=%.0f", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+        except Exception:
+            logging.exception("[BOOT] db_prepare_failed_permanently opening_gate_without_indexes")
+            break
+    _db_ready.set()
+    logging.info("[BOOT] DB_READY since_boot_ms=%d", (time.monotonic() - boot_started) * 1000)
+
+
+def _spawn_background(coro):
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _start_background_db(boot_started):
+    global _db_ready
+    _db_ready = asyncio.Event()
+    _spawn_background(_prepare_db(boot_started))
+
+
+async def _checkpoint_rate_limits():
+    if submission_limiter is None or submission_limiter.seed is None:
+        return
+    try:
+        await asyncio.to_thread(submission_limiter.checkpoint, members)
+    except Exception:
+        logging.exception("[MYWIN][RATE_LIMIT] checkpoint_failed")
+
+
+async def _heartbeat_xp_writer():
+    # lets --reconcile-xp-totals --apply see that increments may still be buffered
+    try:
+        await asyncio.to_thread(
+            heartbeat_xp_writer, job_leases, settle_scheduler.owner, 3 * XP_WRITER_HEARTBEAT_SECONDS
+        )
+    except Exception:
+        logging.exception("[MYWIN][XP_TOTALS] heartbeat_failed")
+
+
+async def _flush_xp_totals():
+    try:
+        await asyncio.to_thread(xp_totals_buffer.flush, xp_totals, members)
+    except Exception:
+        logging.exception("[MYWIN][XP_TOTALS] flush_failed")
+
+
+async def _flush_game_stats():
+    try:
+        await asyncio.to_thread(game_stats_buffer.flush, game_stats)
+    except Exception:
+        logging.exception("[MYWIN][GAME_STATS] flush_failed")
+
+
+async def _flush_traces():
+    try:
+        await asyncio.to_thread(tracer.exporter.flush)
+    except Exception:
+        logging.exception("[MYWIN][TRACE] flush_failed")
+
+
+async def _report_log_drops():
+    _queue_logging.report_drops()
+
+
+async def _log_pool_stats():
+    pool_waits.log_stats()
+
+
+async def _warm_up_pools(bot):
+    """Open a few connections in the Bot API and download pools before the first submission needs them."""
+    connections = int(_parse_float_env("MYWIN_POOL_WARMUP_CONNECTIONS", 4))
+    if connections <= 0:
+        return
+    started = time.monotonic()
+    results = await asyncio.gather(*(bot.get_me() for _ in range(connections)), return_exceptions=True)
+    api_ok = sum(1 for result in results if not isinstance(result, Exception))
+    download_ok = 0
+    file_url = urllib.parse.urlsplit(bot.base_file_url)
+    if file_url.scheme in ("http", "https"):
+        download_ok = await warm_up_downloads(f"{file_url.scheme}://{file_url.netloc}/", connections)
     logging.info(
-        "[BOOT] MYWIN_VERSION=2026-07-02-network-debug-v1"
+        "[POOLS] warmup api_connections=%d download_connections=%d of=%d elapsed_ms=%d",
+        api_ok, download_ok, connections, (time.monotonic() - started) * 1000,
     )
 
-    ensure_indexes()
 
-    app_bot = (
-        ApplicationBuilder()
-        .token(BOT_TOKEN)
-        .build()
-    )
+async def _log_cache_sync_stats():
+    cache_sync.log_stats()
 
-    logging.info(
-        "[BOOT] BOT_TOKEN_PRESENT=%s",
-        bool(BOT_TOKEN),
+
+async def _log_lane_stats():
+    lane_dispatcher.log_stats()
+
+
+async def _drain_reanalysis(bot):
+    # re-analysis is extra load; wait while the hot path is shedding
+    if load_shedder is not None and load_shedder.mode != "full":
+        return
+    await _wait_for_db()
+    try:
+        await reanalysis_queue.drain(
+            functools.partial(_reanalyze_item, bot),
+            concurrency=int(_parse_float_env("MYWIN_REANALYSIS_CONCURRENCY", 2)),
+        )
+    except Exception:
+        logging.exception("[MYWIN][REANALYSIS] drain_failed")
+
+
+async def _flush_catchup_writes(final=False):
+    # album flushes and lanes still hold submissions of the batch; an album
+    # still inside its window may continue in the next batch, so it is only
+    # forced out by the final flush
+    if final:
+        await media_group_buffer.drain()
+    else:
+        await media_group_buffer.wait_flushing()
+    if lane_dispatcher is not None:
+        await lane_dispatcher.drain()
+    pending = len(_catchup_writes)
+    try:
+        _catchup_writes.flush()
+    except Exception:
+        logging.exception("[CATCHUP] flush_failed pending=%s kept=%s", pending, len(_catchup_writes))
+
+
+async def _catch_up(application):
+    """Process the updates that queued up while the bot was down, then let polling take over."""
+    global _catchup_writes
+    _catchup_writes = InsertBatcher()
+    try:
+        await drain_pending_updates(
+            application.bot,
+            application.process_update,
+            batch_size=int(_parse_float_env("MYWIN_CATCHUP_BATCH_SIZE", MAX_GET_UPDATES_LIMIT)),
+            concurrency=int(_parse_float_env("MYWIN_CATCHUP_CONCURRENCY", 16)),
+            max_seconds=_parse_float_env("MYWIN_CATCHUP_MAX_SECONDS", 300.0),
+            after_batch=_flush_catchup_writes,
+        )
+    except Exception:
+        logging.exception("[CATCHUP] failed; remaining updates are left to polling")
+    finally:
+        await _flush_catchup_writes(final=True)
+        # a failed flush keeps its inserts; retry before writes go direct again
+        for delay in (1.0, 2.0, 4.0, 8.0):
+            if not len(_catchup_writes):
+                break
+            await asyncio.sleep(delay)
+            await _flush_catchup_writes(final=True)
+        if len(_catchup_writes):
+            logging.error("[CATCHUP] writes_dropped pending=%s", len(_catchup_writes))
+        logging.info("[CATCHUP] writes %s", _catchup_writes.stats())
+        _catchup_writes = None
+
+
+async def _run_settle_job(job):
+    await _wait_for_db()
+    await asyncio.to_thread(settle_scheduler.run_once, job)
+
+
+async def _run_periodically(interval_seconds, job):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await job()
+
+
+async def _preload_image_analysis():
+    with _boot_phase("preload_image_analysis"):
+        await asyncio.to_thread(preload_image_analysis)
+
+
+def _parse_importtime(stderr_text):
+    """Parse ``python -X importtime`` output into (module, self_us, cumulative_us) rows."""
+    rows = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = (p.strip() for p in parts)
+        if not self_us.isdigit():
+            continue  # header row
+        rows.append((name, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def _profile_startup(top=25):
+    """Import ``main`` in a fresh interpreter with -X importtime and print the costliest modules."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=False,
     )
+    rows = _parse_importtime(result.stderr)
+    total_us = sum(self_us for _, self_us, _ in rows)
+    print(f"{'cumulative_ms':>14} {'self_ms':>9}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name.strip()}")
+    print(f"total_import_ms={total_us / 1000:.1f} modules={len(rows)} "
+          f"img_filter_enabled={load_mywin_quality_config().enabled}")
+
+
+async def _backfill_image_metrics(args):
+    # CLI-only: keeps multiprocessing and the process pool out of the bot's startup
+    from mywin_backfill import bot_fetcher, run_backfill
+
+    urls = {}
+    if args.bot_api_url:
+        urls["base_url"] = args.bot_api_url
+    if args.bot_file_url:
+        urls["base_file_url"] = args.bot_file_url
+    cfg = load_mywin_quality_config()
+    async with Bot(BOT_TOKEN, **urls) as bot:
+        return await run_backfill(
+            mywin_posts,
+            job_checkpoints,
+            bot_fetcher(bot, cfg.max_download_bytes),
+            name=args.backfill_name,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            processes=args.processes,
+            max_pixels=cfg.max_image_pixels,
+            limit=args.limit,
+        )
 
-    logging.info(
-        "[BOOT] MONGO_PRESENT=%s",
-        bool(MONGO_URL),
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MyWin moderation bot")
+    parser.add_argument(
+        "--prune-image-hashes",
+        action="store_true",
+        help="delete mywin_image_hashes records past the retention window in batches, then exit",
     )
+    parser.add_argument(
+        "--reconcile-xp-totals",
+        action="store_true",
+        help="rebuild xp_totals and members.kpi from xp_events and report drift, then exit",
+    )
+    parser.add_argument("--run-settle-jobs", action="store_true", help="run one pass of every settle job, then exit")
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="with --reconcile-xp-totals, overwrite drifting documents; refused while a bot is running, "
+        "since its unflushed XP increments would be counted twice",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000, help="records/users per batch for offline jobs")
+    parser.add_argument(
+        "--backfill-image-metrics",
+        action="store_true",
+        help="recompute image metrics for mywin_posts (resumable, checkpointed), then exit",
+    )
+    parser.add_argument(
+        "--backfill-name",
+        default="backfill_image_metrics",
+        help="job_checkpoints key of the backfill run; a new name starts over",
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="with --backfill-image-metrics, downloads in flight")
+    parser.add_argument("--processes", type=int, default=None, help="with --backfill-image-metrics, analysis processes")
+    parser.add_argument("--limit", type=int, default=None, help="with --backfill-image-metrics, stop after this many posts")
+    parser.add_argument("--bot-api-url", default=None, help="Bot API base URL (e.g. a local stub), token appended")
+    parser.add_argument("--bot-file-url", default=None, help="Bot API file base URL, token appended")
+    parser.add_argument(
+        "--what-if",
+        metavar="FIELD=VALUE,...",
+        default=None,
+        help="replay stored quality decisions with these config overrides (e.g. reject_blur_threshold=60), "
+        "report how they would change, then exit",
+    )
+    parser.add_argument("--since-days", type=int, default=None, help="with --what-if, only records this recent")
+    parser.add_argument(
+        "--what-if-source",
+        choices=("hashes", "posts"),
+        default="hashes",
+        help="with --what-if, replay mywin_image_hashes records or backfilled mywin_posts",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print per-module import cost of a cold 'import main', then exit",
+    )
+    return parser.parse_args(argv)
+
+
+def _install_logging():
+    global _queue_logging
+    # records are enqueued on the calling thread and written by a listener
+    # thread, so a slow stdout never stalls update processing
+    _queue_logging = QueueLogging(
+        level=logging.INFO,
+        json_format=_parse_bool(os.environ.get("MYWIN_LOG_JSON", "0")),
+        queue_size=int(_parse_float_env("MYWIN_LOG_QUEUE_SIZE", 10000)),
+        sample_rates=parse_sample_rates(os.environ.get("MYWIN_LOG_SAMPLE_RATES", "")),
+    ).install()
+    # runs before logging's own atexit shutdown: drains what is still queued
+    atexit.register(_queue_logging.stop)
+
+
+async def _post_init(application, boot_started, catch_up=False):
+    # index maintenance runs concurrently with polling; only handlers that
+    # reach Mongo wait on the readiness gate
+    _start_background_db(boot_started)
+    if loop_monitor is not None:
+        loop_monitor.start()
+    if load_mywin_quality_config().enabled:
+        _spawn_background(_preload_image_analysis())
+    if submission_limiter is not None and submission_limiter.seed is not None:
+        _spawn_background(_run_periodically(
+            _parse_float_env("MYWIN_RATE_LIMIT_CHECKPOINT_SECONDS", 30.0),
+            _checkpoint_rate_limits,
+        ))
+    _spawn_background(_run_periodically(_parse_float_env("MYWIN_XP_FLUSH_SECONDS", 5.0), _flush_xp_totals))
+    _spawn_background(_heartbeat_xp_writer())
+    _spawn_background(_run_periodically(XP_WRITER_HEARTBEAT_SECONDS, _heartbeat_xp_writer))
+    _spawn_background(_run_periodically(_parse_float_env("MYWIN_GAME_STATS_FLUSH_SECONDS", 10.0), _flush_game_stats))
+    if _queue_logging is not None:
+        _spawn_background(_run_periodically(60.0, _report_log_drops))
+    if tracer is not None:
+        _spawn_background(_run_periodically(_parse_float_env("MYWIN_TRACE_FLUSH_SECONDS", 5.0), _flush_traces))
+    _spawn_background(_warm_up_pools(application.bot))
+    _spawn_background(_run_periodically(_parse_float_env("MYWIN_POOL_STATS_SECONDS", 60.0), _log_pool_stats))
+    if cache_sync is not None:
+        cache_sync.start(asyncio.get_running_loop())
+        _spawn_background(_run_periodically(
+            _parse_float_env("MYWIN_CACHE_SYNC_STATS_SECONDS", 60.0),
+            _log_cache_sync_stats,
+        ))
+    if lane_dispatcher is not None:
+        _spawn_background(_run_periodically(
+            _parse_float_env("MYWIN_LANE_STATS_SECONDS", 60.0),
+            _log_lane_stats,
+        ))
+    if _parse_bool(os.environ.get("MYWIN_REANALYSIS_ENABLED", "1")):
+        _spawn_background(_run_periodically(
+            _parse_float_env("MYWIN_REANALYSIS_INTERVAL_SECONDS", 30.0),
+            functools.partial(_drain_reanalysis, application.bot),
+        ))
+    if _parse_bool(os.environ.get("MYWIN_SETTLE_JOBS_ENABLED", "1")):
+        # leased in Mongo: with several workers only one runs each job at a time
+        for job in SETTLE_JOBS:
+            _spawn_background(_run_periodically(job.interval_seconds, functools.partial(_run_settle_job, job)))
+    if catch_up:
+        await _catch_up(application)
+    logging.info("[BOOT] READY_FOR_UPDATES since_boot_ms=%d", (time.monotonic() - boot_started) * 1000)
+
+
+async def _post_shutdown(_application):
+    # moderate albums still inside their window, then flush state
+    # accumulated since the last periodic write
+    await media_group_buffer.drain()
+    if loop_monitor is not None:
+        loop_monitor.stop()
+        logging.info("[LOOPMON] stats %s", loop_monitor.stats())
+    if lane_dispatcher is not None:
+        await lane_dispatcher.drain()
+        lane_dispatcher.log_stats()
+    if load_shedder is not None:
+        logging.info("[MYWIN][LOAD] stats %s", load_shedder.stats())
+    if cache_sync is not None:
+        cache_sync.stop()
+        cache_sync.log_stats()
+    await _checkpoint_rate_limits()
+    await _flush_xp_totals()
+    try:
+        await asyncio.to_thread(release_xp_writer, job_leases, settle_scheduler.owner)
+    except Exception:
+        logging.exception("[MYWIN][XP_TOTALS] heartbeat_release_failed")
+    await _flush_game_stats()
+    pool_waits.log_stats()
+    if tracer is not None:
+        await _flush_traces()
+        logging.info("[MYWIN][TRACE] stats %s", tracer.stats())
+    if _queue_logging is not None:
+        logging.info("[LOGGING] stats %s", _queue_logging.stats())
+
+
+def _build_application(post_init=None, post_shutdown=None, updater=True):
+    with _boot_phase("build_application"):
+        builder = ApplicationBuilder().token(BOT_TOKEN)
+        if post_init is not None:
+            builder = builder.post_init(post_init)
+        if post_shutdown is not None:
+            builder = builder.post_shutdown(post_shutdown)
+        if not updater:
+            # worker processes receive updates from the ingress, never poll
+            builder = builder.updater(None)
+        # Bot API calls and getUpdates long polls get separate pools, so a
+        # pending poll never holds a connection a delete or reply needs
+        builder = builder.request(_telegram_request(
+            "telegram_api",
+            int(_parse_float_env("MYWIN_TG_API_POOL_SIZE", 64)),
+            pool_timeout=_parse_float_env("MYWIN_TG_API_POOL_TIMEOUT", 5.0),
+        ))
+        if updater:
+            builder = builder.get_updates_request(_telegram_request(
+                "telegram_get_updates",
+                1,
+                read_timeout=30,
+                write_timeout=30,
+                connect_timeout=30,
+                pool_timeout=30,
+            ))
+        return builder.build()
+
+
+def _telegram_request(pool_name, pool_size, **timeouts):
+    if tracer is not None:
+        return TracingHTTPXRequest(
+            tracer, pool_name=pool_name, wait_stats=pool_waits, connection_pool_size=pool_size, **timeouts
+        )
+    return PooledHTTPXRequest(pool_name=pool_name, wait_stats=pool_waits, connection_pool_size=pool_size, **timeouts)
 
+
+def _add_handlers(app_bot):
     # (Optional but recommended) only process photos or image documents to reduce noise:
     img_filter = (filters.PHOTO | filters.Document.IMAGE)
     app_bot.add_handler(MessageHandler(img_filter, filter_mywin_media))
@@ -559,18 +1885,167 @@ def main():
         "[BOOT] ERROR_HANDLER_REGISTERED"
     )
 
+
+# ----------------------------
+# Multi-process mode (MYWIN_WORKERS > 1): the ingress polls and fans updates
+# out to worker processes, which run the handlers
+# ----------------------------
+async def _fan_out(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from mywin_workers import shard_key
+
+    await context.bot_data["worker_pool"].dispatch(shard_key(update), update.to_dict())
+
+
+async def _log_worker_stats(pool):
+    pool.log_stats()
+
+
+async def _post_init_ingress(application, boot_started, pool, catch_up=False):
+    application.bot_data["worker_pool"] = pool
+    pool.start()
+    if _queue_logging is not None:
+        _spawn_background(_run_periodically(60.0, _report_log_drops))
+    _spawn_background(_run_periodically(
+        _parse_float_env("MYWIN_WORKER_STATS_SECONDS", 60.0),
+        functools.partial(_log_worker_stats, pool),
+    ))
+    if catch_up:
+        # the backlog is fanned out like live updates; workers write unbatched
+        await drain_pending_updates(
+            application.bot,
+            application.process_update,
+            concurrency=1,
+            max_seconds=_parse_float_env("MYWIN_CATCHUP_MAX_SECONDS", 300.0),
+        )
+    logging.info("[BOOT] READY_FOR_UPDATES since_boot_ms=%d", (time.monotonic() - boot_started) * 1000)
+
+
+async def _post_shutdown_ingress(application):
+    pool = application.bot_data["worker_pool"]
+    # workers finish their queues, run their own shutdown flush and exit
+    await asyncio.to_thread(pool.stop, _parse_float_env("MYWIN_WORKER_STOP_SECONDS", 30.0))
+    pool.log_stats()
+
+
+def _run_worker(index, work_queue, processed):
+    """Entry point of a worker process (spawned: module state is its own)."""
+    _install_logging()
+    logging.info("[WORKERS] worker_started index=%d pid=%d", index, os.getpid())
+    asyncio.run(_serve_worker(index, work_queue, processed))
+
+
+async def _serve_worker(index, work_queue, processed):
+    from mywin_workers import consume
+
+    boot_started = time.monotonic()
+    app_bot = _build_application(updater=False)
+    _add_handlers(app_bot)
+    async with app_bot:
+        await _post_init(app_bot, boot_started)
+        try:
+            await consume(
+                work_queue,
+                lambda data: app_bot.process_update(Update.de_json(data, app_bot.bot)),
+                processed,
+            )
+        finally:
+            await _post_shutdown(app_bot)
+    logging.info("[WORKERS] worker_stopped index=%d processed=%d", index, processed.value)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    _install_logging()
+
+    if args.profile_startup:
+        _profile_startup()
+        return
+
+    if args.run_settle_jobs:
+        _run_settle_jobs()
+        return
+
+    if args.reconcile_xp_totals:
+        writers = active_xp_writers(job_leases) if args.apply else []
+        if writers:
+            logging.error("[MYWIN][XP_TOTALS] reconcile_refused running_writers=%s; stop the bot first", writers)
+            sys.exit(2)
+        reconcile_xp_totals(xp_events, xp_totals, members, chunk_size=args.batch_size, apply=args.apply)
+        return
+
+    if args.backfill_image_metrics:
+        asyncio.run(_backfill_image_metrics(args))
+        return
+
+    if args.what_if is not None:
+        from mywin_whatif import apply_config_overrides, evaluate_quality_config, format_report as format_whatif_report
+
+        candidate = apply_config_overrides(load_mywin_quality_config(), args.what_if)
+        report = evaluate_quality_config(
+            mywin_posts if args.what_if_source == "posts" else mywin_image_hashes,
+            candidate,
+            since_days=args.since_days,
+            batch_size=args.batch_size,
+            source=args.what_if_source,
+        )
+        print(format_whatif_report(report))
+        return
+
+    if args.prune_image_hashes:
+        prune_image_hashes(
+            mywin_image_hashes,
+            hash_retention_days(load_mywin_quality_config()),
+            batch_size=args.batch_size,
+        )
+        return
+
+    boot_started = time.monotonic()
+    # drain the backlog queued while the bot was down instead of dropping it
+    catch_up = _parse_bool(os.environ.get("MYWIN_CATCHUP_ENABLED", "0"))
+    workers = int(_parse_float_env("MYWIN_WORKERS", 1))
+    logging.info(
+        "[BOOT] MYWIN_VERSION=2026-07-02-network-debug-v1"
+    )
+
+    if workers > 1:
+        from mywin_workers import WorkerPool
+
+        pool = WorkerPool(workers, _run_worker, queue_size=int(_parse_float_env("MYWIN_WORKER_QUEUE_SIZE", 1000)))
+        app_bot = _build_application(
+            functools.partial(_post_init_ingress, boot_started=boot_started, pool=pool, catch_up=catch_up),
+            _post_shutdown_ingress,
+        )
+        app_bot.add_handler(TypeHandler(Update, _fan_out))
+        app_bot.add_error_handler(_telegram_error_handler)
+    else:
+        app_bot = _build_application(
+            functools.partial(_post_init, boot_started=boot_started, catch_up=catch_up),
+            _post_shutdown,
+        )
+
+    logging.info(
+        "[BOOT] BOT_TOKEN_PRESENT=%s",
+        bool(BOT_TOKEN),
+    )
+
+    logging.info(
+        "[BOOT] MONGO_PRESENT=%s",
+        bool(MONGO_URL),
+    )
+
+    if workers <= 1:
+        _add_handlers(app_bot)
+
     logging.info(
-        "[BOOT] STARTING_POLLING"
+        "[BOOT] STARTING_POLLING workers=%d",
+        workers,
     )
 
+    # getUpdates timeouts are set on its own request object (_build_application)
     app_bot.run_polling(
         poll_interval=5,
         timeout=30,
-        read_timeout=30,
-        write_timeout=30,
-        connect_timeout=30,
-        pool_timeout=30,
-        drop_pending_updates=True,
+        drop_pending_updates=not catch_up,
     )
 
 if __name__ == "__main__":
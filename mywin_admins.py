@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+
+class AdminExemptions:
+    """Decides whether a user skips image moderation: whitelisted or a chat admin.
+
+    Admin lists are held in memory per chat and refreshed via
+    ``get_chat_administrators`` at most once per ``ttl_seconds``; a per-chat
+    lock keeps concurrent submissions from stampeding the API. Fetched lists
+    are persisted to ``admin_cache`` so a restarted bot reuses a fresh list
+    instead of calling Telegram again. A failed fetch falls back to the last
+    known list (or none) until the next TTL expiry.
+    """
+
+    def __init__(self, collection, ttl_seconds: float = 600.0, whitelist=()):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.whitelist = frozenset(whitelist)
+        self._admins = {}
+        self._locks = {}
+        self.fetches = 0
+
+    async def is_exempt(self, bot, chat_id, user_id) -> bool:
+        if user_id in self.whitelist:
+            return True
+        return user_id in await self.admin_ids(bot, chat_id)
+
+    async def admin_ids(self, bot, chat_id) -> frozenset:
+        cached = self._admins.get(chat_id)
+        if cached and time.monotonic() - cached[1] < self.ttl_seconds:
+            return cached[0]
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            cached = self._admins.get(chat_id)
+            if cached and time.monotonic() - cached[1] < self.ttl_seconds:
+                return cached[0]
+            # the persisted copy is only useful on a cold start; once this
+            # process has its own entry, that entry is at least as fresh
+            persisted = self._load_persisted(chat_id) if cached is None else None
+            if persisted is not None:
+                admin_ids, age_seconds = persisted
+                # keep the persisted fetch time so the TTL is not restarted
+                self._admins[chat_id] = (admin_ids, time.monotonic() - age_seconds)
+                return admin_ids
+            admin_ids = await self._fetch(bot, chat_id, stale=cached[0] if cached else frozenset())
+            self._admins[chat_id] = (admin_ids, time.monotonic())
+            return admin_ids
+
+    def _load_persisted(self, chat_id):
+        """Return (admin_ids, age_seconds) from admin_cache if still within the TTL."""
+        now = datetime.now(timezone.utc)
+        fresh_after = now - timedelta(seconds=self.ttl_seconds)
+        try:
+            doc = self.collection.find_one({"_id": chat_id, "fetched_at": {"$gte": fresh_after}})
+        except Exception:
+            logging.exception("[MYWIN_ADMINS] admin_cache read failed chat_id=%s", chat_id)
+            return None
+        if doc is None:
+            return None
+        fetched_at = doc["fetched_at"]
+        if fetched_at.tzinfo is None:
+            fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+        return frozenset(doc.get("admin_ids") or ()), max(0.0, (now - fetched_at).total_seconds())
+
+    async def _fetch(self, bot, chat_id, stale):
+        try:
+            admins = await bot.get_chat_administrators(chat_id)
+        except Exception as exc:
+            logging.warning("[MYWIN_ADMINS] fetch failed chat_id=%s err=%s using_stale=%s", chat_id, exc, len(stale))
+            return stale
+        self.fetches += 1
+        admin_ids = frozenset(member.user.id for member in admins)
+        try:
+            self.collection.update_one(
+                {"_id": chat_id},
+                {"$set": {"admin_ids": sorted(admin_ids), "fetched_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+        except Exception:
+            logging.exception("[MYWIN_ADMINS] admin_cache write failed chat_id=%s", chat_id)
+        logging.info("[MYWIN_ADMINS] refreshed chat_id=%s admins=%s", chat_id, len(admin_ids))
+        return admin_ids
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+
+# Telegram albums hold at most 10 items; a full album is flushed immediately.
+MAX_ALBUM_SIZE = 10
+
+
+class MediaGroupBuffer:
+    """Collects album (media_group_id) messages and hands each album over as one unit.
+
+    The first message of an album opens a window of ``window_seconds``; every
+    message of the same album arriving within it is buffered, then
+    ``on_flush(messages, context)`` is awaited once from a background task.
+    :meth:`add` never blocks, so sequential update processing keeps receiving
+    the rest of the album while the window is open.
+    """
+
+    def __init__(self, window_seconds: float, on_flush):
+        self.window_seconds = window_seconds
+        self.on_flush = on_flush
+        self._groups = {}
+        self._tasks = set()
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def add(self, key, message, context) -> None:
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = {"messages": [], "context": context}
+            group["timer"] = self._spawn(self._flush_later(key))
+        group["messages"].append(message)
+        if len(group["messages"]) >= MAX_ALBUM_SIZE:
+            self._spawn(self._flush(key))
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_later(self, key):
+        await asyncio.sleep(self.window_seconds)
+        await self._flush(key)
+
+    async def _flush(self, key):
+        group = self._groups.pop(key, None)
+        if group is None:
+            return  # already flushed (full album)
+        if group["timer"] is not asyncio.current_task():
+            group["timer"].cancel()
+        messages = sorted(group["messages"], key=lambda m: m.message_id)
+        try:
+            await self.on_flush(messages, group["context"])
+        except Exception:
+            logging.exception("[MYWIN_ALBUM] failed key=%s size=%s", key, len(messages))
+
+    async def wait_flushing(self) -> None:
+        """Wait for albums already being handed over; albums whose window is still open stay buffered."""
+        while True:
+            open_timers = {group["timer"] for group in self._groups.values()}
+            flushing = [task for task in self._tasks if task not in open_timers]
+            if not flushing:
+                return
+            await asyncio.gather(*flushing, return_exceptions=True)
+
+    async def drain(self) -> None:
+        """Flush every open album now and wait for in-flight flushes (shutdown, tests)."""
+        for key in list(self._groups):
+            self._spawn(self._flush(key))
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
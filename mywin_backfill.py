@@ -0,0 +1,158 @@
+"""Offline recomputation of image hashes and metrics for historical posts.
+
+:func:`run_backfill` walks ``mywin_posts`` in ``_id`` order, ``batch_size``
+posts at a time, starting after the ``_id`` stored in its checkpoint. For
+each batch it downloads the files by Telegram file id with at most
+``concurrency`` downloads in flight, runs :func:`analyze_mywin_image` in a
+process pool (it is CPU-bound), and writes the results back with one
+unordered ``bulk_write``. The checkpoint advances only after a batch is
+written, so an interrupted run resumes at the first unwritten batch and at
+worst recomputes one batch. Progress (rate, ETA) is logged per batch.
+
+Results use the hash records' storage format (``compact_metrics`` in
+``image_metrics``, the hash in ``image_hash``), so ``mywin_whatif`` can
+replay threshold changes over backfilled posts as well.
+
+Only posts recorded with ``media_file_id`` can be backfilled; older posts
+stored only the unique file id, which Telegram cannot download.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from mywin_download import download_bounded
+from mywin_quality import analyze_mywin_image, compact_metrics
+
+
+def _analyze_bytes(data: bytes, max_pixels: int = None):
+    """Process-pool entry point; errors come back as strings (not every exception pickles)."""
+    try:
+        metrics = analyze_mywin_image(io.BytesIO(data), max_pixels=max_pixels)
+        return {"image_metrics": compact_metrics(metrics), "image_hash": metrics.image_hash}, None
+    except Exception as exc:
+        return None, f"{type(exc).__name__}: {exc}"
+
+
+def bot_fetcher(bot, max_bytes: int):
+    """``fetch(file_id) -> bytes`` through the Bot API (getFile, then the file download)."""
+
+    async def fetch(file_id):
+        telegram_file = await bot.get_file(file_id)
+        with await download_bounded(telegram_file, max_bytes) as buf:
+            return buf.read()
+
+    return fetch
+
+
+class _Progress:
+    def __init__(self, total, clock):
+        self.total = total
+        self.clock = clock
+        self.started = clock()
+        self.done = 0
+        self.failed = 0
+
+    def snapshot(self) -> dict:
+        elapsed = max(self.clock() - self.started, 1e-9)
+        rate = self.done / elapsed
+        remaining = max(self.total - self.done, 0)
+        return {
+            "done": self.done,
+            "failed": self.failed,
+            "total": self.total,
+            "elapsed_s": round(elapsed, 1),
+            "posts_per_s": round(rate, 2),
+            "eta_s": round(remaining / rate) if rate > 0 else None,
+        }
+
+
+async def run_backfill(
+    posts,
+    checkpoints,
+    fetch,
+    name: str = "backfill_image_metrics",
+    batch_size: int = 200,
+    concurrency: int = 16,
+    processes: int = None,
+    max_pixels: int = None,
+    limit: int = None,
+    executor=None,
+    clock=time.monotonic,
+) -> dict:
+    """Backfill ``image_metrics`` and ``image_hash`` on posts; returns the final progress snapshot."""
+    checkpoint = await asyncio.to_thread(checkpoints.find_one, {"_id": name}) or {}
+    last_id = checkpoint.get("high_water_mark")
+    query = {"media_file_id": {"$exists": True}}
+    if last_id is not None:
+        query["_id"] = {"$gt": last_id}
+    total = await asyncio.to_thread(posts.count_documents, query)
+    if limit is not None:
+        total = min(total, limit)
+    progress = _Progress(total, clock)
+    logging.info("[BACKFILL] started name=%s resume_after=%s total=%d", name, last_id, total)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def _process(post):
+        try:
+            async with semaphore:
+                data = await fetch(post["media_file_id"])
+        except Exception as exc:
+            return post["_id"], None, f"download: {type(exc).__name__}: {exc}"
+        fields, error = await loop.run_in_executor(executor, _analyze_bytes, data, max_pixels)
+        return post["_id"], fields, error
+
+    try:
+        while limit is None or progress.done < limit:
+            size = batch_size if limit is None else min(batch_size, limit - progress.done)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = await asyncio.to_thread(
+                lambda: list(posts.find(query, {"media_file_id": 1}).sort("_id", 1).limit(size))
+            )
+            if not batch:
+                break
+            results = await asyncio.gather(*(_process(post) for post in batch))
+            now = datetime.now(timezone.utc)
+            ops = []
+            for post_id, fields, error in results:
+                if error is not None:
+                    progress.failed += 1
+                    logging.warning("[BACKFILL] failed post_id=%s err=%s", post_id, error)
+                    ops.append(UpdateOne({"_id": post_id}, {"$set": {"image_metrics_error": error, "image_metrics_at": now}}))
+                else:
+                    ops.append(UpdateOne(
+                        {"_id": post_id},
+                        {"$set": {**fields, "image_metrics_at": now}, "$unset": {"image_metrics_error": ""}},
+                    ))
+            await asyncio.to_thread(posts.bulk_write, ops, ordered=False)
+            last_id = batch[-1]["_id"]
+            progress.done += len(batch)
+            await asyncio.to_thread(
+                checkpoints.update_one,
+                {"_id": name},
+                {"$set": {"high_water_mark": last_id, "updated_at": now}, "$inc": {"processed": len(batch)}},
+                upsert=True,
+            )
+            snapshot = progress.snapshot()
+            logging.info(
+                "[BACKFILL] batch=%d done=%d/%d failed=%d posts_per_s=%.2f eta_s=%s",
+                len(batch), snapshot["done"], snapshot["total"], snapshot["failed"],
+                snapshot["posts_per_s"], snapshot["eta_s"],
+            )
+    finally:
+        if own_executor:
+            executor.shutdown()
+    snapshot = progress.snapshot()
+    logging.info("[BACKFILL] finished name=%s %s", name, snapshot)
+    return snapshot
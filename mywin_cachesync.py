@@ -0,0 +1,314 @@
+"""Keep in-process caches in step with writes made by other instances.
+
+:class:`CacheSync` tails inserts on Mongo collections and hands every new
+document to an ``apply`` callback on the event loop, so the local structures
+are only ever touched from the loop thread. On a replica set it uses a change
+stream (``insert`` events, resumed with the last resume token after an
+error); on a standalone server, where change streams are unavailable, it
+polls ``_id`` ranges instead, re-reading a short overlap because ObjectIds
+generated on different hosts are not inserted in strict ``_id`` order.
+
+Sync lag (commit time of the change, or ObjectId time when polling, to the
+moment it is applied) is sampled per collection. :meth:`CacheSync.is_fresh`
+tells callers whether the local view can currently stand in for a query:
+every tail is connected and neither the last lag sample nor the time since
+the last successful read exceeds ``max_lag_seconds``.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from mywin_quality import match_near_duplicates
+
+# server error codes meaning "change streams are not supported here"
+_CHANGE_STREAM_UNSUPPORTED = {40573, 40324}
+
+
+class RecentHashIndex:
+    """In-memory copy of recent ``mywin_image_hashes`` records for the duplicate check.
+
+    Answers :meth:`find_near` exactly like ``find_near_duplicate_hashes``
+    does against Mongo, as long as it holds every record of the lookback
+    window: :meth:`covers` is False until :meth:`seed` ran, and for windows
+    reaching back past a record evicted by ``max_size``.
+    """
+
+    def __init__(self, lookback_days: float, max_size: int = 200_000):
+        self.lookback = timedelta(days=lookback_days)
+        self.max_size = max_size
+        self._entries = deque()
+        self._ids = set()
+        self.seeded = False
+        self.evicted_until = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def seed(self, docs) -> None:
+        for doc in docs:
+            self.add(doc)
+        self.seeded = True
+
+    def add(self, doc) -> None:
+        doc_id = doc.get("_id")
+        if not doc.get("hash") or (doc_id is not None and doc_id in self._ids):
+            return
+        created_at = _aware(doc.get("created_at")) or datetime.now(timezone.utc)
+        self._entries.append((created_at, doc_id, doc["hash"], doc.get("chat_id"), doc.get("user_id")))
+        if doc_id is not None:
+            self._ids.add(doc_id)
+        self._prune(datetime.now(timezone.utc))
+
+    def _prune(self, now) -> None:
+        horizon = now - self.lookback
+        while self._entries and (self._entries[0][0] < horizon or len(self._entries) > self.max_size):
+            created_at, doc_id, *_ = self._entries.popleft()
+            self._ids.discard(doc_id)
+            if created_at >= horizon:
+                self.evicted_until = max(self.evicted_until or created_at, created_at)
+
+    def covers(self, lookback_days: float, now: datetime = None) -> bool:
+        now = now or datetime.now(timezone.utc)
+        if not self.seeded or timedelta(days=lookback_days) > self.lookback:
+            return False
+        return self.evicted_until is None or self.evicted_until < now - timedelta(days=lookback_days)
+
+    def find_near(
+        self,
+        image_hashes: list,
+        threshold: int,
+        lookback_days: float,
+        scope: str = "global",
+        chat_id: int = None,
+        user_id: int = None,
+    ) -> list:
+        lookback_start = datetime.now(timezone.utc) - timedelta(days=lookback_days)
+        candidates = (
+            existing_hash
+            for created_at, _, existing_hash, entry_chat_id, entry_user_id in reversed(self._entries)
+            if created_at >= lookback_start
+            and not (scope == "chat" and entry_chat_id != chat_id)
+            and not (scope == "user" and entry_user_id != user_id)
+        )
+        return match_near_duplicates(image_hashes, candidates, threshold)[0]
+
+
+class PostedFileIds:
+    """Bounded LRU of file ids known to be posted (post ``file_id`` and ``album_file_ids``).
+
+    Positive knowledge only: a hit means "already posted"; a miss still has
+    to ask Mongo.
+    """
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add_post(self, doc) -> None:
+        for file_id in [doc.get("file_id"), *(doc.get("album_file_ids") or [])]:
+            if not file_id:
+                continue
+            self._ids[file_id] = True
+            self._ids.move_to_end(file_id)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def discard_post(self, doc) -> None:
+        """Forget a post's file ids (its record was deleted on this instance)."""
+        for file_id in [doc.get("file_id"), *(doc.get("album_file_ids") or [])]:
+            self._ids.pop(file_id, None)
+
+    def contains_all(self, file_ids) -> bool:
+        return all(file_id in self._ids for file_id in file_ids)
+
+
+class _Tail:
+    def __init__(self, collection, apply, seed_query, seed):
+        self.collection = collection
+        self.apply = apply
+        self.seed_query = seed_query
+        self.seed = seed
+        self.seeded = False
+        self.last_id = None
+        self.mode = "starting"
+        self.connected = False
+        self.applied = 0
+        self.errors = 0
+        self.last_read = None
+        self.last_lag = None
+        self.max_lag = 0.0
+        self.lags = deque(maxlen=1000)
+
+
+class CacheSync:
+    """Tails inserts on collections in daemon threads and applies them on the event loop."""
+
+    def __init__(
+        self,
+        poll_interval_seconds: float = 1.0,
+        max_lag_seconds: float = 5.0,
+        overlap_seconds: float = 5.0,
+        seed_limit: int = 200_000,
+    ):
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.overlap_seconds = overlap_seconds
+        self.seed_limit = seed_limit
+        self._tails = []
+        self._loop = None
+        self._stop = threading.Event()
+
+    def add(self, collection, apply, seed_query=None, seed=None) -> None:
+        """Tail inserts on ``collection``; ``seed(docs)`` first gets the docs matching ``seed_query``."""
+        self._tails.append(_Tail(collection, apply, seed_query, seed))
+
+    def start(self, loop) -> None:
+        self._loop = loop
+        for tail in self._tails:
+            threading.Thread(
+                target=self._run, args=(tail,), name=f"mywin-cachesync-{tail.collection.name}", daemon=True
+            ).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self, tail):
+        resume_token = None
+        while not self._stop.is_set():
+            try:
+                if tail.mode == "polling":
+                    self._poll(tail)
+                else:
+                    resume_token = self._watch(tail, resume_token)
+            except OperationFailure as exc:
+                if exc.code in _CHANGE_STREAM_UNSUPPORTED and tail.mode != "polling":
+                    logging.info("[CACHESYNC] change_streams_unavailable collection=%s; polling", tail.collection.name)
+                    tail.mode = "polling"
+                    continue
+                self._failed(tail, exc)
+            except PyMongoError as exc:
+                self._failed(tail, exc)
+
+    def _failed(self, tail, exc):
+        tail.connected = False
+        tail.errors += 1
+        logging.warning("[CACHESYNC] tail_error collection=%s mode=%s err=%s", tail.collection.name, tail.mode, exc)
+        self._stop.wait(self.poll_interval_seconds)
+
+    def _seed(self, tail):
+        if tail.seed is None or tail.seeded:
+            return []
+        docs = list(tail.collection.find(tail.seed_query or {}).sort("_id", 1).limit(self.seed_limit))
+        tail.seeded = True
+        if len(docs) < self.seed_limit:
+            self._loop.call_soon_threadsafe(tail.seed, docs)
+        else:
+            # the window does not fit: leave the local view unseeded (Mongo stays authoritative)
+            logging.warning("[CACHESYNC] seed_truncated collection=%s limit=%d", tail.collection.name, self.seed_limit)
+        return docs
+
+    def _watch(self, tail, resume_token):
+        max_await_ms = int(self.poll_interval_seconds * 1000)
+        with tail.collection.watch(
+            [{"$match": {"operationType": "insert"}}],
+            resume_after=resume_token,
+            max_await_time_ms=max_await_ms,
+        ) as stream:
+            # opened before seeding, so nothing written in between is missed
+            tail.mode = "change_stream"
+            self._seed(tail)
+            tail.connected = True
+            while not self._stop.is_set():
+                change = stream.try_next()
+                tail.last_read = time.monotonic()
+                resume_token = stream.resume_token
+                if change is None:
+                    continue
+                written_at = change["clusterTime"].as_datetime() if "clusterTime" in change else None
+                self._deliver(tail, change["fullDocument"], written_at)
+        return resume_token
+
+    def _poll(self, tail):
+        docs = self._seed(tail)
+        last_id = max((doc["_id"] for doc in docs), default=tail.last_id)
+        if last_id is None:
+            last_id = ObjectId.from_datetime(datetime.now(timezone.utc))
+        seen = {doc["_id"] for doc in docs}
+        tail.connected = True
+        while not self._stop.is_set():
+            since = ObjectId.from_datetime(last_id.generation_time - timedelta(seconds=self.overlap_seconds))
+            seen = {doc_id for doc_id in seen if doc_id > since}
+            for doc in tail.collection.find({"_id": {"$gt": since}}).sort("_id", 1):
+                if doc["_id"] in seen:
+                    continue
+                seen.add(doc["_id"])
+                last_id = max(last_id, doc["_id"])
+                self._deliver(tail, doc, doc["_id"].generation_time)
+            tail.last_id = last_id
+            tail.last_read = time.monotonic()
+            self._stop.wait(self.poll_interval_seconds)
+
+    def _deliver(self, tail, doc, written_at):
+        self._loop.call_soon_threadsafe(self._apply, tail, doc, written_at)
+
+    def _apply(self, tail, doc, written_at):
+        try:
+            tail.apply(doc)
+        except Exception:
+            logging.exception("[CACHESYNC] apply_failed collection=%s", tail.collection.name)
+            return
+        tail.applied += 1
+        if written_at is not None:
+            lag = max(0.0, (datetime.now(timezone.utc) - written_at).total_seconds())
+            tail.last_lag = lag
+            tail.max_lag = max(tail.max_lag, lag)
+            tail.lags.append(lag)
+
+    def is_fresh(self) -> bool:
+        now = time.monotonic()
+        for tail in self._tails:
+            if not tail.connected or tail.last_read is None:
+                return False
+            if now - tail.last_read > self.max_lag_seconds + self.poll_interval_seconds:
+                return False
+            if tail.last_lag is not None and tail.last_lag > self.max_lag_seconds:
+                return False
+        return True
+
+    def stats(self) -> dict:
+        stats = {}
+        for tail in self._tails:
+            lags = sorted(tail.lags)
+            stats[tail.collection.name] = {
+                "mode": tail.mode,
+                "connected": tail.connected,
+                "applied": tail.applied,
+                "errors": tail.errors,
+                "lag_ms": round(tail.last_lag * 1000) if tail.last_lag is not None else None,
+                "lag_p95_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.95))] * 1000) if lags else None,
+                "max_lag_ms": round(tail.max_lag * 1000),
+            }
+        return stats
+
+    def log_stats(self) -> None:
+        for name, row in self.stats().items():
+            logging.info(
+                "[CACHESYNC] collection=%s mode=%s connected=%s applied=%d errors=%d lag_ms=%s lag_p95_ms=%s max_lag_ms=%d",
+                name, row["mode"], row["connected"], row["applied"], row["errors"],
+                row["lag_ms"], row["lag_p95_ms"], row["max_lag_ms"],
+            )
+
+
+def _aware(value):
+    # pymongo returns naive UTC datetimes unless the client is tz_aware
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+
+from pymongo.errors import BulkWriteError
+
+# Bot API upper bound for getUpdates(limit=...)
+MAX_GET_UPDATES_LIMIT = 100
+DUPLICATE_KEY_ERROR = 11000
+
+
+class InsertBatcher:
+    """Collects inserts and writes them per collection with one unordered ``insert_many``.
+
+    Each insert carries ``on_inserted`` / ``on_duplicate`` callbacks, run by
+    :meth:`flush` with the same meaning as a successful ``insert_one`` and a
+    ``DuplicateKeyError``: a duplicate does not stop the rest of the batch.
+    Any other failure (network, server selection) leaves the unwritten
+    inserts pending for the next flush and re-raises; docs the server did
+    write before the failure come back as duplicates on the retry.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self.inserted = 0
+        self.duplicates = 0
+        self.errors = 0
+
+    def __len__(self) -> int:
+        return sum(len(items) for _, items in self._pending.values())
+
+    def add(self, collection, doc, on_inserted=None, on_duplicate=None) -> None:
+        _, items = self._pending.setdefault(id(collection), (collection, []))
+        items.append((doc, on_inserted, on_duplicate))
+
+    def flush(self) -> int:
+        pending, self._pending = self._pending, {}
+        groups = list(pending.items())
+        written = 0
+        for position, (_, (collection, items)) in enumerate(groups):
+            try:
+                collection.insert_many([doc for doc, _, _ in items], ordered=False)
+                failed = {}
+            except BulkWriteError as exc:
+                failed = {error["index"]: error for error in exc.details.get("writeErrors", [])}
+            except Exception:
+                self._requeue(groups[position:])
+                raise
+            for index, (doc, on_inserted, on_duplicate) in enumerate(items):
+                error = failed.get(index)
+                if error is None:
+                    self.inserted += 1
+                    written += 1
+                    if on_inserted is not None:
+                        on_inserted()
+                elif error.get("code") == DUPLICATE_KEY_ERROR:
+                    self.duplicates += 1
+                    if on_duplicate is not None:
+                        on_duplicate()
+                else:
+                    self.errors += 1
+                    logging.error(
+                        "[CATCHUP] insert_failed collection=%s code=%s msg=%s",
+                        collection.name, error.get("code"), error.get("errmsg"),
+                    )
+        return written
+
+    def _requeue(self, groups) -> None:
+        for key, (collection, items) in groups:
+            _, newer = self._pending.pop(key, (collection, []))
+            self._pending[key] = (collection, items + newer)
+
+    def stats(self) -> dict:
+        return {"inserted": self.inserted, "duplicates": self.duplicates, "errors": self.errors}
+
+
+async def drain_pending_updates(
+    bot,
+    process_update,
+    batch_size: int = MAX_GET_UPDATES_LIMIT,
+    concurrency: int = 16,
+    max_seconds: float = 300.0,
+    after_batch=None,
+    clock=time.monotonic,
+) -> dict:
+    """Fetch the updates queued while the bot was down and process them before polling starts.
+
+    Updates are fetched in ``getUpdates`` batches of ``batch_size`` without
+    long polling; each batch is processed with up to ``concurrency`` updates
+    in flight, then ``after_batch()`` is awaited (flush batched writes). The
+    drain stops when the backlog is empty or after ``max_seconds``; the last
+    offset is confirmed so normal polling resumes right after the drained
+    updates and nothing is processed twice.
+    """
+    started = clock()
+    semaphore = asyncio.Semaphore(concurrency)
+    offset = None
+    drained = batches = 0
+    stop_reason = "empty"
+
+    async def _run(update):
+        async with semaphore:
+            await process_update(update)
+
+    logging.info("[CATCHUP] started batch_size=%d concurrency=%d", batch_size, concurrency)
+    while True:
+        if clock() - started > max_seconds:
+            stop_reason = "time_budget"
+            break
+        updates = await bot.get_updates(offset=offset, limit=batch_size, timeout=0)
+        if not updates:
+            break
+        offset = updates[-1].update_id + 1
+        await asyncio.gather(*(_run(update) for update in updates))
+        if after_batch is not None:
+            await after_batch()
+        drained += len(updates)
+        batches += 1
+        logging.info("[CATCHUP] batch=%d updates=%d drained=%d", batches, len(updates), drained)
+
+    if offset is not None:
+        # getUpdates confirms everything below the offset it is called with
+        await bot.get_updates(offset=offset, limit=1, timeout=0)
+    elapsed = clock() - started
+    result = {
+        "drained": drained,
+        "batches": batches,
+        "elapsed_ms": round(elapsed * 1000),
+        "updates_per_s": round(drained / elapsed, 1) if elapsed > 0 else 0.0,
+        "stopped": stop_reason,
+    }
+    logging.info(
+        "[CATCHUP] done drained=%d batches=%d elapsed_ms=%d updates_per_s=%.1f stopped=%s",
+        drained, batches, result["elapsed_ms"], result["updates_per_s"], stop_reason,
+    )
+    return result
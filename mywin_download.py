@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import re
+import tempfile
+
+import httpx
+
+from mywin_pools import PoolTimingTransport
+from mywin_quality import ImageTooLarge
+
+# Downloads up to this size stay in memory; larger ones roll over to a temp file.
+SPOOL_MAX_MEMORY_BYTES = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# file URLs embed the bot token: https://api.telegram.org/file/bot<TOKEN>/photos/...
+_TOKEN_IN_URL_RE = re.compile(r"/bot[^/]+/")
+
+_client = None
+_client_settings = {"pool_size": 32, "pool_timeout": 10.0, "wait_stats": None}
+
+
+class DownloadError(Exception):
+    """A failed file download; carries the status code and a token-free URL only.
+
+    httpx errors embed the file URL, which contains the bot token, and end up
+    in logs, trace spans and stored error fields.
+    """
+
+    def __init__(self, kind: str, url: str, status_code: int = None):
+        self.kind = kind
+        self.url = redact_token(url)
+        self.status_code = status_code
+        super().__init__(f"{kind} status={status_code} url={self.url}")
+
+
+def redact_token(url: str) -> str:
+    return _TOKEN_IN_URL_RE.sub("/bot<redacted>/", str(url))
+
+
+def configure_client(pool_size: int = 32, pool_timeout: float = 10.0, wait_stats=None) -> None:
+    """Size the shared download client's own pool (separate from Bot API calls); call before first use."""
+    global _client
+    _client_settings.update(pool_size=pool_size, pool_timeout=pool_timeout, wait_stats=wait_stats)
+    _client = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        limits = httpx.Limits(
+            max_connections=_client_settings["pool_size"],
+            max_keepalive_connections=_client_settings["pool_size"],
+        )
+        transport = (
+            PoolTimingTransport("telegram_download", _client_settings["wait_stats"], limits=limits)
+            if _client_settings["wait_stats"] is not None
+            else httpx.AsyncHTTPTransport(limits=limits)
+        )
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, pool=_client_settings["pool_timeout"]),
+            transport=transport,
+        )
+    return _client
+
+
+async def warm_up(url: str, connections: int) -> int:
+    """Open up to ``connections`` keep-alive connections to ``url``'s host; returns how many succeeded."""
+    client = _get_client()
+    results = await asyncio.gather(*(client.head(url) for _ in range(connections)), return_exceptions=True)
+    return sum(1 for result in results if not isinstance(result, Exception))
+
+
+async def download_bounded(telegram_file, max_bytes: int, client: httpx.AsyncClient = None):
+    """Stream a Telegram file into a spooled buffer, aborting above ``max_bytes``.
+
+    The declared file_size and Content-Length are checked before any body is
+    read; the running byte count is checked per chunk, so an oversized or
+    mis-declared file never lands in memory whole. Returns the buffer rewound
+    to the start; the caller owns (and closes) it.
+    """
+    if telegram_file.file_size and telegram_file.file_size > max_bytes:
+        raise ImageTooLarge("file_too_large", telegram_file.file_size, max_bytes)
+
+    buf = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+    try:
+        file_path = str(telegram_file.file_path or "")
+        if not file_path.startswith(("http://", "https://")):
+            # local Bot API server mode: the file is already on disk
+            await telegram_file.download_to_memory(buf)
+            if buf.tell() > max_bytes:
+                raise ImageTooLarge("file_too_large", buf.tell(), max_bytes)
+        else:
+            await _stream_into(client or _get_client(), file_path, buf, max_bytes)
+    except BaseException:
+        buf.close()
+        raise
+    buf.seek(0)
+    return buf
+
+
+async def _stream_into(client, url, buf, max_bytes):
+    try:
+        await _stream_response(client, url, buf, max_bytes)
+    except httpx.HTTPStatusError as exc:
+        raise DownloadError("http_status", url, exc.response.status_code) from None
+    except httpx.HTTPError as exc:
+        # from None: a chained httpx error would print the URL with the traceback
+        raise DownloadError(type(exc).__name__, url) from None
+
+
+async def _stream_response(client, url, buf, max_bytes):
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        declared = response.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ImageTooLarge("file_too_large", int(declared), max_bytes)
+        written = 0
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            written += len(chunk)
+            if written > max_bytes:
+                logging.info("[MYWIN][DOWNLOAD] aborted bytes_read=%s max_bytes=%s", written, max_bytes)
+                raise ImageTooLarge("file_too_large", written, max_bytes)
+            buf.write(chunk)
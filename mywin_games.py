@@ -0,0 +1,101 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from pymongo import DESCENDING, UpdateOne
+
+# game_stats holds one document per (period, period_start, game_key); "day"
+# and "week" (ISO week, starting Monday) rollups are both maintained so a
+# "top games" query is a single indexed read on one period bucket.
+PERIODS = ("day", "week")
+
+TAG_COUNTERS = {
+    "mywin": "mywin",
+    "comebackisreal": "cbir",
+}
+
+
+def period_start(period: str, ts: datetime) -> str:
+    day = ts.astimezone(timezone.utc).date()
+    if period == "week":
+        day = day - timedelta(days=day.weekday())
+    return day.isoformat()
+
+
+def _empty_counts():
+    return {"submissions": 0, "mywin": 0, "cbir": 0}
+
+
+class GameStatsBuffer:
+    """Accumulates per-game submission counts until the next :meth:`flush`.
+
+    Counts are merged per (period, period_start, game_key) in memory and
+    written as one unordered bulk of ``$inc`` upserts. Counts pending when the
+    process dies are lost; game_stats is an approximate leaderboard.
+    """
+
+    def __init__(self):
+        self._pending = defaultdict(_empty_counts)
+        self._names = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, game_key: str, game_name: str, tag: str, ts: datetime) -> None:
+        if not game_key:
+            return
+        self._names.setdefault(game_key, game_name)
+        counter = TAG_COUNTERS.get(tag)
+        for period in PERIODS:
+            counts = self._pending[(period, period_start(period, ts), game_key)]
+            counts["submissions"] += 1
+            if counter:
+                counts[counter] += 1
+
+    def flush(self, collection) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, defaultdict(_empty_counts)
+        names, self._names = self._names, {}
+        now = datetime.now(timezone.utc)
+        ops = [
+            UpdateOne(
+                {"_id": f"{period}:{start}:{game_key}"},
+                {
+                    "$inc": counts,
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {
+                        "period": period,
+                        "period_start": start,
+                        "game_key": game_key,
+                        "game_name": names.get(game_key),
+                    },
+                },
+                upsert=True,
+            )
+            for (period, start, game_key), counts in pending.items()
+        ]
+        try:
+            collection.bulk_write(ops, ordered=False)
+        except Exception:
+            for key, counts in pending.items():
+                for field, value in counts.items():
+                    self._pending[key][field] += value
+            for game_key, name in names.items():
+                self._names.setdefault(game_key, name)
+            raise
+        logging.info("[MYWIN][GAME_STATS] flushed buckets=%s", len(ops))
+        return len(ops)
+
+
+def top_games(collection, period: str = "week", now: datetime = None, limit: int = 10) -> list:
+    """Most-submitted games in the current day/week bucket (served by idx_game_stats_period_rank)."""
+    now = now or datetime.now(timezone.utc)
+    return list(
+        collection.find(
+            {"period": period, "period_start": period_start(period, now)},
+            {"_id": 0, "game_key": 1, "game_name": 1, "submissions": 1, "mywin": 1, "cbir": 1},
+        )
+        .sort("submissions", DESCENDING)
+        .limit(limit)
+    )
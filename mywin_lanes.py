@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+# Lanes a submission is classified into once its caption is parsed:
+#   delete    invalid caption / no image; only deletes the message(s)
+#   accept    accepted without image analysis (#comebackisreal, filter off)
+#   analysis  #mywin with the image filter on: download + analysis
+LANES = ("delete", "accept", "analysis")
+
+
+class _Lane:
+    def __init__(self, name, concurrency, samples):
+        self.name = name
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self.queued = 0
+        self.running = 0
+        self.done = 0
+        self.failed = 0
+        self.wait_ms = deque(maxlen=samples)
+        self.latency_ms = deque(maxlen=samples)
+
+
+class LaneDispatcher:
+    """Runs submissions in per-lane background tasks with separate concurrency budgets.
+
+    :meth:`submit` never blocks, so sequential update processing moves on to
+    the next update while a lane works; a burst in the analysis lane only
+    queues behind its own budget. Each lane keeps the last ``samples`` queue
+    waits and end-to-end latencies (submit to completion) for :meth:`stats`.
+    """
+
+    def __init__(self, budgets: dict, samples: int = 1000):
+        self._lanes = {name: _Lane(name, budgets[name], samples) for name in LANES}
+        self._tasks = set()
+
+    def submit(self, lane: str, coro_fn, *args) -> None:
+        task = asyncio.get_running_loop().create_task(self._run(self._lanes[lane], coro_fn, args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, lane, coro_fn, args):
+        submitted = time.monotonic()
+        lane.queued += 1
+        async with lane.semaphore:
+            lane.queued -= 1
+            lane.running += 1
+            lane.wait_ms.append((time.monotonic() - submitted) * 1000)
+            try:
+                await coro_fn(*args)
+                lane.done += 1
+            except Exception:
+                lane.failed += 1
+                logging.exception("[MYWIN][LANES] failed lane=%s", lane.name)
+            finally:
+                lane.running -= 1
+                lane.latency_ms.append((time.monotonic() - submitted) * 1000)
+
+    async def drain(self) -> None:
+        """Wait for every submitted task (shutdown, tests)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            lane.name: {
+                "concurrency": lane.concurrency,
+                "queued": lane.queued,
+                "running": lane.running,
+                "done": lane.done,
+                "failed": lane.failed,
+                "wait_p95_ms": _percentile(lane.wait_ms, 0.95),
+                "latency_p50_ms": _percentile(lane.latency_ms, 0.50),
+                "latency_p95_ms": _percentile(lane.latency_ms, 0.95),
+            }
+            for lane in self._lanes.values()
+        }
+
+    def log_stats(self) -> None:
+        for name, s in self.stats().items():
+            logging.info(
+                "[MYWIN][LANES] lane=%s concurrency=%s queued=%s running=%s done=%s failed=%s "
+                "wait_p95_ms=%s latency_p50_ms=%s latency_p95_ms=%s",
+                name, s["concurrency"], s["queued"], s["running"], s["done"], s["failed"],
+                s["wait_p95_ms"], s["latency_p50_ms"], s["latency_p95_ms"],
+            )
+
+
+def _percentile(samples, q: float):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
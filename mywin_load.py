@@ -0,0 +1,112 @@
+import contextlib
+import logging
+import time
+from collections import Counter
+
+# Analysis modes, cheapest last. Degraded modes enqueue the submission for a
+# full re-analysis once load allows.
+#   full          download + every quality metric + near-duplicate check
+#   hash_only     download + dimensions/size + hash/near-duplicate check
+#   metadata_only no download; Telegram's declared dimensions/size only
+#   defer         no checks; accepted as IGNORE (no XP) until re-analyzed
+MODES = ("full", "hash_only", "metadata_only", "defer")
+
+
+class LoadShedder:
+    """Picks the analysis mode from in-flight analyses and update queue age.
+
+    ``inflight_thresholds`` and ``queue_age_thresholds`` hold the values at
+    which ``hash_only``, ``metadata_only`` and ``defer`` are entered; the
+    level is the highest one either signal exceeds, and escalation is
+    immediate. Recovery has hysteresis: the mode only steps down one level
+    once both signals stay below ``exit_ratio`` times that level's entry
+    thresholds for ``min_dwell_seconds``. Queue age is the smoothed delay
+    between Telegram receiving a message and its analysis starting.
+    """
+
+    def __init__(
+        self,
+        inflight_thresholds=(8, 16, 32),
+        queue_age_thresholds=(5.0, 10.0, 20.0),
+        exit_ratio: float = 0.5,
+        min_dwell_seconds: float = 10.0,
+        smoothing: float = 0.3,
+        clock=time.monotonic,
+    ):
+        self.inflight_thresholds = tuple(inflight_thresholds)
+        self.queue_age_thresholds = tuple(queue_age_thresholds)
+        self.exit_ratio = exit_ratio
+        self.min_dwell_seconds = min_dwell_seconds
+        self.smoothing = smoothing
+        self.clock = clock
+        self.level = 0
+        self.in_flight = 0
+        self.queue_age = 0.0
+        self._calm_since = None
+        self.transitions = Counter()
+        self.submissions_by_mode = Counter()
+
+    @property
+    def mode(self) -> str:
+        return MODES[self.level]
+
+    def observe_queue_age(self, seconds: float) -> None:
+        seconds = max(0.0, seconds)
+        self.queue_age += self.smoothing * (seconds - self.queue_age)
+
+    @contextlib.contextmanager
+    def track(self):
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def _target_level(self) -> int:
+        level = 0
+        for i, (max_inflight, max_age) in enumerate(zip(self.inflight_thresholds, self.queue_age_thresholds)):
+            if self.in_flight >= max_inflight or self.queue_age >= max_age:
+                level = i + 1
+        return level
+
+    def _calm(self) -> bool:
+        # below the exit thresholds of the current level
+        max_inflight = self.inflight_thresholds[self.level - 1] * self.exit_ratio
+        max_age = self.queue_age_thresholds[self.level - 1] * self.exit_ratio
+        return self.in_flight < max_inflight and self.queue_age < max_age
+
+    def select_mode(self) -> str:
+        """Re-evaluate the signals, transition if needed and return the mode for this submission."""
+        now = self.clock()
+        target = self._target_level()
+        if target > self.level:
+            self._transition(target)
+            self._calm_since = None
+        elif self.level > 0 and self._calm():
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.min_dwell_seconds:
+                self._transition(self.level - 1)
+                self._calm_since = now if self.level > 0 else None
+        else:
+            self._calm_since = None
+        self.submissions_by_mode[self.mode] += 1
+        return self.mode
+
+    def _transition(self, level: int) -> None:
+        previous = self.mode
+        self.level = level
+        self.transitions[(previous, self.mode)] += 1
+        logging.warning(
+            "[MYWIN][LOAD] mode_change from=%s to=%s in_flight=%s queue_age_s=%.1f transitions=%s",
+            previous, self.mode, self.in_flight, self.queue_age, sum(self.transitions.values()),
+        )
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "in_flight": self.in_flight,
+            "queue_age_s": round(self.queue_age, 2),
+            "transitions": {f"{a}->{b}": n for (a, b), n in self.transitions.items()},
+            "submissions_by_mode": dict(self.submissions_by_mode),
+        }
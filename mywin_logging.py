@@ -0,0 +1,155 @@
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+DEFAULT_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+
+# "[MYWIN][QUALITY] decision=..." -> "[MYWIN][QUALITY]"; "event_written=1 ..." -> "event_written"
+_CATEGORY_RE = re.compile(r"^((?:\[[A-Z0-9_]+\])+|[A-Za-z0-9_]+)")
+
+
+def log_category(record: logging.LogRecord) -> str:
+    """Category of a record, taken from its format string (cheap: nothing is formatted)."""
+    match = _CATEGORY_RE.match(record.msg) if isinstance(record.msg, str) else None
+    return match.group(1) if match else "-"
+
+
+def parse_sample_rates(value: str) -> dict:
+    """Parse ``"[MYWIN][QUALITY]=0.1,event_written=0.05"`` into {category: rate}."""
+    rates = {}
+    for part in (value or "").split(","):
+        category, sep, rate = part.strip().rpartition("=")
+        if not sep or not category:
+            continue
+        try:
+            rates[category] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class CategorySampler(logging.Filter):
+    """Keeps a ``rate`` share of INFO/DEBUG records per category; warnings always pass.
+
+    Sampling is deterministic (the first and then every n-th record of a
+    category), so a rate of 0.1 keeps exactly one line in ten. Suppressed
+    records are counted.
+    """
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+        self._seen = Counter()
+        self.suppressed = Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        category = log_category(record)
+        rate = self.rates.get(category)
+        if rate is None or rate >= 1.0:
+            return True
+        seen = self._seen[category]
+        self._seen[category] = seen + 1
+        if rate > 0 and seen % max(1, round(1 / rate)) == 0:
+            return True
+        self.suppressed[category] += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler over a bounded queue that drops (and counts) records instead of blocking."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = Counter()
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # the queue is in-process, so the record is handed over as-is:
+        # ``msg % args`` and traceback formatting run on the listener thread
+        # (QueueHandler.prepare would do both here, on the caller's thread)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped[log_category(record)] += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per line: ts, level, category, msg (+ exc)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "category": log_category(record),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+class QueueLogging:
+    """Root logging through a bounded queue, drained by a QueueListener thread.
+
+    Records are filtered by :class:`CategorySampler` and enqueued by the
+    calling thread unformatted; message and traceback formatting and the
+    write to the stream handler happen on the listener thread, so neither
+    a slow sink nor formatting blocks the event loop. Arguments are
+    therefore rendered slightly later, so log values, not objects that are
+    mutated right after the call. When the queue is full records are
+    dropped and counted per category.
+    """
+
+    def __init__(self, level=logging.INFO, json_format: bool = False, queue_size: int = 10000,
+                 sample_rates: dict = None, stream=None):
+        self.sampler = CategorySampler(sample_rates or {})
+        self.queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        self.queue_handler.addFilter(self.sampler)
+        sink = logging.StreamHandler(stream)
+        sink.setFormatter(JsonFormatter() if json_format else logging.Formatter(DEFAULT_FORMAT))
+        self.listener = logging.handlers.QueueListener(self.queue_handler.queue, sink, respect_handler_level=True)
+        self.level = level
+        self._reported_drops = 0
+
+    def install(self) -> "QueueLogging":
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(self.level)
+        self.listener.start()
+        return self
+
+    def stop(self) -> None:
+        # flushes every queued record before returning
+        self.listener.stop()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue_handler.queue.qsize(),
+            "dropped": dict(self.queue_handler.dropped),
+            "sampled_out": dict(self.sampler.suppressed),
+        }
+
+    def report_drops(self) -> None:
+        """Log a warning when records were dropped since the last report."""
+        total = sum(self.queue_handler.dropped.values())
+        if total > self._reported_drops:
+            logging.warning(
+                "[LOGGING] dropped=%s since_last=%s by_category=%s",
+                total, total - self._reported_drops, dict(self.queue_handler.dropped),
+            )
+            self._reported_drops = total
@@ -0,0 +1,182 @@
+import asyncio
+import contextlib
+import contextvars
+import logging
+import sys
+import threading
+import time
+import traceback
+
+# Telegram update id of the update being handled; set by the handler and
+# inherited by tasks it spawns (album flushes, lanes).
+update_id_var = contextvars.ContextVar("mywin_update_id", default=None)
+
+_current_update = contextvars.ContextVar("mywin_loopmon_update", default=None)
+
+
+class _UpdateRecord:
+    __slots__ = ("update_id", "stage", "started", "task", "sampled")
+
+    def __init__(self, update_id, task):
+        self.update_id = update_id
+        self.stage = "start"
+        self.started = time.monotonic()
+        self.task = task
+        self.sampled = False
+
+
+class LoopMonitor:
+    """Event-loop lag monitor and slow-update stack sampler.
+
+    A tick task wakes every ``interval_seconds`` and measures how late it
+    woke (loop lag); a lag above ``lag_threshold_seconds`` is logged. A
+    watchdog thread watches the tick's heartbeat and, when the loop has not
+    ticked for longer than the threshold, samples the loop thread's stack:
+    that is the code blocking the loop, logged while it still blocks.
+    Updates wrapped in :meth:`track_update` that run longer than
+    ``slow_threshold_seconds`` get their coroutine stack sampled once, with
+    the update id and the stage last set by :meth:`mark_stage`. When idle
+    the cost is one tick per interval and one thread wake-up per interval.
+    """
+
+    def __init__(
+        self,
+        lag_threshold_seconds: float = 0.2,
+        slow_threshold_seconds: float = 2.0,
+        interval_seconds: float = 0.1,
+        max_frames: int = 12,
+    ):
+        self.lag_threshold_seconds = lag_threshold_seconds
+        self.slow_threshold_seconds = slow_threshold_seconds
+        self.interval_seconds = interval_seconds
+        self.max_frames = max_frames
+        self.lag_events = 0
+        self.max_lag_ms = 0.0
+        self.blocked_samples = 0
+        self.slow_updates = 0
+        self._active = set()
+        self._heartbeat = time.monotonic()
+        self._stall_sampled = False
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._task = None
+        self._thread = None
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._thread = threading.Thread(target=self._watchdog, name="mywin-loopmon", daemon=True)
+        self._thread.start()
+        logging.info(
+            "[LOOPMON] started lag_threshold_ms=%d slow_threshold_ms=%d",
+            self.lag_threshold_seconds * 1000, self.slow_threshold_seconds * 1000,
+        )
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    @contextlib.contextmanager
+    def track_update(self, update_id):
+        record = _UpdateRecord(update_id, asyncio.current_task())
+        token = _current_update.set(record)
+        self._active.add(record)
+        try:
+            yield record
+        finally:
+            _current_update.reset(token)
+            self._active.discard(record)
+            elapsed = time.monotonic() - record.started
+            if elapsed > self.slow_threshold_seconds:
+                logging.warning(
+                    "[LOOPMON] slow_update_done update_id=%s stage=%s elapsed_ms=%d",
+                    record.update_id, record.stage, elapsed * 1000,
+                )
+
+    def mark_stage(self, stage: str) -> None:
+        record = _current_update.get()
+        if record is not None:
+            record.stage = stage
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            now = time.monotonic()
+            self._heartbeat = now
+            self._stall_sampled = False
+            lag = now - expected
+            if lag > self.lag_threshold_seconds:
+                self.lag_events += 1
+                self.max_lag_ms = max(self.max_lag_ms, lag * 1000)
+                logging.warning(
+                    "[LOOPMON] loop_lag lag_ms=%d active_updates=%s",
+                    lag * 1000, self._describe_active(),
+                )
+            self.check_slow_updates(now)
+
+    def check_slow_updates(self, now: float) -> None:
+        for record in list(self._active):
+            if record.sampled or now - record.started <= self.slow_threshold_seconds:
+                continue
+            record.sampled = True
+            self.slow_updates += 1
+            stack = _await_chain(record.task, self.max_frames) if record.task is not None else []
+            logging.warning(
+                "[LOOPMON] slow_update update_id=%s stage=%s elapsed_ms=%d stack=%s",
+                record.update_id, record.stage, (now - record.started) * 1000,
+                _format_frames(stack),
+            )
+
+    def _watchdog(self):
+        while not self._stop.wait(self.interval_seconds):
+            blocked = time.monotonic() - self._heartbeat
+            if blocked <= self.lag_threshold_seconds or self._stall_sampled:
+                continue
+            self._stall_sampled = True
+            frame = sys._current_frames().get(self._loop_thread_id)
+            self.blocked_samples += 1
+            frames = traceback.extract_stack(frame, limit=self.max_frames) if frame is not None else []
+            logging.warning(
+                "[LOOPMON] loop_blocked blocked_ms=%d active_updates=%s stack=%s",
+                blocked * 1000, self._describe_active(), " <- ".join(
+                    f"{f.name}({f.filename.rsplit('/', 1)[-1]}:{f.lineno})" for f in reversed(frames)
+                ),
+            )
+
+    def _describe_active(self) -> str:
+        return ",".join(f"{r.update_id}:{r.stage}" for r in list(self._active)) or "-"
+
+    def stats(self) -> dict:
+        return {
+            "lag_events": self.lag_events,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "blocked_samples": self.blocked_samples,
+            "slow_updates": self.slow_updates,
+        }
+
+
+def _await_chain(task, limit):
+    """Frames of a suspended task, outermost first, following the chain of awaits.
+
+    ``Task.get_stack`` only returns the outermost frame of a suspended
+    coroutine; the innermost one is where it is actually waiting.
+    """
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None and len(frames) < limit:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return frames
+
+
+def _format_frames(frames) -> str:
+    # innermost frame first, like the suspended await chain reads
+    return " <- ".join(
+        f"{f.f_code.co_name}({f.f_code.co_filename.rsplit('/', 1)[-1]}:{f.f_lineno})" for f in reversed(frames)
+    ) or "-"
@@ -0,0 +1,62 @@
+import logging
+from collections import OrderedDict
+
+
+class KnownMemberCache:
+    """Bounded LRU of member uids known to exist in the members collection.
+
+    Only positive knowledge is cached: a uid is added after an upsert on it
+    succeeded (inserted or matched), and a lookup miss simply means "do the
+    upsert". Because the upsert is ``$setOnInsert``-only, skipping it for a
+    known uid never loses data. Eviction drops the least recently seen uid;
+    its next submission pays one redundant upsert and re-seeds the entry.
+    A member document deleted out-of-band is not re-created until its uid is
+    evicted or the process restarts.
+    """
+
+    def __init__(self, max_size: int = 50_000, log_every: int = 1000):
+        self.max_size = max_size
+        self.log_every = log_every
+        self._uids = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, uid) -> bool:
+        return uid in self._uids
+
+    def __len__(self) -> int:
+        return len(self._uids)
+
+    def check(self, uid) -> bool:
+        """Return True (and count a saved write) when ``uid`` is known."""
+        if uid in self._uids:
+            self._uids.move_to_end(uid)
+            self.hits += 1
+            known = True
+        else:
+            self.misses += 1
+            known = False
+        if self.log_every and (self.hits + self.misses) % self.log_every == 0:
+            logging.info("[MYWIN][MEMBER_CACHE] %s", self.stats())
+        return known
+
+    def add(self, uid) -> None:
+        self._uids[uid] = True
+        self._uids.move_to_end(uid)
+        while len(self._uids) > self.max_size:
+            self._uids.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, uid) -> None:
+        self._uids.pop(uid, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._uids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "writes_saved_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,162 @@
+"""Connection-pool wait measurement for the Telegram HTTP clients and Mongo.
+
+:class:`PoolWaitStats` keeps recent wait samples per pool. HTTP pools are
+timed by :class:`PoolTimingTransport`: the wait is the time from handing the
+request to the transport until httpcore reports the first event on a
+connection (``connect_tcp`` for a new one, ``send_request_headers`` for a
+reused one), which is the time spent queued for a free slot plus pool
+bookkeeping. Mongo checkouts are timed by :class:`MongoPoolListener` from
+pymongo's CMAP events.
+"""
+import logging
+import time
+from collections import defaultdict, deque
+
+import httpx
+from pymongo import monitoring
+from telegram.request import HTTPXRequest
+
+
+class PoolWaitStats:
+    def __init__(self, samples: int = 1000):
+        self._waits = defaultdict(lambda: deque(maxlen=samples))
+        self.acquired = defaultdict(int)
+        self.timeouts = defaultdict(int)
+
+    def record(self, pool: str, seconds: float) -> None:
+        self._waits[pool].append(seconds)
+        self.acquired[pool] += 1
+
+    def record_timeout(self, pool: str) -> None:
+        self.timeouts[pool] += 1
+
+    def stats(self) -> dict:
+        stats = {}
+        for pool in sorted(set(self.acquired) | set(self.timeouts)):
+            waits = sorted(self._waits[pool])
+            stats[pool] = {
+                "acquired": self.acquired[pool],
+                "timeouts": self.timeouts[pool],
+                "wait_p50_ms": _percentile_ms(waits, 0.50),
+                "wait_p95_ms": _percentile_ms(waits, 0.95),
+                "wait_max_ms": _percentile_ms(waits, 1.0),
+            }
+        return stats
+
+    def log_stats(self) -> None:
+        for pool, row in self.stats().items():
+            level = logging.WARNING if row["timeouts"] else logging.INFO
+            logging.log(
+                level,
+                "[POOLS] pool=%s acquired=%d timeouts=%d wait_p50_ms=%s wait_p95_ms=%s wait_max_ms=%s",
+                pool, row["acquired"], row["timeouts"], row["wait_p50_ms"], row["wait_p95_ms"], row["wait_max_ms"],
+            )
+
+
+def _percentile_ms(sorted_values, q):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))] * 1000, 1)
+
+
+class PoolTimingTransport(httpx.AsyncHTTPTransport):
+    """AsyncHTTPTransport that records how long each request waited for a pooled connection."""
+
+    def __init__(self, pool_name: str, wait_stats: PoolWaitStats, **kwargs):
+        super().__init__(**kwargs)
+        self.pool_name = pool_name
+        self.wait_stats = wait_stats
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        acquired = []
+        outer_trace = request.extensions.get("trace")
+
+        async def trace(event_name, info):
+            if not acquired and event_name.endswith(".started"):
+                acquired.append(time.perf_counter() - started)
+            if outer_trace is not None:
+                await outer_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            return await super().handle_async_request(request)
+        except httpx.PoolTimeout:
+            self.wait_stats.record_timeout(self.pool_name)
+            raise
+        finally:
+            if acquired:
+                self.wait_stats.record(self.pool_name, acquired[0])
+
+
+class PooledHTTPXRequest(HTTPXRequest):
+    """Bot API request object with a named, timed connection pool.
+
+    Takes HTTPXRequest's arguments (``connection_pool_size``,
+    ``pool_timeout``, ...); with ``wait_stats`` set, pool waits and pool
+    timeouts are recorded under ``pool_name``.
+    """
+
+    def __init__(self, *args, pool_name: str = "telegram_api", wait_stats: PoolWaitStats = None, **kwargs):
+        # read by _build_client, which HTTPXRequest.__init__ calls
+        self._pool_name = pool_name
+        self._wait_stats = wait_stats
+        super().__init__(*args, **kwargs)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        kwargs = dict(self._client_kwargs)
+        if self._wait_stats is not None and kwargs.get("transport") is None and not kwargs.get("proxies"):
+            # a custom transport owns the pool, so the limits move onto it
+            kwargs["transport"] = PoolTimingTransport(
+                self._pool_name,
+                self._wait_stats,
+                limits=kwargs.pop("limits"),
+                http1=kwargs["http1"],
+                http2=kwargs["http2"],
+            )
+        return httpx.AsyncClient(**kwargs)
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Records Mongo connection checkout waits (and checkout failures) as pool ``mongo``."""
+
+    def __init__(self, wait_stats: PoolWaitStats, pool_name: str = "mongo"):
+        self.wait_stats = wait_stats
+        self.pool_name = pool_name
+
+    def connection_checked_out(self, event):
+        duration = getattr(event, "duration", None)  # pymongo >= 4.7
+        if duration is not None:
+            self.wait_stats.record(self.pool_name, duration)
+
+    def connection_check_out_failed(self, event):
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            self.wait_stats.record_timeout(self.pool_name)
+
+    # the remaining CMAP events carry nothing we report
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
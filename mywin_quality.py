@@ -1,10 +1,14 @@
 import io
 import logging
 import os
+import re
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 
-from PIL import Image, ImageFilter, ImageStat
+# Partitions the near-duplicate check can be scoped to: every stored hash,
+# only hashes from the same chat, or only hashes from the same user.
+DUPLICATE_SCOPES = ("global", "chat", "user")
 
 
 @dataclass
@@ -19,17 +23,23 @@ class MyWinImageQualityConfig:
     max_saturation_mean: float = 0.82
     duplicate_hamming_threshold: int = 10
     duplicate_lookback_days: int = 30
+    duplicate_scope: str = "global"
+    hash_retention_margin_days: int = 7
+    max_download_bytes: int = 10 * 1024 * 1024
+    max_image_pixels: int = 25_000_000
 
 
 @dataclass
 class MyWinImageMetrics:
-    width: int
-    height: int
-    file_size: int
-    blur_score: float
-    blank_stddev: float
-    saturation_mean: float
-    image_hash: str
+    """Image metrics; fields a degraded analysis did not compute are None."""
+
+    width: Optional[int]
+    height: Optional[int]
+    file_size: Optional[int]
+    blur_score: Optional[float]
+    blank_stddev: Optional[float]
+    saturation_mean: Optional[float]
+    image_hash: Optional[str]
 
 
 @dataclass
@@ -40,6 +50,16 @@ class MyWinImageDecision:
     duplicate_match: bool
 
 
+class ImageTooLarge(ValueError):
+    """Raised when an image exceeds the download byte cap or the pixel ceiling."""
+
+    def __init__(self, reason: str, size: int, limit: int):
+        super().__init__(f"{reason}: {size} > {limit}")
+        self.reason = reason
+        self.size = size
+        self.limit = limit
+
+
 def load_mywin_quality_config() -> MyWinImageQualityConfig:
     return MyWinImageQualityConfig(
         enabled=_parse_bool(os.getenv("MYWIN_IMG_FILTER_ENABLED", "1")),
@@ -52,13 +72,79 @@ def load_mywin_quality_config() -> MyWinImageQualityConfig:
         max_saturation_mean=float(os.getenv("MYWIN_IMG_MAX_SATURATION_MEAN", "0.82")),
         duplicate_hamming_threshold=int(os.getenv("MYWIN_IMG_DUPLICATE_HAMMING_THRESHOLD", "10")),
         duplicate_lookback_days=int(os.getenv("MYWIN_IMG_DUPLICATE_LOOKBACK_DAYS", "30")),
+        duplicate_scope=_parse_duplicate_scope(os.getenv("MYWIN_IMG_DUPLICATE_SCOPE", "global")),
+        hash_retention_margin_days=int(os.getenv("MYWIN_IMG_HASH_RETENTION_MARGIN_DAYS", "7")),
+        max_download_bytes=int(os.getenv("MYWIN_IMG_MAX_DOWNLOAD_BYTES", str(10 * 1024 * 1024))),
+        max_image_pixels=int(os.getenv("MYWIN_IMG_MAX_PIXELS", "25000000")),
     )
 
 
-def analyze_mywin_image(image_bytes: bytes) -> MyWinImageMetrics:
-    file_size = len(image_bytes)
-    image_rgb = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    width, height = image_rgb.size
+def _load_pillow():
+    """Import Pillow on first use.
+
+    Pillow is only needed for image analysis, so a bot running with
+    MYWIN_IMG_FILTER_ENABLED off never pays for importing it.
+    """
+    from PIL import Image, ImageFilter, ImageStat
+
+    return Image, ImageFilter, ImageStat
+
+
+def preload_image_analysis() -> None:
+    """Import Pillow ahead of the first submission (boot warm-up)."""
+    _load_pillow()
+
+
+def analyze_mywin_image(image_data, max_pixels: int = None, hash_only: bool = False) -> MyWinImageMetrics:
+    """Compute quality metrics for ``image_data`` (bytes or a binary file object).
+
+    File objects are handed to Pillow as-is, without copying them into bytes.
+    When ``max_pixels`` is set, the dimensions read from the image header are
+    checked before any pixel data is decoded; images past Pillow's
+    decompression-bomb limit raise :class:`ImageTooLarge` as well.
+    ``hash_only`` skips the blur, blank and saturation metrics (load
+    shedding) and leaves them None.
+    """
+    Image, ImageFilter, ImageStat = _load_pillow()
+    if hasattr(image_data, "read"):
+        stream = image_data
+        stream.seek(0, io.SEEK_END)
+        file_size = stream.tell()
+        stream.seek(0)
+    else:
+        file_size = len(image_data)
+        stream = io.BytesIO(image_data)
+
+    try:
+        image = Image.open(stream)
+    except Image.DecompressionBombError as exc:
+        # past 2x Image.MAX_IMAGE_PIXELS Pillow refuses to open before our check can run
+        found = re.search(r"\((\d+) pixels\)", str(exc))
+        raise ImageTooLarge(
+            "too_many_pixels",
+            int(found.group(1)) if found else 0,
+            min(filter(None, (max_pixels, Image.MAX_IMAGE_PIXELS))),
+        ) from exc
+
+    with image:
+        width, height = image.size
+        # past 1x Pillow only warns; treat its limit as a ceiling too
+        limit = min(filter(None, (max_pixels, Image.MAX_IMAGE_PIXELS)), default=None)
+        if limit and width * height > limit:
+            raise ImageTooLarge("too_many_pixels", width * height, limit)
+        if hash_only:
+            # same conversion path as a full analysis, so the hashes compare
+            image_gray = image.convert("RGB").convert("L")
+            return MyWinImageMetrics(
+                width=width,
+                height=height,
+                file_size=file_size,
+                blur_score=None,
+                blank_stddev=None,
+                saturation_mean=None,
+                image_hash=_dhash_hex(image_gray),
+            )
+        image_rgb = image.convert("RGB")
 
     saturation_mean = _compute_saturation_mean(image_rgb)
 
@@ -86,16 +172,19 @@ def decide_mywin_image_quality(
     duplicate_match: bool,
     cfg: MyWinImageQualityConfig,
 ) -> MyWinImageDecision:
-    if metrics.width < cfg.min_width:
+    # checks whose metric is None were skipped by a degraded analysis
+    if metrics.width is not None and metrics.width < cfg.min_width:
         return MyWinImageDecision("REJECT", "small_resolution", metrics, duplicate_match)
-    if metrics.height < cfg.min_height:
+    if metrics.height is not None and metrics.height < cfg.min_height:
         return MyWinImageDecision("REJECT", "small_resolution", metrics, duplicate_match)
-    if metrics.file_size < cfg.min_file_size_bytes:
+    if metrics.file_size is not None and metrics.file_size < cfg.min_file_size_bytes:
         return MyWinImageDecision("REJECT", "small_file_size", metrics, duplicate_match)
-    if metrics.blank_stddev < cfg.blank_stddev_threshold:
+    if metrics.blank_stddev is not None and metrics.blank_stddev < cfg.blank_stddev_threshold:
         return MyWinImageDecision("REJECT", "blank_image", metrics, duplicate_match)
     if duplicate_match:
         return MyWinImageDecision("REJECT", "duplicate_image", metrics, duplicate_match)
+    if metrics.blur_score is None:
+        return MyWinImageDecision("PASS", "partial", metrics, duplicate_match)
     if metrics.blur_score < cfg.reject_blur_threshold:
         return MyWinImageDecision("REJECT", "blur", metrics, duplicate_match)
     if metrics.saturation_mean > cfg.max_saturation_mean:
@@ -110,57 +199,183 @@ def is_near_duplicate_hash(
     image_hash: str,
     threshold: int,
     lookback_days: int,
+    scope: str = "global",
+    chat_id: int = None,
+    user_id: int = None,
 ) -> bool:
+    """Return True when a hash within ``threshold`` bits exists in the scope's partition.
+
+    ``scope="chat"`` only compares against hashes stored for ``chat_id`` and
+    ``scope="user"`` only against hashes stored for ``user_id``; both are served
+    by the compound ``(chat_id|user_id, created_at)`` indexes. Records written
+    before chat_id was stored are only visible to the global scope.
+    """
+    return find_near_duplicate_hashes(
+        collection, [image_hash], threshold, lookback_days, scope=scope, chat_id=chat_id, user_id=user_id
+    )[0]
+
+
+def find_near_duplicate_hashes(
+    collection,
+    image_hashes: list,
+    threshold: int,
+    lookback_days: int,
+    scope: str = "global",
+    chat_id: int = None,
+    user_id: int = None,
+) -> list:
+    """Batched :func:`is_near_duplicate_hash`: one candidate query for several hashes.
+
+    Returns one bool per input hash. A hash also counts as a duplicate when it
+    is near an earlier hash of the same batch (e.g. the same shot twice in one
+    album).
+    """
     now = datetime.now(timezone.utc)
     lookback_start = now - timedelta(days=lookback_days)
-    cursor = collection.find(
-        {"created_at": {"$gte": lookback_start}, "hash": {"$exists": True}},
-        {"hash": 1},
+    query = {"created_at": {"$gte": lookback_start}, "hash": {"$exists": True}}
+    if scope == "chat":
+        query["chat_id"] = chat_id
+    elif scope == "user":
+        query["user_id"] = user_id
+    elif scope != "global":
+        raise ValueError(f"unknown duplicate scope: {scope!r}")
+
+    matches, candidates = match_near_duplicates(image_hashes, _stored_hashes(collection, query), threshold)
+    logging.info(
+        "[MYWIN][DEDUP] scope=%s chat_id=%s user_id=%s hashes=%s candidates=%s duplicate_matches=%s",
+        scope,
+        chat_id,
+        user_id,
+        len(image_hashes),
+        candidates,
+        sum(matches),
     )
-    for doc in cursor:
-        existing_hash = doc.get("hash")
+    return matches
+
+
+def match_near_duplicates(image_hashes: list, candidate_hashes, threshold: int) -> tuple:
+    """Match a batch of hashes against candidates; returns ``(matches, candidates_seen)``.
+
+    ``matches`` holds one bool per input hash: True when it is within
+    ``threshold`` bits of an earlier hash of the batch or of a candidate.
+    ``candidate_hashes`` is consumed lazily and not at all once every hash
+    matched, so it can be a Mongo cursor or an in-memory scan. This is the
+    single matching rule shared by the Mongo and the in-process lookups.
+    """
+    matches = [
+        any(_hamming_distance_hex(earlier, image_hash) <= threshold for earlier in image_hashes[:i])
+        for i, image_hash in enumerate(image_hashes)
+    ]
+    candidates = 0
+    if all(matches):
+        return matches, candidates
+    for existing_hash in candidate_hashes:
         if not existing_hash:
             continue
-        if _hamming_distance_hex(existing_hash, image_hash) <= threshold:
-            return True
-    return False
-
-
-def store_hash_record(collection, user_id: int, message_id: int, image_hash: str, decision: str) -> None:
-    collection.insert_one(
-        {
-            "user_id": user_id,
-            "message_id": message_id,
-            "hash": image_hash,
-            "decision": decision,
-            "created_at": datetime.now(timezone.utc),
-        }
-    )
+        candidates += 1
+        for i, image_hash in enumerate(image_hashes):
+            if not matches[i] and _hamming_distance_hex(existing_hash, image_hash) <= threshold:
+                matches[i] = True
+        if all(matches):
+            break
+    return matches, candidates
+
+
+def _stored_hashes(collection, query):
+    # a generator, so the query only runs if the batch did not already match
+    for doc in collection.find(query, {"hash": 1}):
+        yield doc.get("hash")
+
+
+def store_hash_record(
+    collection,
+    user_id: int,
+    message_id: int,
+    image_hash: str,
+    decision: str,
+    chat_id: int = None,
+    metrics: MyWinImageMetrics = None,
+    duplicate_match: bool = None,
+) -> dict:
+    """Insert one hash record and return it (with its ``_id`` once inserted).
+
+    With ``metrics`` and ``duplicate_match`` the record holds everything
+    :func:`decide_mywin_image_quality` used, so a decision can be replayed
+    under another config without downloading the image again.
+    """
+    record = {
+        "user_id": user_id,
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "hash": image_hash,
+        "decision": decision,
+        "created_at": datetime.now(timezone.utc),
+    }
+    if metrics is not None:
+        record["metrics"] = compact_metrics(metrics)
+    if duplicate_match is not None:
+        record["duplicate"] = duplicate_match
+    collection.insert_one(record)
+    return record
+
+
+# short stored keys of MyWinImageMetrics fields (the hash is stored beside them)
+_METRIC_KEYS = (
+    ("w", "width"),
+    ("h", "height"),
+    ("fs", "file_size"),
+    ("bl", "blur_score"),
+    ("bk", "blank_stddev"),
+    ("sat", "saturation_mean"),
+)
+
+
+def compact_metrics(metrics: MyWinImageMetrics) -> dict:
+    """Metrics as a small subdocument: short keys, fields that were not computed left out."""
+    return {key: getattr(metrics, name) for key, name in _METRIC_KEYS if getattr(metrics, name) is not None}
+
+
+def expand_metrics(stored: dict, image_hash: str = None) -> MyWinImageMetrics:
+    """Inverse of :func:`compact_metrics`."""
+    return MyWinImageMetrics(image_hash=image_hash, **{name: stored.get(key) for key, name in _METRIC_KEYS})
 
 
 def log_mywin_quality(user_id: int, decision: MyWinImageDecision) -> None:
     m = decision.metrics
     logging.info(
-        "[MYWIN][QUALITY] decision=%s reason=%s user_id=%s width=%s height=%s file_size=%s blur_score=%.2f blank_stddev=%.2f saturation_mean=%.3f duplicate_match=%s",
+        "[MYWIN][QUALITY] decision=%s reason=%s user_id=%s width=%s height=%s file_size=%s blur_score=%s blank_stddev=%s saturation_mean=%s duplicate_match=%s",
         decision.decision,
         decision.reason,
         user_id,
         m.width,
         m.height,
         m.file_size,
-        m.blur_score,
-        m.blank_stddev,
-        m.saturation_mean,
+        _format_metric(m.blur_score, ".2f"),
+        _format_metric(m.blank_stddev, ".2f"),
+        _format_metric(m.saturation_mean, ".3f"),
         decision.duplicate_match,
     )
 
 
+def _format_metric(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
 def _parse_bool(value: str) -> bool:
     return (value or "").lower() in {"1", "true", "yes", "on"}
 
 
-def _compute_saturation_mean(image_rgb: Image.Image) -> float:
+def _parse_duplicate_scope(value: str) -> str:
+    scope = (value or "").strip().lower()
+    if scope not in DUPLICATE_SCOPES:
+        logging.warning("[MYWIN][DEDUP] unknown duplicate scope=%r, falling back to global", value)
+        return "global"
+    return scope
+
+
+def _compute_saturation_mean(image_rgb) -> float:
     """Return mean HSV saturation in [0, 1] over a 150×150 downsample."""
+    Image, _, _ = _load_pillow()
     small = image_rgb.resize((150, 150), Image.Resampling.LANCZOS)
     pixels = list(small.getdata())
     total = 0.0
@@ -171,7 +386,8 @@ def _compute_saturation_mean(image_rgb: Image.Image) -> float:
     return total / len(pixels)
 
 
-def _dhash_hex(image: Image.Image, hash_size: int = 8) -> str:
+def _dhash_hex(image, hash_size: int = 8) -> str:
+    Image, _, _ = _load_pillow()
     resized = image.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
     pixels = list(resized.getdata())
     bits = []
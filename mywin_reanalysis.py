@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+
+class ReanalysisQueue:
+    """Persistent queue of images whose hot-path analysis was skipped or failed.
+
+    Items are keyed ``"<chat_id>:<message_id>"`` and inserted with
+    ``$setOnInsert``, so a message is queued at most once. A worker claims
+    one item at a time with ``find_one_and_update``: a pending item whose
+    ``not_before`` has passed, or a processing item whose lease expired (its
+    worker died). Failures are retried with exponential backoff and the item
+    is marked ``failed`` after ``max_attempts``; finished items keep their
+    outcome with status ``done``.
+    """
+
+    def __init__(
+        self,
+        collection,
+        lease_seconds: float = 300.0,
+        max_attempts: int = 5,
+        retry_delay_seconds: float = 60.0,
+        owner: str = None,
+    ):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay_seconds = retry_delay_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+
+    def enqueue(self, items) -> int:
+        now = datetime.now(timezone.utc)
+        ops = [
+            UpdateOne(
+                {"_id": f"{item['chat_id']}:{item['message_id']}"},
+                {"$setOnInsert": {**item, "status": "pending", "attempts": 0, "enqueued_at": now, "not_before": now}},
+                upsert=True,
+            )
+            for item in items
+        ]
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def claim(self):
+        now = datetime.now(timezone.utc)
+        return self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "pending", "not_before": {"$lte": now}},
+                    {"status": "processing", "lease_until": {"$lte": now}},
+                ]
+            },
+            {
+                "$set": {
+                    "status": "processing",
+                    "owner": self.owner,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("enqueued_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def complete(self, item, outcome: str) -> None:
+        self.collection.update_one(
+            {"_id": item["_id"], "owner": self.owner},
+            {"$set": {"status": "done", "outcome": outcome, "finished_at": datetime.now(timezone.utc)}},
+        )
+
+    def retry(self, item, error: str) -> None:
+        now = datetime.now(timezone.utc)
+        if item["attempts"] >= self.max_attempts:
+            update = {"status": "failed", "error": error, "finished_at": now}
+        else:
+            delay = self.retry_delay_seconds * 2 ** (item["attempts"] - 1)
+            update = {"status": "pending", "error": error, "not_before": now + timedelta(seconds=delay)}
+        self.collection.update_one({"_id": item["_id"], "owner": self.owner}, {"$set": update})
+
+    async def drain(self, process, concurrency: int = 2, limit: int = 100) -> int:
+        """Claim and process up to ``limit`` items, at most ``concurrency`` at a time.
+
+        ``process(item)`` is awaited and returns the outcome recorded on the
+        item; an exception schedules a retry. Returns the number of claimed items.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = []
+
+        async def run(item):
+            try:
+                outcome = await process(item)
+                await asyncio.to_thread(self.complete, item, outcome)
+            except Exception as exc:
+                logging.exception("[MYWIN][REANALYSIS] failed id=%s attempts=%s", item["_id"], item["attempts"])
+                await asyncio.to_thread(self.retry, item, repr(exc))
+            finally:
+                semaphore.release()
+
+        while len(tasks) < limit:
+            await semaphore.acquire()
+            item = await asyncio.to_thread(self.claim)
+            if item is None:
+                semaphore.release()
+                break
+            tasks.append(asyncio.get_running_loop().create_task(run(item)))
+        await asyncio.gather(*tasks)
+        if tasks:
+            logging.info("[MYWIN][REANALYSIS] drained items=%s", len(tasks))
+        return len(tasks)
@@ -0,0 +1,116 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING
+
+from mywin_quality import MyWinImageQualityConfig
+
+HASHES_CREATED_AT_INDEX = "idx_mywin_image_hashes_created_at"
+
+
+def hash_retention_days(cfg: MyWinImageQualityConfig) -> int:
+    """Days a hash record is kept: the dedup lookback plus a safety margin."""
+    return cfg.duplicate_lookback_days + cfg.hash_retention_margin_days
+
+
+def ensure_hash_retention_index(collection, retention_days: int) -> None:
+    """Make the created_at index on mywin_image_hashes a TTL index.
+
+    The plain created_at index is converted in place with collMod (and its
+    expiry updated when the lookback changes), so there is never a window
+    without an index on created_at.
+    """
+    expire_after = int(timedelta(days=retention_days).total_seconds())
+    existing = collection.index_information().get(HASHES_CREATED_AT_INDEX)
+    if existing is None:
+        collection.create_index(
+            [("created_at", ASCENDING)],
+            expireAfterSeconds=expire_after,
+            name=HASHES_CREATED_AT_INDEX,
+        )
+        logging.info(
+            "[MYWIN_RETENTION] ttl_index_created name=%s expire_after_seconds=%s",
+            HASHES_CREATED_AT_INDEX, expire_after,
+        )
+        return
+    if existing.get("expireAfterSeconds") == expire_after:
+        return
+    collection.database.command(
+        "collMod",
+        collection.name,
+        index={"name": HASHES_CREATED_AT_INDEX, "expireAfterSeconds": expire_after},
+    )
+    logging.info(
+        "[MYWIN_RETENTION] ttl_index_updated name=%s expire_after_seconds=%s previous=%s",
+        HASHES_CREATED_AT_INDEX, expire_after, existing.get("expireAfterSeconds"),
+    )
+
+
+def collection_size_stats(collection) -> dict:
+    """Return document count and data/index sizes in bytes, or {} if unavailable."""
+    try:
+        stats = collection.database.command("collStats", collection.name)
+    except Exception:
+        logging.exception("[MYWIN_RETENTION] collStats failed collection=%s", collection.name)
+        return {}
+    return {
+        "count": stats.get("count", 0),
+        "size": stats.get("size", 0),
+        "storage_size": stats.get("storageSize", 0),
+        "total_index_size": stats.get("totalIndexSize", 0),
+    }
+
+
+def prune_image_hashes(
+    collection,
+    retention_days: int,
+    batch_size: int = 1000,
+    pause_seconds: float = 0.2,
+    now: datetime = None,
+) -> int:
+    """Delete hash records older than ``retention_days`` in bounded batches.
+
+    Each batch selects at most ``batch_size`` ids (oldest first, via the
+    created_at index) and deletes them by _id, pausing between batches so the
+    primary is never asked to remove the whole backlog in one operation.
+    Returns the number of deleted records.
+    """
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=retention_days)
+
+    before = collection_size_stats(collection)
+    logging.info(
+        "[MYWIN_RETENTION] prune_start collection=%s cutoff=%s batch_size=%s stats=%s",
+        collection.name, cutoff.isoformat(), batch_size, before,
+    )
+
+    deleted = 0
+    batches = 0
+    while True:
+        ids = [
+            doc["_id"]
+            for doc in collection.find({"created_at": {"$lt": cutoff}}, {"_id": 1})
+            .sort("created_at", ASCENDING)
+            .limit(batch_size)
+        ]
+        if not ids:
+            break
+        result = collection.delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        batches += 1
+        logging.info(
+            "[MYWIN_RETENTION] prune_batch batch=%s deleted=%s total_deleted=%s",
+            batches, result.deleted_count, deleted,
+        )
+        if len(ids) < batch_size:
+            break
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    after = collection_size_stats(collection)
+    logging.info(
+        "[MYWIN_RETENTION] prune_done collection=%s deleted=%s batches=%s before=%s after=%s",
+        collection.name, deleted, batches, before, after,
+    )
+    return deleted
@@ -0,0 +1,124 @@
+import logging
+import os
+import socket
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+@dataclass
+class SettleJob:
+    """An incremental job over ``collection`` ordered by ``_id``.
+
+    ``process_batch(docs) -> rows_affected`` receives at most ``batch_size``
+    documents newer than the job's persisted high-water mark. Documents
+    younger than ``lag_seconds`` are left for the next run so concurrent
+    writers with slightly older ObjectIds are not skipped.
+    """
+
+    name: str
+    collection: object
+    process_batch: Callable[[list], int]
+    interval_seconds: float = 60.0
+    batch_size: int = 500
+    max_batches: int = 20
+    lag_seconds: float = 5.0
+    query: dict = field(default_factory=dict)
+
+
+class SettleScheduler:
+    """Runs :class:`SettleJob` instances under a Mongo lease, one instance at a time.
+
+    ``leases`` holds ``{_id: job name, owner, expires_at}``; a lease is taken
+    with an upsert that only matches an expired lease or one we already own,
+    so a concurrent owner surfaces as DuplicateKeyError. ``checkpoints`` holds
+    each job's high-water mark, advanced after every batch, and ``runs``
+    records one document per run with its duration and row counts.
+    """
+
+    def __init__(self, leases, checkpoints, runs, lease_seconds: float = 300.0, owner: str = None):
+        self.leases = leases
+        self.checkpoints = checkpoints
+        self.runs = runs
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+
+    def _acquire(self, name, now) -> bool:
+        try:
+            self.leases.find_one_and_update(
+                {"_id": name, "$or": [{"expires_at": {"$lte": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def _release(self, name) -> None:
+        self.leases.update_one(
+            {"_id": name, "owner": self.owner},
+            {"$set": {"expires_at": datetime.now(timezone.utc)}},
+        )
+
+    def run_once(self, job: SettleJob):
+        """Run one bounded pass of ``job``; return the run record, or None if another instance holds the lease."""
+        started_at = datetime.now(timezone.utc)
+        if not self._acquire(job.name, started_at):
+            logging.info("[SETTLE] skipped job=%s reason=lease_held", job.name)
+            return None
+
+        started = time.monotonic()
+        checkpoint = self.checkpoints.find_one({"_id": job.name}) or {}
+        high_water_mark = checkpoint.get("high_water_mark")
+        upper_bound = ObjectId.from_datetime(started_at - timedelta(seconds=job.lag_seconds))
+        run = {"job": job.name, "owner": self.owner, "started_at": started_at,
+               "batches": 0, "rows_scanned": 0, "rows_affected": 0, "error": None}
+        try:
+            for _ in range(job.max_batches):
+                id_range = {"$lt": upper_bound}
+                if high_water_mark is not None:
+                    id_range["$gt"] = high_water_mark
+                docs = list(
+                    job.collection.find({**job.query, "_id": id_range})
+                    .sort("_id", ASCENDING)
+                    .limit(job.batch_size)
+                )
+                if not docs:
+                    break
+                run["rows_affected"] += job.process_batch(docs) or 0
+                run["rows_scanned"] += len(docs)
+                run["batches"] += 1
+                high_water_mark = docs[-1]["_id"]
+                self.checkpoints.update_one(
+                    {"_id": job.name},
+                    {"$set": {"high_water_mark": high_water_mark, "updated_at": datetime.now(timezone.utc)}},
+                    upsert=True,
+                )
+                # keep the lease alive for long catch-up runs; if it expired
+                # mid-batch another instance may own the job now, so stop
+                if not self._acquire(job.name, datetime.now(timezone.utc)):
+                    run["error"] = "lease_lost"
+                    logging.warning("[SETTLE] lease_lost job=%s high_water_mark=%s", job.name, high_water_mark)
+                    break
+                if len(docs) < job.batch_size:
+                    break
+        except Exception as exc:
+            run["error"] = repr(exc)
+            logging.exception("[SETTLE] failed job=%s", job.name)
+        finally:
+            self._release(job.name)
+
+        run["duration_ms"] = int((time.monotonic() - started) * 1000)
+        run["high_water_mark"] = high_water_mark
+        self.runs.insert_one(dict(run))
+        logging.info(
+            "[SETTLE] job=%s batches=%s rows_scanned=%s rows_affected=%s duration_ms=%s error=%s",
+            job.name, run["batches"], run["rows_scanned"], run["rows_affected"], run["duration_ms"], run["error"],
+        )
+        return run
@@ -0,0 +1,123 @@
+"""What-if evaluation of image-quality thresholds against stored metrics.
+
+:func:`store_hash_record` keeps each analyzed image's metrics and its
+duplicate outcome next to its hash, and the offline backfill stores metrics
+in the same format on ``mywin_posts``. :func:`evaluate_quality_config`
+streams either source and replays :func:`decide_mywin_image_quality` under a
+candidate config, reporting how the decisions would change, without
+downloading any image again.
+
+Posts are compared with their recorded ``quality_decision``, which also
+reflects admin exemptions and deferred analysis, and replayed as
+non-duplicates (a recorded post passed the duplicate check).
+
+The duplicate outcome is replayed as stored: changing
+``duplicate_hamming_threshold``, ``duplicate_lookback_days`` or
+``duplicate_scope`` would need a pairwise re-comparison of the hashes, which
+this does not do. Only records within the hash retention window are
+available.
+"""
+import dataclasses
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from mywin_quality import (
+    MyWinImageQualityConfig,
+    _parse_bool,
+    _parse_duplicate_scope,
+    decide_mywin_image_quality,
+    expand_metrics,
+)
+
+# where each source keeps the compact metrics, the hash and the recorded decision
+SOURCES = {
+    "hashes": {"metrics": "metrics", "hash": "hash", "decision": "decision", "query": {}},
+    "posts": {"metrics": "image_metrics", "hash": "image_hash", "decision": "quality_decision", "query": {"tag": "mywin"}},
+}
+
+# config fields the replay cannot change (the stored duplicate flag is used as-is)
+_NOT_REPLAYED = ("duplicate_hamming_threshold", "duplicate_lookback_days", "duplicate_scope")
+
+
+def apply_config_overrides(cfg: MyWinImageQualityConfig, overrides: str) -> MyWinImageQualityConfig:
+    """``cfg`` with ``"field=value,field=value"`` applied, values typed like the field."""
+    changes = {}
+    for item in filter(None, (part.strip() for part in overrides.split(","))):
+        name, sep, raw = item.partition("=")
+        name = name.strip()
+        if not sep or not hasattr(cfg, name):
+            raise ValueError(f"unknown quality config override: {item!r}")
+        current = getattr(cfg, name)
+        if name == "duplicate_scope":
+            changes[name] = _parse_duplicate_scope(raw)
+        elif isinstance(current, bool):
+            changes[name] = _parse_bool(raw)
+        else:
+            changes[name] = type(current)(raw.strip())
+    for name in _NOT_REPLAYED:
+        if name in changes:
+            logging.warning("[WHATIF] override_not_replayed field=%s (stored duplicate outcomes are used)", name)
+    return dataclasses.replace(cfg, **changes)
+
+
+def evaluate_quality_config(
+    collection,
+    candidate: MyWinImageQualityConfig,
+    since_days: int = None,
+    batch_size: int = 1000,
+    max_examples: int = 10,
+    source: str = "hashes",
+) -> dict:
+    """Replay stored decisions under ``candidate``; returns transition and reason counts.
+
+    ``collection`` is ``mywin_image_hashes`` for ``source="hashes"`` and
+    ``mywin_posts`` for ``source="posts"`` (see :data:`SOURCES`).
+    """
+    fields = SOURCES[source]
+    query = {**fields["query"], fields["metrics"]: {"$exists": True}}
+    if since_days is not None:
+        query["created_at"] = {"$gte": datetime.now(timezone.utc) - timedelta(days=since_days)}
+    projection = {fields["metrics"]: 1, fields["hash"]: 1, fields["decision"]: 1, "duplicate": 1}
+    cursor = collection.find(query, projection).batch_size(batch_size)
+
+    before, after, transitions, reasons = Counter(), Counter(), Counter(), Counter()
+    examples = []
+    evaluated = 0
+    for doc in cursor:
+        metrics = expand_metrics(doc[fields["metrics"]], doc.get(fields["hash"]))
+        result = decide_mywin_image_quality(metrics, bool(doc.get("duplicate")), candidate)
+        old = doc.get(fields["decision"])
+        evaluated += 1
+        before[old] += 1
+        after[result.decision] += 1
+        reasons[result.reason] += 1
+        if result.decision != old:
+            transitions[f"{old}->{result.decision}"] += 1
+            if len(examples) < max_examples:
+                examples.append({"_id": doc["_id"], "before": old, "after": result.decision, "reason": result.reason})
+
+    report = {
+        "evaluated": evaluated,
+        "changed": sum(transitions.values()),
+        "before": dict(before),
+        "after": dict(after),
+        "transitions": dict(transitions.most_common()),
+        "reasons": dict(reasons.most_common()),
+        "examples": examples,
+    }
+    logging.info(
+        "[WHATIF] source=%s evaluated=%d changed=%d transitions=%s",
+        source, report["evaluated"], report["changed"], report["transitions"],
+    )
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [f"evaluated={report['evaluated']} changed={report['changed']}"]
+    for label in ("before", "after", "transitions", "reasons"):
+        counts = report[label]
+        lines.append(f"{label}: " + (", ".join(f"{key}={n}" for key, n in counts.items()) or "-"))
+    for example in report["examples"]:
+        lines.append(f"  {example['_id']} {example['before']}->{example['after']} ({example['reason']})")
+    return "\n".join(lines)
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import time
+
+
+def shard_key(update) -> int:
+    """Sender id (else chat id, else update id): all updates of one user go to one worker."""
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return update.update_id
+
+
+class WorkerPool:
+    """Fans updates out to ``size`` worker processes, one bounded queue per worker.
+
+    An update goes to worker ``shard_key % size``, so one user's updates
+    (albums included) are handled in order by a single process and per-user
+    in-memory state (rate limiter, album buffer) stays consistent. Workers
+    are spawned (not forked) and run ``target(index, work_queue, processed)``;
+    they share nothing but Mongo and report progress through the
+    ``processed`` counter. A dead worker is restarted on its queue by
+    :meth:`log_stats`.
+    """
+
+    def __init__(self, size: int, target, queue_size: int = 1000):
+        self.size = size
+        self.target = target
+        self._ctx = multiprocessing.get_context("spawn")
+        self.queues = [self._ctx.Queue(maxsize=queue_size) for _ in range(size)]
+        self.processed = [self._ctx.Value("q", 0) for _ in range(size)]
+        self.dispatched = [0] * size
+        self.blocked = 0
+        self.restarts = 0
+        self._processes = [None] * size
+        self._last_stats = (time.monotonic(), [0] * size)
+
+    def start(self) -> None:
+        for index in range(self.size):
+            self._start_worker(index)
+        logging.info("[WORKERS] started size=%d", self.size)
+
+    def _start_worker(self, index) -> None:
+        process = self._ctx.Process(
+            target=self.target,
+            args=(index, self.queues[index], self.processed[index]),
+            name=f"mywin-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def dispatch(self, key: int, payload) -> int:
+        index = key % self.size
+        try:
+            self.queues[index].put_nowait(payload)
+        except queue.Full:
+            # backpressure: the ingress waits instead of dropping updates
+            self.blocked += 1
+            await asyncio.to_thread(self.queues[index].put, payload)
+        self.dispatched[index] += 1
+        return index
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Ask every worker to finish its queue and exit; terminate the ones that do not."""
+        for work_queue in self.queues:
+            work_queue.put(None)
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logging.error("[WORKERS] worker_stuck index=%d; terminating", index)
+                process.terminate()
+                process.join()
+
+    def stats(self) -> list:
+        now = time.monotonic()
+        since, previous = self._last_stats
+        processed = [counter.value for counter in self.processed]
+        elapsed = max(now - since, 1e-9)
+        self._last_stats = (now, processed)
+        return [
+            {
+                "worker": index,
+                "alive": process is not None and process.is_alive(),
+                "dispatched": self.dispatched[index],
+                "processed": processed[index],
+                "backlog": self.dispatched[index] - processed[index],
+                "updates_per_s": round((processed[index] - previous[index]) / elapsed, 2),
+            }
+            for index, process in enumerate(self._processes)
+        ]
+
+    def log_stats(self) -> None:
+        for row in self.stats():
+            logging.info(
+                "[WORKERS] worker=%d alive=%s dispatched=%d processed=%d backlog=%d updates_per_s=%.2f",
+                row["worker"], row["alive"], row["dispatched"], row["processed"], row["backlog"],
+                row["updates_per_s"],
+            )
+            if not row["alive"] and self._processes[row["worker"]] is not None:
+                logging.error("[WORKERS] worker_dead index=%d; restarting", row["worker"])
+                self.restarts += 1
+                self._start_worker(row["worker"])
+        if self.blocked:
+            logging.warning("[WORKERS] dispatch_blocked=%d (queues full)", self.blocked)
+
+
+async def consume(work_queue, handle, processed) -> None:
+    """Worker side: await ``handle(payload)`` for each queued payload, in order, until ``None``."""
+    while True:
+        payload = await asyncio.to_thread(work_queue.get)
+        if payload is None:
+            return
+        try:
+            await handle(payload)
+        except Exception:
+            logging.exception("[WORKERS] update_failed")
+        with processed.get_lock():
+            processed.value += 1
@@ -0,0 +1,203 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, UpdateOne
+
+# xp_events.reason -> (members.kpi counter it feeds, step); a reversal takes the count back
+KPI_BY_REASON = {
+    "mywin_submission": ("mywin", 1),
+    "comeback_submission": ("cbir", 1),
+    "mywin_quality_reversal": ("mywin", -1),
+}
+
+
+def _empty_totals():
+    return {"xp": 0, "events": 0, "mywin": 0, "cbir": 0}
+
+
+class XpTotalsBuffer:
+    """Accumulates per-user XP/KPI increments until the next :meth:`flush`.
+
+    Increments for the same user are merged in memory, so a burst of
+    submissions turns into one ``$inc`` per user on ``xp_totals`` and one on
+    ``members``. Anything not yet flushed when the process dies is recovered by
+    :func:`reconcile_xp_totals`, which rebuilds totals from xp_events.
+    """
+
+    def __init__(self):
+        self._pending = defaultdict(_empty_totals)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, user_id, xp: int, reason: str) -> None:
+        totals = self._pending[user_id]
+        totals["xp"] += xp
+        totals["events"] += 1
+        kpi, step = KPI_BY_REASON.get(reason, (None, 0))
+        if kpi:
+            totals[kpi] += step
+
+    def flush(self, totals_collection, members_collection) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, defaultdict(_empty_totals)
+        now = datetime.now(timezone.utc)
+        totals_ops = []
+        member_ops = []
+        for user_id, inc in pending.items():
+            totals_ops.append(
+                UpdateOne(
+                    {"_id": user_id},
+                    {"$inc": dict(inc), "$set": {"updated_at": now}},
+                    upsert=True,
+                )
+            )
+            kpi_inc = {f"kpi.{k}": inc[k] for k in ("mywin", "cbir") if inc[k]}
+            if kpi_inc:
+                member_ops.append(UpdateOne({"uid": user_id}, {"$inc": kpi_inc}))
+        try:
+            totals_collection.bulk_write(totals_ops, ordered=False)
+            if member_ops:
+                members_collection.bulk_write(member_ops, ordered=False)
+        except Exception:
+            # a partial write may double count on retry; reconciliation repairs it
+            for user_id, inc in pending.items():
+                for key, value in inc.items():
+                    self._pending[user_id][key] += value
+            raise
+        logging.info("[MYWIN][XP_TOTALS] flushed users=%s", len(pending))
+        return len(pending)
+
+
+# job_leases ids of running processes that buffer xp_totals increments
+XP_WRITER_PREFIX = "xp_totals_writer:"
+
+
+def heartbeat_xp_writer(leases, owner: str, ttl_seconds: float) -> None:
+    """Announce a process holding an :class:`XpTotalsBuffer`, for ``ttl_seconds``."""
+    now = datetime.now(timezone.utc)
+    leases.update_one(
+        {"_id": XP_WRITER_PREFIX + owner},
+        {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl_seconds), "updated_at": now}},
+        upsert=True,
+    )
+
+
+def release_xp_writer(leases, owner: str) -> None:
+    leases.delete_one({"_id": XP_WRITER_PREFIX + owner})
+
+
+def active_xp_writers(leases) -> list:
+    """Owners of live XP writer heartbeats."""
+    query = {"_id": {"$regex": f"^{XP_WRITER_PREFIX}"}, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+    return sorted(doc["owner"] for doc in leases.find(query, {"owner": 1}))
+
+
+def reconcile_xp_totals(xp_events, totals_collection, members_collection, chunk_size: int = 1000, apply: bool = False):
+    """Rebuild per-user totals from the xp_events log and report drift.
+
+    xp_events is streamed in user_id order (served by uq_xp_user_unique_key)
+    and compared against xp_totals / members.kpi one chunk of ``chunk_size``
+    users at a time. With ``apply=True`` drifting documents are overwritten
+    with the rebuilt values. Returns a summary dict.
+
+    Only apply while no bot is running (see :func:`active_xp_writers`): a
+    running bot's unflushed :class:`XpTotalsBuffer` increments would be
+    added on top of the rebuilt totals at its next flush.
+    """
+    summary = {"users": 0, "events": 0, "totals_drift": 0, "kpi_drift": 0, "fixed": 0}
+    chunk = {}
+
+    cursor = (
+        xp_events.find({}, {"user_id": 1, "xp": 1, "reason": 1})
+        .sort("user_id", ASCENDING)
+        .batch_size(chunk_size)
+    )
+    current_uid = None
+    for doc in cursor:
+        uid = doc.get("user_id")
+        if uid != current_uid:
+            if len(chunk) >= chunk_size:
+                _reconcile_chunk(chunk, totals_collection, members_collection, apply, summary)
+                chunk = {}
+            current_uid = uid
+            chunk[uid] = _empty_totals()
+        totals = chunk[uid]
+        totals["xp"] += doc.get("xp") or 0
+        totals["events"] += 1
+        kpi, step = KPI_BY_REASON.get(doc.get("reason"), (None, 0))
+        if kpi:
+            totals[kpi] += step
+        summary["events"] += 1
+    if chunk:
+        _reconcile_chunk(chunk, totals_collection, members_collection, apply, summary)
+
+    logging.info("[MYWIN][XP_TOTALS] reconcile_done apply=%s %s", apply, summary)
+    return summary
+
+
+def _reconcile_chunk(chunk, totals_collection, members_collection, apply, summary):
+    uids = list(chunk)
+    summary["users"] += len(uids)
+    stored = {d["_id"]: d for d in totals_collection.find({"_id": {"$in": uids}})}
+    stored_kpi = {
+        d["uid"]: d.get("kpi") or {}
+        for d in members_collection.find({"uid": {"$in": uids}}, {"uid": 1, "kpi": 1})
+    }
+
+    now = datetime.now(timezone.utc)
+    totals_ops = []
+    member_ops = []
+    for uid, rebuilt in chunk.items():
+        current = stored.get(uid) or {}
+        if any((current.get(k) or 0) != v for k, v in rebuilt.items()):
+            summary["totals_drift"] += 1
+            logging.info(
+                "[MYWIN][XP_TOTALS] drift user_id=%s stored=%s rebuilt=%s",
+                uid, {k: current.get(k) for k in rebuilt}, rebuilt,
+            )
+            totals_ops.append(UpdateOne({"_id": uid}, {"$set": {**rebuilt, "updated_at": now}}, upsert=True))
+        if uid in stored_kpi:
+            kpi = stored_kpi[uid]
+            if (kpi.get("mywin") or 0) != rebuilt["mywin"] or (kpi.get("cbir") or 0) != rebuilt["cbir"]:
+                summary["kpi_drift"] += 1
+                member_ops.append(
+                    UpdateOne({"uid": uid}, {"$set": {"kpi.mywin": rebuilt["mywin"], "kpi.cbir": rebuilt["cbir"]}})
+                )
+
+    if apply:
+        if totals_ops:
+            totals_collection.bulk_write(totals_ops, ordered=False)
+        if member_ops:
+            members_collection.bulk_write(member_ops, ordered=False)
+        summary["fixed"] += len(totals_ops) + len(member_ops)
+
+
+def settle_xp_snapshots(snapshots_collection, docs) -> int:
+    """Fold a batch of xp_events into per-user, per-day ``xp_snapshots`` documents.
+
+    Used as the batch processor of the incremental settle job. The batch is
+    merged in memory and written as one unordered bulk of ``$inc`` upserts.
+    A crash between this write and the job checkpoint replays the batch, so
+    the snapshots are at-least-once; rebuild a day from xp_events if needed.
+    """
+    merged = defaultdict(lambda: {"xp": 0, "events": 0})
+    for doc in docs:
+        ts = doc.get("created_at") or doc.get("ts") or doc["_id"].generation_time
+        key = (doc["user_id"], ts.strftime("%Y-%m-%d"))
+        merged[key]["xp"] += doc.get("xp") or 0
+        merged[key]["events"] += 1
+    if not merged:
+        return 0
+    ops = [
+        UpdateOne(
+            {"_id": f"{user_id}:{day}"},
+            {"$inc": inc, "$setOnInsert": {"user_id": user_id, "day": day}},
+            upsert=True,
+        )
+        for (user_id, day), inc in merged.items()
+    ]
+    snapshots_collection.bulk_write(ops, ordered=False)
+    return len(ops)
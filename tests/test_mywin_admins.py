@@ -0,0 +1,75 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from mywin_admins import AdminExemptions
+
+
+class _AdminCache:
+    def __init__(self, docs=None):
+        self.docs = dict(docs or {})
+        self.writes = 0
+
+    def find_one(self, filt):
+        doc = self.docs.get(filt["_id"])
+        if doc and doc["fetched_at"] >= filt["fetched_at"]["$gte"]:
+            return doc
+        return None
+
+    def update_one(self, filt, update, upsert=False):
+        self.writes += 1
+        self.docs[filt["_id"]] = dict(update["$set"])
+
+
+class _Bot:
+    def __init__(self, admin_ids, fail=False):
+        self.admin_ids = admin_ids
+        self.fail = fail
+        self.calls = 0
+
+    async def get_chat_administrators(self, _chat_id):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("telegram down")
+        return [SimpleNamespace(user=SimpleNamespace(id=uid)) for uid in self.admin_ids]
+
+
+class AdminExemptionsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_admin_list_fetched_once_per_ttl_and_persisted(self):
+        cache = _AdminCache()
+        exemptions = AdminExemptions(cache, ttl_seconds=600)
+        bot = _Bot([1, 2])
+        self.assertTrue(await exemptions.is_exempt(bot, 100, 1))
+        self.assertFalse(await exemptions.is_exempt(bot, 100, 3))
+        self.assertEqual(bot.calls, 1)
+        self.assertEqual(cache.docs[100]["admin_ids"], [1, 2])
+
+    async def test_expired_ttl_refetches(self):
+        exemptions = AdminExemptions(_AdminCache(), ttl_seconds=600)
+        bot = _Bot([1])
+        await exemptions.is_exempt(bot, 100, 1)
+        with patch("mywin_admins.time.monotonic", return_value=10**9):
+            await exemptions.is_exempt(bot, 100, 1)
+        self.assertEqual(bot.calls, 2)
+
+    async def test_warm_restart_uses_persisted_list(self):
+        cache = _AdminCache({100: {"admin_ids": [5], "fetched_at": datetime.now(timezone.utc) - timedelta(seconds=30)}})
+        bot = _Bot([])
+        self.assertTrue(await AdminExemptions(cache, ttl_seconds=600).is_exempt(bot, 100, 5))
+        self.assertEqual(bot.calls, 0)
+
+    async def test_whitelist_needs_no_lookup(self):
+        bot = _Bot([], fail=True)
+        self.assertTrue(await AdminExemptions(_AdminCache(), whitelist={9}).is_exempt(bot, 100, 9))
+        self.assertEqual(bot.calls, 0)
+
+    async def test_fetch_failure_is_not_exempt(self):
+        cache = _AdminCache()
+        with self.assertLogs(level="WARNING"):
+            self.assertFalse(await AdminExemptions(cache).is_exempt(_Bot([1], fail=True), 100, 1))
+        self.assertEqual(cache.writes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
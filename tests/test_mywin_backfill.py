@@ -0,0 +1,164 @@
+import io
+import json
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bson import ObjectId
+from PIL import Image
+from telegram import Bot
+
+import mywin_download
+from mywin_backfill import bot_fetcher, run_backfill
+
+TOKEN = "123:stub"
+
+
+def _jpeg(color):
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class StubBotApi(BaseHTTPRequestHandler):
+    """getMe / getFile and the file download of a local Bot API stand-in."""
+
+    files = {}
+
+    def log_message(self, *_args):
+        pass
+
+    def _reply(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(raw or "{}")
+        else:
+            params = {k: v[0] for k, v in urllib.parse.parse_qs(raw).items()}
+        if self.path.endswith("/getMe"):
+            result = {"id": 123, "is_bot": True, "first_name": "stub", "username": "stub_bot"}
+        elif self.path.endswith("/getFile"):
+            file_id = params["file_id"]
+            result = {"file_id": file_id, "file_unique_id": f"u{file_id}", "file_path": f"photos/{file_id}.jpg"}
+        else:
+            self._reply(404, b'{"ok":false,"error_code":404,"description":"Not Found"}')
+            return
+        self._reply(200, json.dumps({"ok": True, "result": result}).encode())
+
+    def do_GET(self):
+        file_id = self.path.rsplit("/", 1)[-1].removesuffix(".jpg")
+        if file_id not in self.files:
+            self._reply(404, b"missing", "text/plain")
+            return
+        self._reply(200, self.files[file_id], "image/jpeg")
+
+
+class _Cursor(list):
+    def sort(self, *_args):
+        return _Cursor(sorted(self, key=lambda d: d["_id"]))
+
+    def limit(self, n):
+        return _Cursor(self[:n])
+
+
+class FakePosts:
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.bulk_calls = []
+
+    def _match(self, doc, query):
+        if "media_file_id" in query and "media_file_id" not in doc:
+            return False
+        after = query.get("_id", {}).get("$gt")
+        return after is None or doc["_id"] > after
+
+    def count_documents(self, query):
+        return sum(1 for doc in self.docs.values() if self._match(doc, query))
+
+    def find(self, query, _projection=None):
+        return _Cursor(dict(doc) for doc in self.docs.values() if self._match(doc, query))
+
+    def bulk_write(self, ops, ordered=True):
+        self.bulk_calls.append((len(ops), ordered))
+        for op in ops:
+            doc = self.docs[op._filter["_id"]]
+            doc.update(op._doc["$set"])
+            for key in op._doc.get("$unset", {}):
+                doc.pop(key, None)
+
+
+class FakeCheckpoints:
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"]})
+        doc.update(update["$set"])
+        for key, value in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + value
+
+
+class BackfillTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        StubBotApi.files = {"red": _jpeg("red"), "blue": _jpeg("blue"), "green": _jpeg("green")}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubBotApi)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.bot = Bot(TOKEN, base_url=f"{base}/bot", base_file_url=f"{base}/file/bot")
+        await self.bot.initialize()
+        self.addAsyncCleanup(self.bot.shutdown)
+        self.addAsyncCleanup(self._close_download_client)
+
+    async def _close_download_client(self):
+        # the shared download client is bound to this test's event loop
+        if mywin_download._client is not None:
+            await mywin_download._client.aclose()
+            mywin_download._client = None
+
+    async def test_resumable_backfill_against_stub_file_server(self):
+        ids = [ObjectId() for _ in range(5)]
+        posts = FakePosts([
+            {"_id": ids[0], "media_file_id": "red"},
+            {"_id": ids[1], "file_id": "legacy-only-unique-id"},
+            {"_id": ids[2], "media_file_id": "blue"},
+            {"_id": ids[3], "media_file_id": "missing"},
+            {"_id": ids[4], "media_file_id": "green"},
+        ])
+        checkpoints = FakeCheckpoints()
+        fetch = bot_fetcher(self.bot, max_bytes=1_000_000)
+
+        with self.assertLogs(level="INFO"):
+            first = await run_backfill(posts, checkpoints, fetch, batch_size=2, processes=2, limit=2)
+        self.assertEqual((first["done"], first["total"]), (2, 2))
+        self.assertEqual(checkpoints.docs["backfill_image_metrics"]["high_water_mark"], ids[2])
+
+        with self.assertLogs(level="INFO") as captured:
+            second = await run_backfill(posts, checkpoints, fetch, batch_size=2, processes=2)
+        self.assertEqual((second["done"], second["failed"], second["total"]), (2, 1, 2))
+        self.assertIn("eta_s=0", "\n".join(captured.output))
+        self.assertEqual(checkpoints.docs["backfill_image_metrics"]["processed"], 4)
+
+        by_file = {doc["media_file_id"]: doc for doc in posts.docs.values() if "media_file_id" in doc}
+        self.assertEqual(by_file["red"]["image_metrics"]["w"], 64)
+        self.assertEqual(len(by_file["green"]["image_hash"]), 16)
+        self.assertNotIn("image_metrics", by_file["missing"])
+        self.assertIn("download", posts.docs[ids[3]]["image_metrics_error"])
+        self.assertNotIn(TOKEN, posts.docs[ids[3]]["image_metrics_error"])
+        self.assertNotIn("image_metrics", posts.docs[ids[1]])
+        self.assertTrue(all(ordered is False for _, ordered in posts.bulk_calls))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+import main
+from mywin_cachesync import CacheSync, PostedFileIds, RecentHashIndex
+
+
+def _hash_doc(image_hash, chat_id=1, user_id=1, age=timedelta(0)):
+    return {
+        "_id": ObjectId(),
+        "hash": image_hash,
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "created_at": datetime.now(timezone.utc) - age,
+    }
+
+
+class _Cursor(list):
+    def sort(self, *_args):
+        return _Cursor(sorted(self, key=lambda d: d["_id"]))
+
+    def limit(self, n):
+        return _Cursor(self[:n])
+
+
+class StandaloneCollection:
+    """A collection on a standalone server: no change streams, find by _id range."""
+
+    name = "mywin_image_hashes"
+
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self._lock = threading.Lock()
+
+    def watch(self, *_args, **_kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+    def insert_one(self, doc):
+        with self._lock:
+            doc.setdefault("_id", ObjectId())
+            self.docs.append(doc)
+
+    def find(self, query=None, *_args):
+        with self._lock:
+            docs = list(self.docs)
+        since = (query or {}).get("_id", {}).get("$gt")
+        return _Cursor(d for d in docs if since is None or d["_id"] > since)
+
+
+class RecentHashIndexTests(unittest.TestCase):
+    def test_scoped_matches_and_batch_duplicates(self):
+        index = RecentHashIndex(lookback_days=7)
+        index.seed([_hash_doc("ffffffffffffffff", chat_id=1), _hash_doc("0000000000000000", chat_id=2)])
+        self.assertTrue(index.covers(7))
+        self.assertEqual(
+            index.find_near(["fffffffffffffff0", "0000000000000000", "0000000000000001"], 4, 7, scope="chat", chat_id=1),
+            [True, False, True],
+        )
+        self.assertEqual(index.find_near(["0000000000000000"], 4, 7, scope="user", user_id=2), [False])
+
+    def test_old_records_expire_and_echoes_are_ignored(self):
+        index = RecentHashIndex(lookback_days=7)
+        doc = _hash_doc("ffffffffffffffff")
+        index.seed([_hash_doc("0000000000000000", age=timedelta(days=8)), doc])
+        index.add(dict(doc))  # own write coming back through the stream
+        self.assertEqual(len(index), 1)
+
+    def test_eviction_inside_the_window_disables_the_index(self):
+        index = RecentHashIndex(lookback_days=7, max_size=2)
+        self.assertFalse(index.covers(7))
+        index.seed([_hash_doc(f"{i:016x}") for i in range(3)])
+        self.assertFalse(index.covers(7))
+        self.assertFalse(index.covers(8))
+
+    def test_posted_file_ids_are_positive_only(self):
+        posted = PostedFileIds(max_size=2)
+        posted.add_post({"file_id": "a", "album_file_ids": ["b", "c"]})
+        self.assertTrue(posted.contains_all(["b", "c"]))
+        self.assertFalse(posted.contains_all(["a"]))
+
+
+class PollingFallbackTests(unittest.IsolatedAsyncioTestCase):
+    async def test_standalone_server_is_polled_and_lag_reported(self):
+        collection = StandaloneCollection([_hash_doc("ffffffffffffffff")])
+        index = RecentHashIndex(lookback_days=7)
+        sync = CacheSync(poll_interval_seconds=0.01, max_lag_seconds=5.0)
+        sync.add(collection, index.add, seed=index.seed)
+        with self.assertLogs(level="INFO") as captured:
+            sync.start(asyncio.get_running_loop())
+            self.addCleanup(sync.stop)
+            await _until(lambda: index.seeded)
+            collection.insert_one(_hash_doc("0000000000000000", chat_id=9))
+            await _until(lambda: len(index) == 2)
+        self.assertIn("change_streams_unavailable", "\n".join(captured.output))
+        stats = sync.stats()["mywin_image_hashes"]
+        self.assertEqual((stats["mode"], stats["applied"]), ("polling", 1))
+        self.assertIsNotNone(stats["lag_ms"])
+        self.assertTrue(sync.is_fresh())
+        self.assertEqual(index.find_near(["0000000000000000"], 0, 7, scope="chat", chat_id=9), [True])
+
+
+class DuplicateLookupTests(unittest.TestCase):
+    def test_fresh_index_answers_without_querying_mongo(self):
+        index = RecentHashIndex(lookback_days=30)
+        index.seed([_hash_doc("ffffffffffffffff")])
+        cfg = SimpleNamespace(duplicate_hamming_threshold=4, duplicate_lookback_days=30, duplicate_scope="global")
+        fresh = SimpleNamespace(is_fresh=lambda: True)
+        with patch.object(main, "hash_index", index), patch.object(main, "cache_sync", fresh), \
+                patch.object(main, "find_near_duplicate_hashes", side_effect=AssertionError("queried")):
+            self.assertEqual(main._find_duplicates(["ffffffffffffffff"], cfg, chat_id=1, user_id=1), [True])
+        stale = SimpleNamespace(is_fresh=lambda: False)
+        with patch.object(main, "hash_index", index), patch.object(main, "cache_sync", stale), \
+                patch.object(main, "find_near_duplicate_hashes", return_value=[False]) as query:
+            self.assertEqual(main._find_duplicates(["ffffffffffffffff"], cfg, chat_id=1, user_id=1), [False])
+        query.assert_called_once()
+
+
+@unittest.skipUnless(os.environ.get("MYWIN_TEST_REPLICA_SET_URL"), "needs a replica set, e.g. mongod --replSet rs0")
+class ChangeStreamTests(unittest.IsolatedAsyncioTestCase):
+    """Against a local single-node replica set:
+
+        mongod --replSet rs0 --dbpath /tmp/rs0 && mongosh --eval 'rs.initiate()'
+        MYWIN_TEST_REPLICA_SET_URL=mongodb://localhost:27017/?replicaSet=rs0 python -m pytest tests/test_mywin_cachesync.py
+    """
+
+    async def test_insert_from_another_instance_is_applied(self):
+        from pymongo import MongoClient
+
+        client = MongoClient(os.environ["MYWIN_TEST_REPLICA_SET_URL"])
+        self.addCleanup(client.close)
+        collection = client["mywin_cachesync_test"]["mywin_image_hashes"]
+        collection.drop()
+        self.addCleanup(collection.drop)
+        index = RecentHashIndex(lookback_days=7)
+        sync = CacheSync(poll_interval_seconds=0.1)
+        sync.add(collection, index.add, seed_query={}, seed=index.seed)
+        sync.start(asyncio.get_running_loop())
+        self.addCleanup(sync.stop)
+        await _until(lambda: index.seeded and sync.is_fresh())
+        await asyncio.to_thread(collection.insert_one, _hash_doc("ffffffffffffffff"))
+        await _until(lambda: len(index) == 1)
+        self.assertEqual(sync.stats()["mywin_image_hashes"]["mode"], "change_stream")
+
+
+async def _until(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not reached")
+        await asyncio.sleep(0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
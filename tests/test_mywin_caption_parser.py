@@ -11,6 +11,7 @@ class ParseMyWinCaptionTests(unittest.TestCase):
             {
                 "tag": "mywin",
                 "game_name": "Zeus Rising",
+                "game_key": "zeus rising",
                 "playback_url": None,
                 "playback_id": None,
                 "submission_format": "tag_and_game",
@@ -35,6 +36,7 @@ class ParseMyWinCaptionTests(unittest.TestCase):
             {
                 "tag": "mywin",
                 "game_name": None,
+                "game_key": None,
                 "playback_url": "https://rx.apreplay.com/aT1oUdG2IV",
                 "playback_id": "aT1oUdG2IV",
                 "submission_format": "playback_url_only",
@@ -49,6 +51,7 @@ class ParseMyWinCaptionTests(unittest.TestCase):
             {
                 "tag": "mywin",
                 "game_name": "Zeus Rising",
+                "game_key": "zeus rising",
                 "playback_url": "https://rx.apreplay.com/aT1oUdG2IV",
                 "playback_id": "aT1oUdG2IV",
                 "submission_format": "tag_game_and_playback",
@@ -156,5 +159,20 @@ class ValidatePlaybackUrlTests(unittest.TestCase):
         self.assertIsNone(main.validate_playback_url("https://rx.apreplay.com/abc$%^123"))
 
 
+class NormalizeGameKeyTests(unittest.TestCase):
+    def test_case_and_whitespace_folded(self):
+        self.assertEqual(main.normalize_game_key("  Zeus   RISING "), "zeus rising")
+        self.assertEqual(main.normalize_game_key("zeus\trising"), "zeus rising")
+
+    def test_empty_name_has_no_key(self):
+        self.assertIsNone(main.normalize_game_key(None))
+        self.assertIsNone(main.normalize_game_key("   "))
+
+    def test_parser_variants_share_game_key(self):
+        a = main.parse_mywin_caption("#mywin Zeus  Rising")
+        b = main.parse_mywin_caption("#COMEBACKISREAL zeus rising")
+        self.assertEqual(a["game_key"], b["game_key"])
+
+
 if __name__ == "__main__":
     unittest.main()
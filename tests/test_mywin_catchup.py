@@ -0,0 +1,150 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import main
+from mywin_album import MediaGroupBuffer
+from mywin_catchup import InsertBatcher, drain_pending_updates
+
+
+class FakeBot:
+    """getUpdates over a fixed backlog; an offset confirms everything below it."""
+
+    def __init__(self, count):
+        self.backlog = [SimpleNamespace(update_id=i) for i in range(1, count + 1)]
+        self.calls = []
+
+    async def get_updates(self, offset=None, limit=100, timeout=0):
+        self.calls.append((offset, limit, timeout))
+        if offset is not None:
+            self.backlog = [u for u in self.backlog if u.update_id >= offset]
+        return self.backlog[:limit]
+
+
+class FakeBulkCollection:
+    name = "xp_events"
+
+    def __init__(self, duplicate_indexes=()):
+        self.duplicate_indexes = set(duplicate_indexes)
+        self.calls = []
+
+    def insert_many(self, docs, ordered=True):
+        self.calls.append((list(docs), ordered))
+        if self.duplicate_indexes:
+            raise BulkWriteError({"writeErrors": [
+                {"index": i, "code": 11000, "errmsg": "E11000 duplicate key"} for i in sorted(self.duplicate_indexes)
+            ]})
+
+
+class DrainTests(unittest.IsolatedAsyncioTestCase):
+    async def test_backlog_is_drained_in_batches_and_confirmed(self):
+        bot = FakeBot(250)
+        processed = []
+        in_flight = peak = 0
+        flushes = []
+
+        async def process(update):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0)
+            processed.append(update.update_id)
+            in_flight -= 1
+
+        async def after_batch():
+            flushes.append(len(processed))
+
+        with self.assertLogs(level="INFO") as captured:
+            result = await drain_pending_updates(bot, process, concurrency=8, after_batch=after_batch)
+
+        self.assertEqual(sorted(processed), list(range(1, 251)))
+        self.assertEqual(flushes, [100, 200, 250])
+        self.assertEqual(peak, 8)
+        self.assertEqual((result["drained"], result["batches"], result["stopped"]), (250, 3, "empty"))
+        self.assertEqual(bot.calls[-1], (251, 1, 0))
+        self.assertEqual(bot.backlog, [])
+        self.assertIn("[CATCHUP] done drained=250", captured.output[-1])
+
+    async def test_empty_backlog_confirms_nothing(self):
+        bot = FakeBot(0)
+        result = await drain_pending_updates(bot, None)
+        self.assertEqual(result["drained"], 0)
+        self.assertEqual(bot.calls, [(None, 100, 0)])
+
+    async def test_time_budget_leaves_the_rest_to_polling(self):
+        bot = FakeBot(150)
+
+        async def process(_update):
+            pass
+
+        ticks = iter([0.0, 0.0, 10.0, 10.0])
+        result = await drain_pending_updates(bot, process, max_seconds=5.0, clock=lambda: next(ticks))
+        self.assertEqual((result["drained"], result["stopped"]), (100, "time_budget"))
+        self.assertEqual([u.update_id for u in bot.backlog], list(range(101, 151)))
+
+
+class InsertBatcherTests(unittest.TestCase):
+    def test_unordered_batch_skips_duplicates(self):
+        collection = FakeBulkCollection(duplicate_indexes={1})
+        batcher = InsertBatcher()
+        inserted, duplicates = [], []
+        for i in range(3):
+            batcher.add(collection, {"n": i}, lambda i=i: inserted.append(i), lambda i=i: duplicates.append(i))
+        self.assertEqual(len(batcher), 3)
+        self.assertEqual(batcher.flush(), 2)
+        self.assertEqual((inserted, duplicates), ([0, 2], [1]))
+        self.assertEqual(len(collection.calls), 1)
+        self.assertFalse(collection.calls[0][1])
+        self.assertEqual(batcher.stats(), {"inserted": 2, "duplicates": 1, "errors": 0})
+        self.assertEqual(batcher.flush(), 0)
+
+    def test_connection_failure_keeps_inserts_for_the_next_flush(self):
+        down = FakeBulkCollection()
+        down.insert_many = lambda docs, ordered=True: (_ for _ in ()).throw(AutoReconnect("connection reset"))
+        batcher = InsertBatcher()
+        inserted = []
+        for n in range(2):
+            batcher.add(down, {"n": n}, lambda n=n: inserted.append(n))
+        with self.assertRaises(AutoReconnect):
+            batcher.flush()
+        self.assertEqual((len(batcher), inserted), (2, []))
+        batcher.add(down, {"n": 2}, lambda: inserted.append(2))
+        del down.insert_many  # back up
+        self.assertEqual(batcher.flush(), 3)
+        self.assertEqual(inserted, [0, 1, 2])
+        self.assertEqual([doc["n"] for doc in down.calls[0][0]], [0, 1, 2])
+
+    def test_submission_writes_are_batched_while_catching_up(self):
+        collection = FakeBulkCollection()
+        batcher = InsertBatcher()
+        recorded = []
+        with patch.object(main, "_catchup_writes", batcher):
+            main._insert_unique(collection, {"n": 1}, lambda: recorded.append(1))
+        self.assertEqual((collection.calls, recorded), ([], []))
+        batcher.flush()
+        self.assertEqual(recorded, [1])
+
+
+class AlbumBoundaryTests(unittest.IsolatedAsyncioTestCase):
+    async def test_album_straddling_batches_is_flushed_once(self):
+        flushed = []
+
+        async def on_flush(messages, _context):
+            flushed.append([m.message_id for m in messages])
+
+        buffer = MediaGroupBuffer(60, on_flush)
+        with patch.object(main, "media_group_buffer", buffer), patch.object(main, "lane_dispatcher", None), \
+                patch.object(main, "_catchup_writes", InsertBatcher()):
+            buffer.add("g1", SimpleNamespace(message_id=1), None)
+            await main._flush_catchup_writes()  # end of the first getUpdates batch
+            self.assertEqual((flushed, len(buffer)), ([], 1))
+            buffer.add("g1", SimpleNamespace(message_id=2), None)
+            await main._flush_catchup_writes(final=True)
+        self.assertEqual(flushed, [[1, 2]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from types import SimpleNamespace
+
+import httpx
+
+from mywin_download import DownloadError, download_bounded
+from mywin_quality import ImageTooLarge
+
+
+def _client(body, headers=None):
+    def handler(_request):
+        return httpx.Response(200, content=body, headers=headers or {})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def _file(file_size=None, file_path="https://api.telegram.org/file/botTOKEN/photos/file_1.jpg"):
+    return SimpleNamespace(file_size=file_size, file_path=file_path)
+
+
+class BoundedDownloadTests(unittest.IsolatedAsyncioTestCase):
+    async def test_download_within_cap_returns_rewound_buffer(self):
+        async with _client(b"x" * 5000) as client:
+            buf = await download_bounded(_file(), max_bytes=10_000, client=client)
+        with buf:
+            self.assertEqual(buf.read(), b"x" * 5000)
+
+    async def test_failed_download_never_exposes_the_token(self):
+        def not_found(_request):
+            return httpx.Response(404)
+
+        def unreachable(request):
+            raise httpx.ConnectError("connection refused", request=request)
+
+        for handler, status in ((not_found, 404), (unreachable, None)):
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                with self.assertRaises(DownloadError) as ctx:
+                    await download_bounded(_file(), max_bytes=10_000, client=client)
+            self.assertEqual(ctx.exception.status_code, status)
+            self.assertNotIn("TOKEN", f"{ctx.exception} {ctx.exception!r}")
+            self.assertIn("/file/bot<redacted>/photos/file_1.jpg", str(ctx.exception))
+            self.assertIsNone(ctx.exception.__cause__)
+            self.assertTrue(ctx.exception.__suppress_context__)
+
+    async def test_declared_file_size_over_cap_skips_download(self):
+        def handler(_request):
+            raise AssertionError("must not download")
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with self.assertRaises(ImageTooLarge) as ctx:
+                await download_bounded(_file(file_size=20_000), max_bytes=10_000, client=client)
+        self.assertEqual(ctx.exception.reason, "file_too_large")
+
+    async def test_undeclared_oversized_body_aborts(self):
+        async def stream():
+            for _ in range(10):
+                yield b"x" * 4096
+
+        def handler(_request):
+            return httpx.Response(200, content=stream())
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with self.assertRaises(ImageTooLarge):
+                await download_bounded(_file(), max_bytes=10_000, client=client)
+
+    async def test_content_length_over_cap_aborts(self):
+        async with _client(b"x" * 20_000) as client:
+            with self.assertRaises(ImageTooLarge):
+                await download_bounded(_file(), max_bytes=10_000, client=client)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from datetime import datetime, timezone
+
+from mywin_games import GameStatsBuffer, period_start, top_games
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction):
+        return _Cursor(sorted(self.docs, key=lambda d: d[key], reverse=direction < 0))
+
+    def limit(self, n):
+        return _Cursor(self.docs[:n])
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class _GameStats:
+    def __init__(self, docs=None):
+        self.docs = docs or []
+        self.ops = []
+        self.queries = []
+
+    def bulk_write(self, ops, ordered=True):
+        self.ops.extend(ops)
+
+    def find(self, query, _projection):
+        self.queries.append(query)
+        return _Cursor([d for d in self.docs if all(d.get(k) == v for k, v in query.items())])
+
+
+# Wednesday
+TS = datetime(2026, 3, 4, 15, tzinfo=timezone.utc)
+
+
+class GameStatsTests(unittest.TestCase):
+    def test_week_bucket_starts_on_monday(self):
+        self.assertEqual(period_start("day", TS), "2026-03-04")
+        self.assertEqual(period_start("week", TS), "2026-03-02")
+
+    def test_record_merges_into_day_and_week_buckets(self):
+        buffer = GameStatsBuffer()
+        buffer.record("zeus rising", "Zeus Rising", "mywin", TS)
+        buffer.record("zeus rising", "zeus rising", "comebackisreal", TS)
+        buffer.record(None, None, "mywin", TS)
+        stats = _GameStats()
+        self.assertEqual(buffer.flush(stats), 2)
+        week = next(op for op in stats.ops if op._filter["_id"].startswith("week:"))
+        self.assertEqual(week._doc["$inc"], {"submissions": 2, "mywin": 1, "cbir": 1})
+        self.assertEqual(week._doc["$setOnInsert"]["game_name"], "Zeus Rising")
+
+    def test_top_games_reads_one_bucket_ordered(self):
+        stats = _GameStats([
+            {"period": "week", "period_start": "2026-03-02", "game_key": "a", "submissions": 3},
+            {"period": "week", "period_start": "2026-03-02", "game_key": "b", "submissions": 9},
+            {"period": "week", "period_start": "2026-02-23", "game_key": "c", "submissions": 50},
+        ])
+        result = top_games(stats, now=TS, limit=5)
+        self.assertEqual([r["game_key"] for r in result], ["b", "a"])
+        self.assertEqual(stats.queries[0], {"period": "week", "period_start": "2026-03-02"})
+
+
+if __name__ == "__main__":
+    unittest.main()
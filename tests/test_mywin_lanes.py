@@ -0,0 +1,83 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import main
+from mywin_lanes import LaneDispatcher
+from mywin_quality import MyWinImageQualityConfig
+
+
+def _message(caption, photo=True):
+    return SimpleNamespace(
+        caption=caption,
+        photo=[SimpleNamespace(file_unique_id="p", file_id="p_full")] if photo else None,
+        document=None,
+    )
+
+
+class LaneDispatcherTests(unittest.IsolatedAsyncioTestCase):
+    async def test_busy_analysis_lane_does_not_block_cheap_lanes(self):
+        dispatcher = LaneDispatcher({"delete": 1, "accept": 1, "analysis": 1})
+        release = asyncio.Event()
+        finished = []
+
+        async def heavy(name):
+            await release.wait()
+            finished.append(name)
+
+        async def cheap(name):
+            finished.append(name)
+
+        dispatcher.submit("analysis", heavy, "a1")
+        dispatcher.submit("analysis", heavy, "a2")
+        dispatcher.submit("accept", cheap, "c1")
+        dispatcher.submit("delete", cheap, "d1")
+        for _ in range(5):
+            await asyncio.sleep(0)
+        self.assertEqual(finished, ["c1", "d1"])
+        stats = dispatcher.stats()["analysis"]
+        self.assertEqual((stats["running"], stats["queued"]), (1, 1))
+
+        release.set()
+        await dispatcher.drain()
+        self.assertEqual(sorted(finished), ["a1", "a2", "c1", "d1"])
+
+    async def test_failures_are_counted_and_latencies_recorded(self):
+        dispatcher = LaneDispatcher({"delete": 2, "accept": 2, "analysis": 2})
+
+        async def boom():
+            raise RuntimeError("mongo down")
+
+        async def ok():
+            return None
+
+        dispatcher.submit("accept", boom)
+        dispatcher.submit("accept", ok)
+        with self.assertLogs(level="ERROR"):
+            await dispatcher.drain()
+        stats = dispatcher.stats()
+        self.assertEqual((stats["accept"]["done"], stats["accept"]["failed"]), (1, 1))
+        self.assertIsNotNone(stats["accept"]["latency_p95_ms"])
+        self.assertIsNone(stats["analysis"]["latency_p50_ms"])
+
+
+class SubmissionLaneTests(unittest.TestCase):
+    def _lane(self, messages, enabled=True):
+        with patch.object(main, "load_mywin_quality_config", return_value=MyWinImageQualityConfig(enabled=enabled)):
+            return main._submission_lane(messages)
+
+    def test_invalid_caption_is_a_cheap_delete(self):
+        self.assertEqual(self._lane([_message("hello")]), "delete")
+        self.assertEqual(self._lane([_message("#mywin Zeus", photo=False)]), "delete")
+
+    def test_comeback_and_unfiltered_mywin_skip_analysis(self):
+        self.assertEqual(self._lane([_message("#comebackisreal Zeus")]), "accept")
+        self.assertEqual(self._lane([_message("#mywin Zeus")], enabled=False), "accept")
+
+    def test_filtered_mywin_needs_analysis_using_album_caption(self):
+        self.assertEqual(self._lane([_message(None), _message("#mywin Zeus")]), "analysis")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import main
+from mywin_catchup import InsertBatcher
+from mywin_load import LoadShedder
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _shedder(clock):
+    return LoadShedder(
+        inflight_thresholds=(2, 4, 6),
+        queue_age_thresholds=(5.0, 10.0, 20.0),
+        exit_ratio=0.5,
+        min_dwell_seconds=10.0,
+        smoothing=1.0,  # no smoothing: queue age is the last observation
+        clock=clock,
+    )
+
+
+class LoadShedderTests(unittest.TestCase):
+    def test_full_mode_under_thresholds(self):
+        shedder = _shedder(_Clock())
+        shedder.observe_queue_age(1.0)
+        self.assertEqual(shedder.select_mode(), "full")
+        self.assertEqual(shedder.transitions, {})
+
+    def test_escalates_immediately_to_highest_exceeded_level(self):
+        shedder = _shedder(_Clock())
+        shedder.observe_queue_age(12.0)
+        with self.assertLogs(level="WARNING") as captured:
+            self.assertEqual(shedder.select_mode(), "metadata_only")
+        self.assertIn("from=full to=metadata_only", captured.output[0])
+        self.assertEqual(shedder.transitions[("full", "metadata_only")], 1)
+
+    def test_in_flight_analyses_drive_the_mode(self):
+        shedder = _shedder(_Clock())
+        with shedder.track(), shedder.track():
+            self.assertEqual(shedder.select_mode(), "hash_only")
+        self.assertEqual(shedder.in_flight, 0)
+
+    def test_recovery_needs_exit_threshold_and_dwell_one_level_at_a_time(self):
+        clock = _Clock()
+        shedder = _shedder(clock)
+        shedder.observe_queue_age(25.0)
+        self.assertEqual(shedder.select_mode(), "defer")
+
+        # below the defer entry threshold but above its exit threshold: stays
+        shedder.observe_queue_age(15.0)
+        clock.now = 100.0
+        self.assertEqual(shedder.select_mode(), "defer")
+
+        shedder.observe_queue_age(1.0)
+        self.assertEqual(shedder.select_mode(), "defer")  # calm period starts
+        clock.now = 105.0
+        self.assertEqual(shedder.select_mode(), "defer")
+        clock.now = 110.0
+        self.assertEqual(shedder.select_mode(), "metadata_only")
+        clock.now = 115.0
+        self.assertEqual(shedder.select_mode(), "metadata_only")
+        clock.now = 120.0
+        self.assertEqual(shedder.select_mode(), "hash_only")
+
+    def test_load_spike_resets_the_calm_period(self):
+        clock = _Clock()
+        shedder = _shedder(clock)
+        shedder.observe_queue_age(6.0)
+        shedder.select_mode()
+        shedder.observe_queue_age(1.0)
+        shedder.select_mode()
+        clock.now = 8.0
+        shedder.observe_queue_age(4.0)  # under entry, over exit threshold
+        shedder.select_mode()
+        shedder.observe_queue_age(1.0)
+        clock.now = 12.0
+        self.assertEqual(shedder.select_mode(), "hash_only")
+        clock.now = 22.0
+        self.assertEqual(shedder.select_mode(), "full")
+
+    def test_stats_count_submissions_per_mode(self):
+        shedder = _shedder(_Clock())
+        shedder.select_mode()
+        shedder.observe_queue_age(30.0)
+        shedder.select_mode()
+        stats = shedder.stats()
+        self.assertEqual(stats["submissions_by_mode"], {"full": 1, "defer": 1})
+        self.assertEqual(stats["transitions"], {"full->defer": 1})
+
+
+class CatchUpQueueAgeTests(unittest.TestCase):
+    def test_backlog_age_is_not_observed_while_catching_up(self):
+        shedder = _shedder(_Clock())
+        message = SimpleNamespace(date=datetime.now(timezone.utc) - timedelta(hours=2))
+        with patch.object(main, "load_shedder", shedder):
+            with patch.object(main, "_catchup_writes", InsertBatcher()):
+                self.assertEqual(main._analysis_mode(message), "full")
+            self.assertNotEqual(main._analysis_mode(message), "full")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import io
+import json
+import logging
+import queue
+import unittest
+
+from mywin_logging import (
+    CategorySampler,
+    DroppingQueueHandler,
+    QueueLogging,
+    log_category,
+    parse_sample_rates,
+)
+
+
+def _record(msg, level=logging.INFO, args=()):
+    return logging.LogRecord("root", level, __file__, 1, msg, args, None)
+
+
+class CategoryTests(unittest.TestCase):
+    def test_category_from_prefix_or_leading_word(self):
+        self.assertEqual(log_category(_record("[MYWIN][QUALITY] decision=%s", args=("PASS",))), "[MYWIN][QUALITY]")
+        self.assertEqual(log_category(_record("event_written=1 uid=%s", args=(5,))), "event_written")
+        self.assertEqual(log_category(_record("  indented")), "-")
+
+    def test_parse_sample_rates_skips_malformed_parts(self):
+        rates = parse_sample_rates("[MYWIN][QUALITY]=0.1, event_written=0.05,bogus,x=abc,y=7")
+        self.assertEqual(rates, {"[MYWIN][QUALITY]": 0.1, "event_written": 0.05, "y": 1.0})
+
+
+class SamplerTests(unittest.TestCase):
+    def test_sampling_is_deterministic_and_warnings_always_pass(self):
+        sampler = CategorySampler({"[MYWIN][QUALITY]": 0.1})
+        kept = [sampler.filter(_record("[MYWIN][QUALITY] decision=PASS")) for _ in range(30)]
+        self.assertEqual([i for i, keep in enumerate(kept) if keep], [0, 10, 20])
+        self.assertEqual(sampler.suppressed["[MYWIN][QUALITY]"], 27)
+        self.assertTrue(sampler.filter(_record("[MYWIN][QUALITY] failed", level=logging.WARNING)))
+        self.assertTrue(sampler.filter(_record("[MYWIN][XP] granted")))
+
+    def test_zero_rate_suppresses_every_info_record(self):
+        sampler = CategorySampler({"event_written": 0.0})
+        self.assertFalse(any(sampler.filter(_record("event_written=1")) for _ in range(5)))
+
+
+class QueueTests(unittest.TestCase):
+    def test_full_queue_drops_and_counts_instead_of_blocking(self):
+        handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+        for _ in range(3):
+            handler.handle(_record("[MYWIN][QUALITY] decision=PASS"))
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(handler.dropped, {"[MYWIN][QUALITY]": 2})
+
+    def test_records_are_enqueued_unformatted(self):
+        handler = DroppingQueueHandler(queue.Queue())
+        handler.handle(_record("[MYWIN][QUALITY] decision=%s", args=("PASS",)))
+        queued = handler.queue.get_nowait()
+        self.assertEqual((queued.msg, queued.args), ("[MYWIN][QUALITY] decision=%s", ("PASS",)))
+
+    def test_json_lines_are_written_by_the_listener(self):
+        stream = io.StringIO()
+        setup = QueueLogging(json_format=True, stream=stream)
+        logger = logging.getLogger("mywin.test_logging")
+        logger.propagate = False
+        logger.addHandler(setup.queue_handler)
+        setup.listener.start()
+        try:
+            logger.warning("[MYWIN][QUALITY] decision=%s", "REJECT")
+        finally:
+            setup.stop()
+            logger.removeHandler(setup.queue_handler)
+        payload = json.loads(stream.getvalue())
+        self.assertEqual(payload["category"], "[MYWIN][QUALITY]")
+        self.assertEqual(payload["msg"], "[MYWIN][QUALITY] decision=REJECT")
+        self.assertEqual(payload["level"], "WARNING")
+
+    def test_exception_traceback_is_formatted_by_the_listener(self):
+        stream = io.StringIO()
+        setup = QueueLogging(json_format=True, stream=stream)
+        logger = logging.getLogger("mywin.test_logging")
+        logger.propagate = False
+        logger.addHandler(setup.queue_handler)
+        setup.listener.start()
+        try:
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                logger.exception("[MYWIN][QUALITY] failed uid=%s", 5)
+        finally:
+            setup.stop()
+            logger.removeHandler(setup.queue_handler)
+        payload = json.loads(stream.getvalue())
+        self.assertEqual(payload["msg"], "[MYWIN][QUALITY] failed uid=5")
+        self.assertIn("ValueError: boom", payload["exc"])
+
+    def test_report_drops_warns_once_per_new_drop(self):
+        setup = QueueLogging(queue_size=1)
+        setup.queue_handler.dropped["event_written"] = 4
+        with self.assertLogs(level="WARNING") as captured:
+            setup.report_drops()
+            setup.report_drops()
+            logging.warning("end")
+        self.assertEqual(len(captured.output), 2)
+        self.assertIn("dropped=4 since_last=4", captured.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import main
+from mywin_loopmon import LoopMonitor, update_id_var
+
+
+async def _waiting_on_telegram(event):
+    await event.wait()
+
+
+class LoopMonitorTests(unittest.IsolatedAsyncioTestCase):
+    async def test_blocking_call_is_sampled_from_the_watchdog(self):
+        monitor = LoopMonitor(lag_threshold_seconds=0.05, interval_seconds=0.01)
+        monitor.start()
+        self.addCleanup(monitor.stop)
+        await asyncio.sleep(0.02)
+        with self.assertLogs(level="WARNING") as captured:
+            time.sleep(0.2)  # blocks the loop
+            await asyncio.sleep(0.03)
+        joined = "\n".join(captured.output)
+        self.assertIn("loop_blocked", joined)
+        self.assertIn("test_blocking_call_is_sampled_from_the_watchdog", joined)
+        self.assertIn("loop_lag", joined)
+        self.assertGreaterEqual(monitor.blocked_samples, 1)
+        self.assertGreaterEqual(monitor.lag_events, 1)
+
+    async def test_slow_update_logs_update_id_stage_and_await_chain(self):
+        monitor = LoopMonitor(slow_threshold_seconds=0.0)
+        release = asyncio.Event()
+
+        async def handler():
+            with monitor.track_update(42):
+                monitor.mark_stage("quality")
+                await _waiting_on_telegram(release)
+
+        task = asyncio.create_task(handler())
+        await asyncio.sleep(0)
+        with self.assertLogs(level="WARNING") as captured:
+            monitor.check_slow_updates(time.monotonic() + 1)
+            monitor.check_slow_updates(time.monotonic() + 2)  # sampled once
+        self.assertEqual(len(captured.output), 1)
+        self.assertIn("update_id=42 stage=quality", captured.output[0])
+        self.assertIn("_waiting_on_telegram", captured.output[0])
+        release.set()
+        with self.assertLogs(level="WARNING"):
+            await task
+        self.assertEqual(monitor.slow_updates, 1)
+
+
+class SubmissionStageTests(unittest.IsolatedAsyncioTestCase):
+    async def test_handler_tags_submission_with_update_id_and_stages(self):
+        monitor = LoopMonitor()
+        seen = []
+
+        async def moderate(_messages, _context):
+            main._stage("quality")
+            record = next(iter(monitor._active))
+            seen.append((record.update_id, record.stage))
+
+        message = SimpleNamespace(media_group_id=None)
+        with patch.object(main, "loop_monitor", monitor), patch.object(main, "_moderate_submission", moderate):
+            await main.filter_mywin_media(SimpleNamespace(update_id=7, message=message), None)
+        self.assertEqual(seen, [(7, "quality")])
+        self.assertEqual(monitor._active, set())
+        self.assertIsNone(update_id_var.get())
+
+
+if __name__ == "__main__":
+    unittest.main()
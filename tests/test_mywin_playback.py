@@ -6,7 +6,13 @@ from unittest.mock import patch
 from pymongo.errors import DuplicateKeyError
 
 import main
-from mywin_quality import MyWinImageQualityConfig
+from mywin_admins import AdminExemptions
+from mywin_album import MediaGroupBuffer
+from mywin_games import GameStatsBuffer
+from mywin_load import LoadShedder
+from mywin_members import KnownMemberCache
+from mywin_quality import MyWinImageMetrics, MyWinImageQualityConfig
+from mywin_xp import XpTotalsBuffer
 
 
 # ----------------------------------------------------------------------------
@@ -26,6 +32,16 @@ class FakeMywinPosts:
                 return d
         return None
 
+    def find(self, filt, _projection=None):
+        # supports the album repost query: {"$or": [{field: {"$in": [...]}}, ...]}
+        def matches(d, clause):
+            (field, cond), = clause.items()
+            value = d.get(field)
+            values = value if isinstance(value, list) else [value]
+            return any(v in cond["$in"] for v in values)
+
+        return [d for d in self.docs if any(matches(d, c) for c in filt["$or"])]
+
     def insert_one(self, doc):
         with self._lock:
             playback_id = doc.get("playback_id")
@@ -66,8 +82,10 @@ class FakeUniqueCollection:
 class FakeMembers:
     def __init__(self):
         self.docs = {}
+        self.upsert_calls = 0
 
     def update_one(self, filt, update, upsert=False):
+        self.upsert_calls += 1
         uid = filt["uid"]
         if uid in self.docs:
             return SimpleNamespace(matched_count=1, upserted_id=None)
@@ -77,11 +95,27 @@ class FakeMembers:
         return SimpleNamespace(matched_count=0, upserted_id=None)
 
 
+class FakeAdminCache:
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, filt):
+        doc = self.docs.get(filt["_id"])
+        if doc and doc["fetched_at"] >= filt["fetched_at"]["$gte"]:
+            return doc
+        return None
+
+    def update_one(self, filt, update, upsert=False):
+        self.docs.setdefault(filt["_id"], {}).update(update["$set"])
+
+
 class FakeMessage:
-    def __init__(self, caption, user_id=1, chat_id=100, message_id=1, file_unique_id="photo_1"):
+    def __init__(self, caption, user_id=1, chat_id=100, message_id=1, file_unique_id="photo_1", media_group_id=None):
         self.caption = caption
         self.photo = [SimpleNamespace(file_unique_id=file_unique_id, file_id=file_unique_id + "_full")]
         self.document = None
+        self.media_group_id = media_group_id
+        self.date = None
         self.from_user = SimpleNamespace(id=user_id)
         self.chat_id = chat_id
         self.message_id = message_id
@@ -98,13 +132,17 @@ class FakeMessage:
 
 
 def _make_update(message):
-    return SimpleNamespace(message=message)
+    return SimpleNamespace(update_id=message.message_id, message=message)
+
 
+async def _no_admins(_chat_id):
+    return []
 
-_FAKE_CONTEXT = SimpleNamespace(bot=SimpleNamespace())
 
+_FAKE_CONTEXT = SimpleNamespace(bot=SimpleNamespace(get_chat_administrators=_no_admins))
 
-class MyWinPlaybackTestCase(unittest.IsolatedAsyncioTestCase):
+
+class _MyWinHandlerTestCase(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.fake_posts = FakeMywinPosts()
         self.fake_xp_events = FakeUniqueCollection(("user_id", "unique_key"))
@@ -117,6 +155,11 @@ class MyWinPlaybackTestCase(unittest.IsolatedAsyncioTestCase):
             patch.object(main, "xp_events", self.fake_xp_events),
             patch.object(main, "events", self.fake_events),
             patch.object(main, "members", self.fake_members),
+            patch.object(main, "known_members", KnownMemberCache(max_size=2)),
+            patch.object(main, "xp_totals_buffer", XpTotalsBuffer()),
+            patch.object(main, "game_stats_buffer", GameStatsBuffer()),
+            patch.object(main, "media_group_buffer", MediaGroupBuffer(60, main.process_submission)),
+            patch.object(main, "admin_exemptions", AdminExemptions(FakeAdminCache())),
             patch.object(main, "mywin_image_hashes", self.fake_image_hashes),
             patch.object(
                 main,
@@ -137,6 +180,8 @@ class MyWinPlaybackTestCase(unittest.IsolatedAsyncioTestCase):
         await main.filter_mywin_media(_make_update(message), _FAKE_CONTEXT)
         return message
 
+
+class MyWinPlaybackTestCase(_MyWinHandlerTestCase):
     # ------------------------------------------------------------------
     # Persistence
     # ------------------------------------------------------------------
@@ -168,6 +213,20 @@ class MyWinPlaybackTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(xp_doc["meta"]["submission_format"], "tag_game_and_playback")
         self.assertEqual(xp_doc["xp"], 20)
 
+    async def test_xp_insert_buffers_totals_increment(self):
+        await self._submit("#mywin Zeus Rising", user_id=5, file_unique_id="a")
+        await self._submit("#mywin Zeus Rising", user_id=5, file_unique_id="a")
+        self.assertEqual(main.xp_totals_buffer._pending[5]["xp"], 20)
+        self.assertEqual(main.xp_totals_buffer._pending[5]["mywin"], 1)
+
+    async def test_valid_event_counts_towards_game_stats(self):
+        await self._submit("#mywin Zeus Rising", file_unique_id="a")
+        await self._submit("#comebackisreal  zeus RISING", file_unique_id="b")
+        self.assertEqual(self.fake_posts.docs[1]["game_key"], "zeus rising")
+        day_buckets = [k for k in main.game_stats_buffer._pending if k[0] == "day"]
+        self.assertEqual(len(day_buckets), 1)
+        self.assertEqual(main.game_stats_buffer._pending[day_buckets[0]]["submissions"], 2)
+
     async def test_replay_fields_written_to_mywin_valid_event(self):
         await self._submit("#comebackisreal Zeus Rising\nhttps://rx.apreplay.com/aT1oUdG2IV")
         event_doc = self.fake_events.docs[0]
@@ -303,6 +362,22 @@ class MyWinPlaybackTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(sorted(results), ["accepted", "rejected"])
         self.assertEqual(len(posts.docs), 1)
 
+    # ------------------------------------------------------------------
+    # Known-member cache
+    # ------------------------------------------------------------------
+    async def test_known_member_skips_repeat_upsert(self):
+        await self._submit("#mywin Zeus Rising", user_id=7, file_unique_id="a")
+        await self._submit("#mywin Zeus Rising", user_id=7, file_unique_id="b")
+        self.assertEqual(self.fake_members.upsert_calls, 1)
+        self.assertIn(7, self.fake_members.docs)
+        self.assertEqual(main.known_members.stats()["hits"], 1)
+
+    async def test_evicted_member_is_upserted_again(self):
+        for i, uid in enumerate((1, 2, 3, 1)):
+            await self._submit("#mywin Zeus Rising", user_id=uid, file_unique_id=f"f{i}")
+        self.assertEqual(self.fake_members.upsert_calls, 4)
+        self.assertEqual(main.known_members.evictions, 2)
+
     # ------------------------------------------------------------------
     # Playback button
     # ------------------------------------------------------------------
@@ -353,5 +428,193 @@ class MyWinPlaybackTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(self.fake_events.docs), 1)
 
 
+
+class FakeImageHashes:
+    def __init__(self):
+        self.docs = []
+        self.find_calls = 0
+
+    def find(self, _query, _projection):
+        self.find_calls += 1
+        return [{"hash": d["hash"]} for d in self.docs]
+
+    def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+
+def _metrics(image_hash, width=800):
+    return MyWinImageMetrics(
+        width=width, height=800, file_size=100_000, blur_score=500.0,
+        blank_stddev=50.0, saturation_mean=0.2, image_hash=image_hash,
+    )
+
+
+class MyWinAlbumTestCase(_MyWinHandlerTestCase):
+    """Albums: buffered by media_group_id and moderated as one submission."""
+
+    async def _submit_album(self, captions, group="g1", user_id=1):
+        messages = [
+            FakeMessage(caption, user_id=user_id, message_id=10 + i, file_unique_id=f"{group}_{i}", media_group_id=group)
+            for i, caption in enumerate(captions)
+        ]
+        for message in messages:
+            await main.filter_mywin_media(_make_update(message), _FAKE_CONTEXT)
+        self.assertTrue(all(not m.deleted for m in messages), "nothing is moderated before the window closes")
+        await main.media_group_buffer.drain()
+        return messages
+
+    async def test_album_is_one_submission(self):
+        messages = await self._submit_album(["#mywin Zeus Rising", None, None])
+        self.assertFalse(any(m.deleted for m in messages))
+        self.assertEqual(len(self.fake_posts.docs), 1)
+        self.assertEqual(self.fake_posts.docs[0]["file_id"], "g1_0")
+        self.assertEqual(self.fake_posts.docs[0]["album_file_ids"], ["g1_1", "g1_2"])
+        self.assertEqual(len(self.fake_xp_events.docs), 1)
+
+    async def test_album_caption_on_later_item_is_used(self):
+        await self._submit_album([None, "#comebackisreal Zeus Rising"])
+        self.assertEqual(self.fake_posts.docs[0]["file_id"], "g1_1")
+        self.assertEqual(self.fake_posts.docs[0]["tag"], "comebackisreal")
+
+    async def test_album_without_valid_caption_deleted_entirely(self):
+        messages = await self._submit_album(["hello", None])
+        self.assertTrue(all(m.deleted for m in messages))
+        self.assertEqual(self.fake_posts.docs, [])
+
+    async def test_album_reposted_image_removed_from_new_album(self):
+        await self._submit_album(["#mywin Zeus Rising", None], group="g1")
+        second = [
+            FakeMessage("#mywin Zeus Rising", message_id=20, file_unique_id="new", media_group_id="g2"),
+            FakeMessage(None, message_id=21, file_unique_id="g1_1", media_group_id="g2"),
+        ]
+        for message in second:
+            await main.filter_mywin_media(_make_update(message), _FAKE_CONTEXT)
+        await main.media_group_buffer.drain()
+        self.assertFalse(second[0].deleted)
+        self.assertTrue(second[1].deleted)
+
+    async def test_album_extra_reposted_alone_is_rejected(self):
+        await self._submit_album(["#mywin Zeus Rising", None], group="g1")
+        repost = FakeMessage("#mywin Zeus Rising", message_id=30, file_unique_id="g1_1")
+        await main.filter_mywin_media(_make_update(repost), _FAKE_CONTEXT)
+        self.assertTrue(repost.deleted)
+        self.assertEqual(len(self.fake_posts.docs), 1)
+        self.assertEqual(len(self.fake_xp_events.docs), 1)
+
+    async def test_album_quality_uses_one_dedup_query_and_rejects_per_item(self):
+        hashes = FakeImageHashes()
+        metrics = {10: _metrics("ffffffffffffffff"), 11: _metrics("0f0f0f0f0f0f0f0f", width=100),
+                   12: _metrics("ffffffffffffffff")}
+
+        async def analyze(_context, message, _cfg, _mode="full"):
+            return metrics[message.message_id]
+
+        with patch.object(main, "mywin_image_hashes", hashes), \
+                patch.object(main, "_analyze_message_image", analyze), \
+                patch.object(main, "load_mywin_quality_config", return_value=MyWinImageQualityConfig()):
+            messages = await self._submit_album(["#mywin Zeus Rising", None, None])
+        self.assertEqual(hashes.find_calls, 1)
+        self.assertEqual(len(hashes.docs), 3)
+        self.assertFalse(messages[0].deleted)
+        self.assertTrue(messages[1].deleted)  # small_resolution
+        self.assertTrue(messages[2].deleted)  # duplicate of item 0 within the album
+        self.assertEqual(self.fake_posts.docs[0]["album_file_ids"], [])
+
+    async def test_admin_album_skips_quality_analysis(self):
+        async def analyze(*_args):
+            raise AssertionError("admins skip analysis")
+
+        async def admins(_chat_id):
+            return [SimpleNamespace(user=SimpleNamespace(id=1))]
+
+        context = SimpleNamespace(bot=SimpleNamespace(get_chat_administrators=admins))
+        message = FakeMessage("#mywin Zeus Rising", user_id=1)
+        with patch.object(main, "_analyze_message_image", analyze), \
+                patch.object(main, "load_mywin_quality_config", return_value=MyWinImageQualityConfig()):
+            await main.filter_mywin_media(_make_update(message), context)
+        self.assertFalse(message.deleted)
+        self.assertEqual(self.fake_posts.docs[0]["quality_decision"], "PASS")
+
+
+class FakeReanalysisQueue:
+    def __init__(self):
+        self.docs = {}
+
+    def enqueue(self, items):
+        for item in items:
+            self.docs.setdefault(f"{item['chat_id']}:{item['message_id']}", dict(item))
+
+
+class _OverloadedShedder(LoadShedder):
+    def __init__(self, mode):
+        super().__init__()
+        self.forced_mode = mode
+
+    def select_mode(self):
+        self.submissions_by_mode[self.forced_mode] += 1
+        return self.forced_mode
+
+
+class MyWinLoadSheddingTestCase(_MyWinHandlerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.queue = FakeReanalysisQueue()
+        for p in (
+            patch.object(main, "reanalysis_queue", self.queue),
+            patch.object(main, "load_mywin_quality_config", return_value=MyWinImageQualityConfig()),
+        ):
+            p.start()
+            self.addCleanup(p.stop)
+
+    async def test_defer_accepts_as_ignore_and_queues_reanalysis(self):
+        async def analyze(*_args):
+            raise AssertionError("deferred submissions are not analyzed")
+
+        with patch.object(main, "load_shedder", _OverloadedShedder("defer")), \
+                patch.object(main, "_analyze_message_image", analyze):
+            message = await self._submit("#mywin Zeus Rising", message_id=5, file_unique_id="a")
+        self.assertFalse(message.deleted)
+        doc = self.fake_posts.docs[0]
+        self.assertEqual((doc["quality_decision"], doc["analysis_mode"]), ("IGNORE", "defer"))
+        self.assertEqual(self.fake_xp_events.docs, [])
+        queued = self.queue.docs["100:5"]
+        self.assertEqual((queued["post_file_id"], queued["reason"], queued["primary"]), ("a", "defer", True))
+
+    async def test_metadata_only_rejects_on_declared_size_without_download(self):
+        async def get_file(_file_id):
+            raise AssertionError("metadata_only must not download")
+
+        context = SimpleNamespace(bot=SimpleNamespace(get_file=get_file, get_chat_administrators=_no_admins))
+        message = FakeMessage("#mywin Zeus Rising")
+        message.photo = [SimpleNamespace(file_unique_id="a", file_id="a_full", width=90, height=90, file_size=2000)]
+        with patch.object(main, "load_shedder", _OverloadedShedder("metadata_only")):
+            await main.filter_mywin_media(_make_update(message), context)
+        self.assertTrue(message.deleted)
+        self.assertEqual(self.queue.docs, {})
+
+    async def test_full_mode_does_not_queue(self):
+        async def analyze(*_args):
+            return _metrics("ffffffffffffffff")
+
+        hashes = FakeImageHashes()
+        with patch.object(main, "load_shedder", _OverloadedShedder("full")), \
+                patch.object(main, "mywin_image_hashes", hashes), \
+                patch.object(main, "_analyze_message_image", analyze):
+            message = await self._submit("#mywin Zeus Rising")
+        self.assertFalse(message.deleted)
+        self.assertNotIn("analysis_mode", self.fake_posts.docs[0])
+        self.assertEqual(self.queue.docs, {})
+
+    async def test_analysis_error_passes_and_queues_reanalysis(self):
+        async def analyze(*_args):
+            raise RuntimeError("download failed")
+
+        with patch.object(main, "_analyze_message_image", analyze):
+            message = await self._submit("#mywin Zeus Rising", message_id=7)
+        self.assertFalse(message.deleted)
+        self.assertEqual(self.fake_posts.docs[0]["quality_decision"], "PASS")
+        self.assertEqual(self.queue.docs["100:7"]["reason"], "analysis_error")
+
+
 if __name__ == "__main__":
     unittest.main()
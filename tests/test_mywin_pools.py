@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+import httpx
+from pymongo import monitoring
+
+from mywin_pools import MongoPoolListener, PooledHTTPXRequest, PoolTimingTransport, PoolWaitStats
+
+
+async def _slow_http_server(delay):
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        await asyncio.sleep(delay)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+
+
+class PoolTimingTransportTests(unittest.IsolatedAsyncioTestCase):
+    async def test_second_request_waits_for_the_only_connection(self):
+        server, url = await _slow_http_server(0.2)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        stats = PoolWaitStats()
+        transport = PoolTimingTransport("downloads", stats, limits=httpx.Limits(max_connections=1))
+        async with httpx.AsyncClient(transport=transport) as client:
+            await asyncio.gather(client.get(url), client.get(url))
+        row = stats.stats()["downloads"]
+        self.assertEqual((row["acquired"], row["timeouts"]), (2, 0))
+        self.assertGreaterEqual(row["wait_max_ms"], 150)
+        self.assertLess(min(stats._waits["downloads"]), 0.15)  # the first one got the idle slot
+
+    async def test_pool_timeout_is_counted(self):
+        server, url = await _slow_http_server(0.3)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        stats = PoolWaitStats()
+        transport = PoolTimingTransport("telegram_api", stats, limits=httpx.Limits(max_connections=1))
+        async with httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(5.0, pool=0.05)) as client:
+            results = await asyncio.gather(client.get(url), client.get(url), return_exceptions=True)
+        self.assertEqual(sum(isinstance(r, httpx.PoolTimeout) for r in results), 1)
+        self.assertEqual(stats.stats()["telegram_api"]["timeouts"], 1)
+        with self.assertLogs(level="WARNING") as captured:
+            stats.log_stats()
+        self.assertIn("pool=telegram_api acquired=1 timeouts=1", captured.output[0])
+
+
+class PooledRequestTests(unittest.TestCase):
+    def test_bot_api_request_uses_a_named_timed_pool(self):
+        stats = PoolWaitStats()
+        request = PooledHTTPXRequest(pool_name="telegram_get_updates", wait_stats=stats, connection_pool_size=1)
+        transport = request._client._transport
+        self.assertIsInstance(transport, PoolTimingTransport)
+        self.assertEqual(transport.pool_name, "telegram_get_updates")
+        self.assertEqual(transport._pool._max_connections, 1)
+
+
+class MongoPoolListenerTests(unittest.TestCase):
+    def test_checkout_waits_and_timeouts(self):
+        stats = PoolWaitStats()
+        listener = MongoPoolListener(stats)
+        listener.connection_checked_out(SimpleNamespace(duration=0.004))
+        listener.connection_check_out_failed(
+            SimpleNamespace(reason=monitoring.ConnectionCheckOutFailedReason.TIMEOUT, duration=10.0)
+        )
+        listener.connection_check_out_failed(
+            SimpleNamespace(reason=monitoring.ConnectionCheckOutFailedReason.CONN_ERROR, duration=0.1)
+        )
+        self.assertEqual(
+            stats.stats()["mongo"],
+            {"acquired": 1, "timeouts": 1, "wait_p50_ms": 4.0, "wait_p95_ms": 4.0, "wait_max_ms": 4.0},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
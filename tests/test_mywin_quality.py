@@ -1,15 +1,34 @@
 import io
 import unittest
+from unittest.mock import patch
 
 from PIL import Image, ImageFilter
 
 from mywin_quality import (
+    ImageTooLarge,
     MyWinImageQualityConfig,
     analyze_mywin_image,
     decide_mywin_image_quality,
+    is_near_duplicate_hash,
+    match_near_duplicates,
 )
 
 
+class _RecordingHashes:
+    """Fake mywin_image_hashes that applies equality filters and records queries."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, query, _projection):
+        self.queries.append(query)
+        return [
+            d for d in self.docs
+            if all(d.get(k) == v for k, v in query.items() if not isinstance(v, dict))
+        ]
+
+
 class MyWinQualityTests(unittest.TestCase):
     def _to_bytes(self, image: Image.Image, fmt: str = "PNG") -> bytes:
         buf = io.BytesIO()
@@ -143,6 +162,103 @@ class MyWinQualityTests(unittest.TestCase):
         decision = decide_mywin_image_quality(metrics, duplicate_match=False, cfg=cfg)
         self.assertEqual(decision.decision, "PASS")
 
+    # ------------------------------------------------------------------
+    # Size bounds
+    # ------------------------------------------------------------------
+    def test_pixel_ceiling_checked_before_decode(self):
+        data = self._to_bytes(self._checker(size=(600, 600)))
+        with self.assertRaises(ImageTooLarge) as ctx:
+            analyze_mywin_image(data, max_pixels=500 * 500)
+        self.assertEqual(ctx.exception.reason, "too_many_pixels")
+
+    def test_decompression_bomb_is_too_large_not_an_analysis_error(self):
+        # a small PNG whose header claims more pixels than Pillow's bomb limit
+        data = self._to_bytes(Image.new("1", (100, 100)))
+        for limit in (1000, 9000):  # past 2x the limit Pillow raises, past 1x it only warns
+            with patch.object(Image, "MAX_IMAGE_PIXELS", limit):
+                with self.assertRaises(ImageTooLarge) as ctx:
+                    analyze_mywin_image(data)
+                self.assertEqual((ctx.exception.reason, ctx.exception.size), ("too_many_pixels", 10000))
+                with self.assertRaises(ImageTooLarge):
+                    analyze_mywin_image(data, max_pixels=50_000)
+
+    def test_file_object_input_matches_bytes_input(self):
+        data = self._to_bytes(self._checker(size=(600, 600)))
+        self.assertEqual(analyze_mywin_image(io.BytesIO(data)), analyze_mywin_image(data))
+
+    # ------------------------------------------------------------------
+    # Degraded (load-shedding) analysis
+    # ------------------------------------------------------------------
+    def test_hash_only_matches_full_hash_and_skips_pixel_metrics(self):
+        data = self._to_bytes(self._checker(size=(600, 600)))
+        partial = analyze_mywin_image(data, hash_only=True)
+        self.assertEqual(partial.image_hash, analyze_mywin_image(data).image_hash)
+        self.assertIsNone(partial.blur_score)
+        cfg = MyWinImageQualityConfig(min_file_size_bytes=100)
+        decision = decide_mywin_image_quality(partial, duplicate_match=False, cfg=cfg)
+        self.assertEqual((decision.decision, decision.reason), ("PASS", "partial"))
+
+    def test_partial_metrics_still_apply_resolution_and_duplicate_checks(self):
+        data = self._to_bytes(self._checker(size=(100, 100)))
+        partial = analyze_mywin_image(data, hash_only=True)
+        cfg = MyWinImageQualityConfig(min_file_size_bytes=100)
+        self.assertEqual(decide_mywin_image_quality(partial, False, cfg).reason, "small_resolution")
+        cfg = MyWinImageQualityConfig(min_width=50, min_height=50, min_file_size_bytes=100)
+        self.assertEqual(decide_mywin_image_quality(partial, True, cfg).reason, "duplicate_image")
+
+
+class MatchNearDuplicatesTests(unittest.TestCase):
+    def test_batch_and_candidate_matches(self):
+        matches, seen = match_near_duplicates(
+            ["ffffffffffffffff", "fffffffffffffff0", "0000000000000000"], iter(["", "0000000000000001", "ffff"]), 4
+        )
+        self.assertEqual((matches, seen), ([False, True, True], 2))
+
+    def test_candidates_untouched_when_the_batch_already_matches(self):
+        def candidates():
+            raise AssertionError("consumed")
+            yield
+
+        self.assertEqual(match_near_duplicates([], candidates(), 4), ([], 0))
+
+
+class DuplicateScopeTests(unittest.TestCase):
+    def setUp(self):
+        self.hashes = _RecordingHashes([
+            {"hash": "ffffffffffffffff", "chat_id": 100, "user_id": 1},
+            {"hash": "0000000000000000", "chat_id": 200, "user_id": 2},
+        ])
+
+    def test_global_scope_compares_all_partitions(self):
+        self.assertTrue(is_near_duplicate_hash(self.hashes, "0000000000000000", 4, 30))
+        self.assertNotIn("chat_id", self.hashes.queries[0])
+        self.assertNotIn("user_id", self.hashes.queries[0])
+
+    def test_chat_scope_only_matches_same_chat(self):
+        self.assertFalse(
+            is_near_duplicate_hash(self.hashes, "0000000000000000", 4, 30, scope="chat", chat_id=100, user_id=2)
+        )
+        self.assertTrue(
+            is_near_duplicate_hash(self.hashes, "0000000000000000", 4, 30, scope="chat", chat_id=200, user_id=1)
+        )
+        self.assertEqual(self.hashes.queries[0]["chat_id"], 100)
+
+    def test_user_scope_only_matches_same_user(self):
+        self.assertFalse(
+            is_near_duplicate_hash(self.hashes, "0000000000000000", 4, 30, scope="user", chat_id=200, user_id=1)
+        )
+        self.assertEqual(self.hashes.queries[0]["user_id"], 1)
+
+    def test_candidate_count_logged_per_scope(self):
+        with self.assertLogs(level="INFO") as captured:
+            is_near_duplicate_hash(self.hashes, "1234123412341234", 0, 30, scope="chat", chat_id=100)
+        self.assertIn("scope=chat", captured.output[0])
+        self.assertIn("candidates=1", captured.output[0])
+
+    def test_unknown_scope_raises(self):
+        with self.assertRaises(ValueError):
+            is_near_duplicate_hash(self.hashes, "0000000000000000", 4, 30, scope="planet")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import main
+from mywin_quality import MyWinImageQualityConfig
+from mywin_ratelimit import SubmissionRateLimiter
+
+T0 = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+class _BulkMembers:
+    def __init__(self):
+        self.ops = []
+
+    def bulk_write(self, ops, ordered=True):
+        self.ops.extend(ops)
+
+
+class SubmissionRateLimiterTests(unittest.TestCase):
+    def test_burst_then_limited_then_refilled(self):
+        limiter = SubmissionRateLimiter(interval_seconds=10, burst=2)
+        self.assertFalse(limiter.check(1, T0)[0])
+        self.assertFalse(limiter.check(1, T0)[0])
+        limited, retry_after = limiter.check(1, T0 + timedelta(seconds=5))
+        self.assertTrue(limited)
+        self.assertAlmostEqual(retry_after, 5.0)
+        self.assertFalse(limiter.check(1, T0 + timedelta(seconds=10))[0])
+
+    def test_users_have_independent_buckets(self):
+        limiter = SubmissionRateLimiter(interval_seconds=10, burst=1)
+        self.assertFalse(limiter.check(1, T0)[0])
+        self.assertFalse(limiter.check(2, T0)[0])
+        self.assertTrue(limiter.check(1, T0)[0])
+
+    def test_seed_only_consulted_for_unseen_uid(self):
+        calls = []
+
+        def seed(uid, now):
+            calls.append(uid)
+            return True, 5.0
+
+        limiter = SubmissionRateLimiter(interval_seconds=10, burst=1, seed=seed)
+        self.assertTrue(limiter.check(1, T0)[0])
+        self.assertFalse(limiter.check(1, T0 + timedelta(seconds=5))[0])
+        self.assertEqual(calls, [1])
+
+    def test_checkpoint_batches_accepted_submissions(self):
+        limiter = SubmissionRateLimiter(interval_seconds=10, burst=3)
+        limiter.check(1, T0)
+        limiter.check(1, T0 + timedelta(seconds=1))
+        limiter.check(2, T0)
+        members = _BulkMembers()
+        self.assertEqual(limiter.checkpoint(members), 2)
+        self.assertEqual(limiter.checkpoint(members), 0)
+        self.assertEqual(len(members.ops), 2)
+
+
+class _Message:
+    def __init__(self):
+        self.caption = "#mywin Zeus Rising"
+        self.photo = [SimpleNamespace(file_unique_id="p", file_id="p_full")]
+        self.document = None
+        self.media_group_id = None
+        self.from_user = SimpleNamespace(id=1)
+        self.chat_id = 100
+        self.message_id = 1
+        self.date = None
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+
+
+class RateLimitedHandlerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_rate_limited_submission_deleted_before_download(self):
+        limiter = SubmissionRateLimiter(interval_seconds=60, burst=1)
+        limiter.check(1, datetime.now(timezone.utc))
+
+        async def get_file(_file_id):
+            raise AssertionError("must not download")
+
+        context = SimpleNamespace(bot=SimpleNamespace(get_file=get_file))
+        message = _Message()
+        with patch.object(main, "submission_limiter", limiter), patch.object(
+            main, "load_mywin_quality_config", return_value=MyWinImageQualityConfig()
+        ):
+            await main.filter_mywin_media(SimpleNamespace(update_id=1, message=message), context)
+        self.assertTrue(message.deleted)
+
+    async def test_replayed_backlog_is_charged_at_post_time(self):
+        limiter = SubmissionRateLimiter(interval_seconds=60, burst=1)
+        posted_long_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+        posts = SimpleNamespace(find=lambda _query, _projection: [{"file_id": "p"}])
+        with patch.object(main, "submission_limiter", limiter), patch.object(main, "mywin_posts", posts), \
+                patch.object(main, "load_mywin_quality_config", return_value=MyWinImageQualityConfig(enabled=False)):
+            for i in range(5):  # one post every 10 minutes while the bot was down
+                message = _Message()
+                message.message_id = i
+                message.date = posted_long_ago + timedelta(minutes=10 * i)
+                await main.filter_mywin_media(SimpleNamespace(update_id=i, message=message), None)
+        self.assertEqual((limiter.allowed, limiter.limited), (5, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
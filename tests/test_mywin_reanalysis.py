@@ -0,0 +1,233 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from pymongo.errors import DuplicateKeyError
+
+import main
+from mywin_games import GameStatsBuffer
+from mywin_quality import ImageTooLarge, MyWinImageMetrics, MyWinImageQualityConfig
+from mywin_reanalysis import ReanalysisQueue
+from mywin_xp import XpTotalsBuffer
+
+
+class _QueueCollection:
+    """Fake mywin_reanalysis_queue: upserts, claim filter and owner-guarded updates."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            self.docs.setdefault(op._filter["_id"], {"_id": op._filter["_id"], **op._doc["$setOnInsert"]})
+
+    def find_one_and_update(self, filt, update, sort=None, return_document=None):
+        pending, expired = filt["$or"]
+        candidates = [
+            d for d in self.docs.values()
+            if (d["status"] == "pending" and d["not_before"] <= pending["not_before"]["$lte"])
+            or (d["status"] == "processing" and d["lease_until"] <= expired["lease_until"]["$lte"])
+        ]
+        if not candidates:
+            return None
+        doc = min(candidates, key=lambda d: d["enqueued_at"])
+        doc.update(update["$set"])
+        doc["attempts"] += update["$inc"]["attempts"]
+        return dict(doc)
+
+    def update_one(self, filt, update):
+        doc = self.docs.get(filt["_id"])
+        if doc and doc.get("owner") == filt["owner"]:
+            doc.update(update["$set"])
+
+
+def _item(message_id, **extra):
+    return {"chat_id": 100, "message_id": message_id, "user_id": 1, "file_id": f"f{message_id}",
+            "file_unique_id": f"u{message_id}", "post_file_id": "u1", "primary": True, "reason": "defer", **extra}
+
+
+class ReanalysisQueueTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.collection = _QueueCollection()
+        self.queue = ReanalysisQueue(self.collection, max_attempts=2, retry_delay_seconds=60, owner="w1")
+
+    def test_message_is_queued_once(self):
+        self.queue.enqueue([_item(1)])
+        self.queue.enqueue([_item(1, reason="analysis_error")])
+        self.assertEqual(list(self.collection.docs), ["100:1"])
+        self.assertEqual(self.collection.docs["100:1"]["reason"], "defer")
+
+    def test_claim_skips_leased_items_until_the_lease_expires(self):
+        self.queue.enqueue([_item(1)])
+        self.assertEqual(self.queue.claim()["attempts"], 1)
+        self.assertIsNone(self.queue.claim())
+        self.collection.docs["100:1"]["lease_until"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+        self.assertEqual(self.queue.claim()["attempts"], 2)
+
+    def test_retry_backs_off_then_fails_after_max_attempts(self):
+        self.queue.enqueue([_item(1)])
+        self.queue.retry(self.queue.claim(), "boom")
+        doc = self.collection.docs["100:1"]
+        self.assertEqual(doc["status"], "pending")
+        self.assertGreater(doc["not_before"], datetime.now(timezone.utc) + timedelta(seconds=50))
+        self.assertIsNone(self.queue.claim())
+        doc["not_before"] = datetime.now(timezone.utc)
+        self.queue.retry(self.queue.claim(), "boom")
+        self.assertEqual(doc["status"], "failed")
+
+    async def test_drain_bounds_concurrency_and_records_outcomes(self):
+        self.queue.enqueue([_item(i) for i in range(1, 6)])
+        running = []
+        peak = []
+
+        async def process(item):
+            running.append(item["_id"])
+            peak.append(len(running))
+            await asyncio.sleep(0)
+            running.remove(item["_id"])
+            if item["message_id"] == 3:
+                raise RuntimeError("telegram down")
+            return "PASS:clear"
+
+        self.assertEqual(await self.queue.drain(process, concurrency=2), 5)
+        self.assertLessEqual(max(peak), 2)
+        statuses = {k: d["status"] for k, d in self.collection.docs.items()}
+        self.assertEqual(statuses.pop("100:3"), "pending")
+        self.assertEqual(set(statuses.values()), {"done"})
+        self.assertEqual(self.collection.docs["100:1"]["outcome"], "PASS:clear")
+
+
+class _Posts:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find_one(self, filt):
+        return next((dict(d) for d in self.docs if d["file_id"] == filt["file_id"]), None)
+
+    def update_one(self, filt, update):
+        doc = next(d for d in self.docs if d["_id"] == filt["_id"])
+        doc.update(update.get("$set", {}))
+        for field, value in update.get("$pull", {}).items():
+            doc[field] = [v for v in doc[field] if v != value]
+
+    def delete_one(self, filt):
+        self.docs = [d for d in self.docs if d["_id"] != filt["_id"]]
+
+
+class _XpEvents:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    def find_one(self, filt):
+        return next((d for d in self.docs if all(d.get(k) == v for k, v in filt.items())), None)
+
+    def insert_one(self, doc):
+        if self.find_one({"user_id": doc["user_id"], "unique_key": doc["unique_key"]}):
+            raise DuplicateKeyError("dup", code=11000)
+        self.docs.append(dict(doc))
+
+
+class _Hashes:
+    def __init__(self):
+        self.docs = []
+
+    def find(self, _query, _projection):
+        return []
+
+    def insert_one(self, doc):
+        self.docs.append(doc)
+
+
+def _metrics(blur_score):
+    return MyWinImageMetrics(width=800, height=800, file_size=100_000, blur_score=blur_score,
+                             blank_stddev=50.0, saturation_mean=0.2, image_hash="ffffffffffffffff")
+
+
+class ReanalyzeItemTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.deleted = []
+
+        async def delete_message(chat_id, message_id):
+            self.deleted.append((chat_id, message_id))
+
+        self.bot = SimpleNamespace(delete_message=delete_message)
+        self.hashes = _Hashes()
+        for p in (
+            patch.object(main, "mywin_image_hashes", self.hashes),
+            patch.object(main, "xp_totals_buffer", XpTotalsBuffer()),
+            patch.object(main, "game_stats_buffer", GameStatsBuffer()),
+            patch.object(main, "posted_file_ids", None),
+            patch.object(main, "load_mywin_quality_config", return_value=MyWinImageQualityConfig()),
+        ):
+            p.start()
+            self.addCleanup(p.stop)
+
+    async def _reanalyze(self, item, post, metrics, xp_docs=()):
+        async def analyze(*_args, **_kwargs):
+            if isinstance(metrics, Exception):
+                raise metrics
+            return metrics
+
+        self.posts = _Posts([post])
+        self.xp = _XpEvents(xp_docs)
+        self.events = _Hashes()
+        with patch.object(main, "mywin_posts", self.posts), patch.object(main, "xp_events", self.xp), \
+                patch.object(main, "events", self.events), patch.object(main, "_download_and_analyze", analyze):
+            return await main._reanalyze_item(self.bot, {"_id": "100:1", **item})
+
+    async def test_rejected_pass_is_deleted_and_xp_reversed(self):
+        post = {"_id": 1, "file_id": "u1", "user_id": 1, "quality_decision": "PASS"}
+        outcome = await self._reanalyze(_item(1, reason="analysis_error"), post, _metrics(blur_score=10.0),
+                                        xp_docs=[{"user_id": 1, "unique_key": "mywin:u1", "xp": 20}])
+        self.assertEqual(outcome, "REJECT:blur")
+        self.assertEqual(self.deleted, [(100, 1)])
+        self.assertEqual(self.posts.docs, [])  # file and playback ids are free again
+        reversal = self.xp.docs[-1]
+        self.assertEqual((reversal["xp"], reversal["reason"]), (-20, "mywin_quality_reversal"))
+        self.assertEqual(main.xp_totals_buffer._pending[1]["xp"], -20)
+        self.assertEqual(main.xp_totals_buffer._pending[1]["mywin"], -1)
+        self.assertEqual(len(self.hashes.docs), 1)
+        self.assertEqual(self.events.docs, [])
+
+    async def test_rejected_deferred_post_is_removed_without_xp(self):
+        post = {"_id": 1, "file_id": "u1", "user_id": 1, "quality_decision": "IGNORE", "playback_id": "r1"}
+        self.assertEqual(await self._reanalyze(_item(1), post, _metrics(blur_score=10.0)), "REJECT:blur")
+        self.assertEqual((self.posts.docs, self.xp.docs, self.events.docs), ([], [], []))
+        self.assertEqual(len(main.xp_totals_buffer), 0)
+
+    async def test_deferred_post_that_passes_gets_its_xp(self):
+        post = {"_id": 1, "file_id": "u1", "user_id": 1, "quality_decision": "IGNORE", "tag": "mywin",
+                "game_name": "Zeus Rising", "game_key": "zeus rising",
+                "created_at": datetime(2026, 3, 1, 10, tzinfo=timezone.utc)}
+        outcome = await self._reanalyze(_item(1), post, _metrics(blur_score=500.0))
+        self.assertEqual(outcome, "PASS:clear")
+        self.assertEqual(self.deleted, [])
+        self.assertEqual(self.xp.docs[0]["unique_key"], "mywin:u1")
+        self.assertEqual(main.xp_totals_buffer._pending[1]["mywin"], 1)
+        self.assertEqual(self.posts.docs[0]["quality_decision"], "PASS")
+        event = self.events.docs[0]
+        self.assertEqual((event["type"], event["chat_id"], event["message_id"]), ("MYWIN_VALID", 100, 1))
+        self.assertEqual(event["meta"]["game_key"], "zeus rising")
+        self.assertEqual(
+            main.game_stats_buffer._pending[("day", "2026-03-01", "zeus rising")],
+            {"submissions": 1, "mywin": 1, "cbir": 0},
+        )
+
+    async def test_rejected_album_item_is_removed_from_the_post(self):
+        post = {"_id": 1, "file_id": "u1", "user_id": 1, "quality_decision": "PASS", "album_file_ids": ["u2", "u3"]}
+        item = _item(2, primary=False, reason="hash_only")
+        await self._reanalyze(item, post, ImageTooLarge("too_many_pixels", 10, 5))
+        self.assertEqual(self.deleted, [(100, 2)])
+        self.assertEqual(self.posts.docs[0]["album_file_ids"], ["u3"])
+        self.assertEqual(self.posts.docs[0]["quality_decision"], "PASS")
+        self.assertEqual(self.xp.docs, [])
+
+    async def test_missing_post_is_skipped(self):
+        post = {"_id": 1, "file_id": "other", "user_id": 1, "quality_decision": "PASS"}
+        self.assertEqual(await self._reanalyze(_item(1), post, _metrics(500.0)), "post_missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
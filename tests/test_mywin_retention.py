@@ -0,0 +1,115 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from mywin_quality import MyWinImageQualityConfig
+from mywin_retention import (
+    HASHES_CREATED_AT_INDEX,
+    ensure_hash_retention_index,
+    hash_retention_days,
+    prune_image_hashes,
+)
+
+NOW = datetime(2026, 1, 31, tzinfo=timezone.utc)
+
+
+class _FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, _direction):
+        return _FakeCursor(sorted(self.docs, key=lambda d: d[key]))
+
+    def limit(self, n):
+        return _FakeCursor(self.docs[:n])
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class _FakeDatabase:
+    def __init__(self):
+        self.commands = []
+
+    def command(self, name, *args, **kwargs):
+        self.commands.append((name, args, kwargs))
+        return {"count": 0, "size": 0, "storageSize": 0, "totalIndexSize": 0}
+
+
+class _FakeHashes:
+    name = "mywin_image_hashes"
+
+    def __init__(self, docs=None, indexes=None):
+        self.docs = list(docs or [])
+        self.indexes = dict(indexes or {})
+        self.database = _FakeDatabase()
+        self.delete_calls = 0
+        self.created = []
+
+    def find(self, query, _projection):
+        cutoff = query["created_at"]["$lt"]
+        return _FakeCursor([d for d in self.docs if d["created_at"] < cutoff])
+
+    def delete_many(self, query):
+        ids = set(query["_id"]["$in"])
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if d["_id"] not in ids]
+        self.delete_calls += 1
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    def index_information(self):
+        return self.indexes
+
+    def create_index(self, keys, **kwargs):
+        self.created.append((keys, kwargs))
+
+
+class HashRetentionTests(unittest.TestCase):
+    def test_retention_is_lookback_plus_margin(self):
+        cfg = MyWinImageQualityConfig(duplicate_lookback_days=30, hash_retention_margin_days=7)
+        self.assertEqual(hash_retention_days(cfg), 37)
+
+    def test_prune_deletes_only_expired_records_in_batches(self):
+        docs = [{"_id": i, "created_at": NOW - timedelta(days=40, minutes=i)} for i in range(7)]
+        docs.append({"_id": 99, "created_at": NOW - timedelta(days=1)})
+        hashes = _FakeHashes(docs)
+        deleted = prune_image_hashes(hashes, retention_days=37, batch_size=3, pause_seconds=0, now=NOW)
+        self.assertEqual(deleted, 7)
+        self.assertEqual(hashes.delete_calls, 3)
+        self.assertEqual([d["_id"] for d in hashes.docs], [99])
+
+    def test_prune_logs_size_before_and_after(self):
+        hashes = _FakeHashes()
+        with self.assertLogs(level="INFO") as captured:
+            prune_image_hashes(hashes, retention_days=37, pause_seconds=0, now=NOW)
+        joined = "\n".join(captured.output)
+        self.assertIn("prune_start", joined)
+        self.assertIn("before=", joined)
+        self.assertIn("after=", joined)
+
+    def test_ttl_index_created_when_missing(self):
+        hashes = _FakeHashes()
+        ensure_hash_retention_index(hashes, retention_days=37)
+        _keys, kwargs = hashes.created[0]
+        self.assertEqual(kwargs["expireAfterSeconds"], 37 * 86400)
+        self.assertEqual(kwargs["name"], HASHES_CREATED_AT_INDEX)
+
+    def test_plain_index_converted_with_collmod(self):
+        hashes = _FakeHashes(indexes={HASHES_CREATED_AT_INDEX: {"key": [("created_at", 1)]}})
+        ensure_hash_retention_index(hashes, retention_days=37)
+        self.assertEqual(hashes.created, [])
+        name, _args, kwargs = hashes.database.commands[0]
+        self.assertEqual(name, "collMod")
+        self.assertEqual(kwargs["index"]["expireAfterSeconds"], 37 * 86400)
+
+    def test_matching_ttl_index_is_left_alone(self):
+        hashes = _FakeHashes(
+            indexes={HASHES_CREATED_AT_INDEX: {"key": [("created_at", 1)], "expireAfterSeconds": 37 * 86400}}
+        )
+        ensure_hash_retention_index(hashes, retention_days=37)
+        self.assertEqual(hashes.created, [])
+        self.assertEqual(hashes.database.commands, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
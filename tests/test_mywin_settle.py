@@ -0,0 +1,166 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from mywin_settle import SettleJob, SettleScheduler
+from mywin_xp import settle_xp_snapshots
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, _direction):
+        return _Cursor(sorted(self.docs, key=lambda d: d[key]))
+
+    def limit(self, n):
+        return _Cursor(self.docs[:n])
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class _Source:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query):
+        id_range = query["_id"]
+        return _Cursor([
+            d for d in self.docs
+            if d["_id"] < id_range["$lt"] and ("$gt" not in id_range or d["_id"] > id_range["$gt"])
+        ])
+
+
+class _Leases:
+    def __init__(self):
+        self.docs = {}
+
+    def find_one_and_update(self, filt, update, upsert=False, return_document=None):
+        name = filt["_id"]
+        current = self.docs.get(name)
+        owner_clause, expired_clause = filt["$or"][1], filt["$or"][0]
+        if current is None or current["owner"] == owner_clause["owner"] \
+                or current["expires_at"] <= expired_clause["expires_at"]["$lte"]:
+            self.docs[name] = dict(update["$set"])
+            return self.docs[name]
+        raise DuplicateKeyError("lease held", code=11000)
+
+    def update_one(self, filt, update):
+        current = self.docs.get(filt["_id"])
+        if current and current["owner"] == filt["owner"]:
+            current.update(update["$set"])
+
+
+class _Checkpoints:
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, filt):
+        return self.docs.get(filt["_id"])
+
+    def update_one(self, filt, update, upsert=False):
+        self.docs.setdefault(filt["_id"], {}).update(update["$set"])
+
+
+class _Runs:
+    def __init__(self):
+        self.docs = []
+
+    def insert_one(self, doc):
+        self.docs.append(doc)
+
+
+class _Snapshots:
+    def __init__(self):
+        self.ops = []
+
+    def bulk_write(self, ops, ordered=True):
+        self.ops.extend(ops)
+
+
+def _old_ids(n):
+    base = datetime.now(timezone.utc) - timedelta(hours=1)
+    return [ObjectId.from_datetime(base + timedelta(seconds=i)) for i in range(n)]
+
+
+class SettleSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.leases = _Leases()
+        self.checkpoints = _Checkpoints()
+        self.runs = _Runs()
+        self.scheduler = SettleScheduler(self.leases, self.checkpoints, self.runs, owner="me")
+        self.processed = []
+
+    def _job(self, docs, batch_size=2):
+        def process(batch):
+            self.processed.append([d["_id"] for d in batch])
+            return len(batch)
+
+        return SettleJob(name="job", collection=_Source(docs), process_batch=process, batch_size=batch_size)
+
+    def test_processes_in_bounded_batches_and_records_run(self):
+        docs = [{"_id": i} for i in _old_ids(5)]
+        run = self.scheduler.run_once(self._job(docs))
+        self.assertEqual([len(b) for b in self.processed], [2, 2, 1])
+        self.assertEqual(run["rows_scanned"], 5)
+        self.assertEqual(run["rows_affected"], 5)
+        self.assertIn("duration_ms", self.runs.docs[0])
+        self.assertEqual(self.checkpoints.docs["job"]["high_water_mark"], docs[-1]["_id"])
+
+    def test_second_run_only_sees_records_past_high_water_mark(self):
+        ids = _old_ids(4)
+        source_docs = [{"_id": i} for i in ids[:2]]
+        job = self._job(source_docs, batch_size=10)
+        self.scheduler.run_once(job)
+        source_docs.extend({"_id": i} for i in ids[2:])
+        run = self.scheduler.run_once(job)
+        self.assertEqual(run["rows_scanned"], 2)
+        self.assertEqual(self.processed[-1], ids[2:])
+
+    def test_recent_records_wait_for_lag(self):
+        docs = [{"_id": ObjectId()}]
+        run = self.scheduler.run_once(self._job(docs))
+        self.assertEqual(run["rows_scanned"], 0)
+
+    def test_lease_held_by_other_instance_skips_run(self):
+        self.leases.docs["job"] = {"owner": "other", "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5)}
+        self.assertIsNone(self.scheduler.run_once(self._job([{"_id": i} for i in _old_ids(1)])))
+        self.assertEqual(self.processed, [])
+
+    def test_run_stops_when_lease_renewal_fails(self):
+        docs = [{"_id": i} for i in _old_ids(5)]
+        job = self._job(docs)
+        process = job.process_batch
+
+        def slow_process(batch):
+            # the lease expired during the batch and another instance took it
+            self.leases.docs["job"] = {"owner": "other", "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5)}
+            return process(batch)
+
+        job.process_batch = slow_process
+        with self.assertLogs(level="WARNING"):
+            run = self.scheduler.run_once(job)
+        self.assertEqual(len(self.processed), 1)
+        self.assertEqual((run["batches"], run["error"]), (1, "lease_lost"))
+        self.assertEqual(self.leases.docs["job"]["owner"], "other")
+
+
+class SettleXpSnapshotsTests(unittest.TestCase):
+    def test_batch_merged_per_user_and_day(self):
+        day = datetime(2026, 3, 1, 10, tzinfo=timezone.utc)
+        docs = [
+            {"_id": 1, "user_id": 7, "xp": 20, "created_at": day},
+            {"_id": 2, "user_id": 7, "xp": 20, "created_at": day + timedelta(hours=1)},
+            {"_id": 3, "user_id": 7, "xp": 20, "created_at": day + timedelta(days=1)},
+        ]
+        snapshots = _Snapshots()
+        self.assertEqual(settle_xp_snapshots(snapshots, docs), 2)
+        self.assertEqual(snapshots.ops[0]._filter, {"_id": "7:2026-03-01"})
+        self.assertEqual(snapshots.ops[0]._doc["$inc"], {"xp": 40, "events": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import main
+from mywin_tracing import JsonlTraceExporter, MongoSpanListener, Tracer
+
+
+def _tracer(sample_rate=1.0):
+    path = os.path.join(tempfile.mkdtemp(), "traces.jsonl")
+    return Tracer(JsonlTraceExporter(path, max_pending=2), sample_rate)
+
+
+def _mongo_event(request_id, command=None, duration_micros=1500):
+    return SimpleNamespace(
+        request_id=request_id,
+        connection_id=("localhost", 27017),
+        command_name="find",
+        command=command or {"find": "mywin_posts"},
+        duration_micros=duration_micros,
+    )
+
+
+class TracerTests(unittest.TestCase):
+    def _spans(self, tracer):
+        tracer.exporter.flush()
+        with open(tracer.exporter.path, encoding="utf-8") as fh:
+            lines = [json.loads(line) for line in fh]
+        return [s for line in lines for s in line["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+
+    def test_stage_and_nested_spans_are_exported_as_otlp_json(self):
+        tracer = _tracer()
+        with tracer.trace("mywin.submission", update_id=7, user_id=1):
+            tracer.mark_stage("parse")
+            tracer.mark_stage("quality")
+            with tracer.span("analyze_image"):
+                pass
+        root, parse, quality, analyze = self._spans(tracer)
+        self.assertEqual(root["parentSpanId"], "")
+        self.assertEqual({parse["parentSpanId"], quality["parentSpanId"]}, {root["spanId"]})
+        self.assertEqual(analyze["parentSpanId"], quality["spanId"])
+        self.assertEqual(len({s["traceId"] for s in (root, parse, quality, analyze)}), 1)
+        self.assertIn({"key": "update_id", "value": {"intValue": "7"}}, root["attributes"])
+        self.assertEqual(parse["endTimeUnixNano"], quality["startTimeUnixNano"])
+
+    def test_unsampled_trace_records_nothing(self):
+        tracer = _tracer(sample_rate=0.0)
+        with tracer.trace("mywin.submission") as trace:
+            tracer.mark_stage("parse")
+            with tracer.span("analyze_image") as span:
+                self.assertIsNone(span)
+        self.assertIsNone(trace)
+        self.assertEqual(tracer.exporter.flush(), 0)
+        self.assertEqual(tracer.stats()["unsampled"], 1)
+
+    def test_error_marks_span_and_full_buffer_drops(self):
+        tracer = _tracer()
+        with self.assertRaises(RuntimeError):
+            with tracer.trace("mywin.submission"), tracer.span("telegram.getFile"):
+                raise RuntimeError("timeout")
+        for _ in range(2):
+            with tracer.trace("mywin.submission"):
+                pass
+        self.assertEqual(tracer.exporter.dropped, 1)
+        spans = self._spans(tracer)
+        self.assertEqual(spans[1]["status"]["code"], 2)
+
+    def test_mongo_commands_become_client_spans_of_the_stage(self):
+        tracer = _tracer()
+        listener = MongoSpanListener()
+        listener.started(_mongo_event(1))  # outside a trace: ignored
+        listener.succeeded(_mongo_event(1))
+
+        async def run():
+            with tracer.trace("mywin.submission"):
+                tracer.mark_stage("dedup")
+                # pymongo calls run in worker threads; the trace follows the context
+                await asyncio.to_thread(listener.started, _mongo_event(2))
+                await asyncio.to_thread(listener.succeeded, _mongo_event(2))
+
+        asyncio.run(run())
+        _root, stage, mongo = self._spans(tracer)
+        self.assertEqual(mongo["name"], "mongo.find")
+        self.assertEqual(mongo["parentSpanId"], stage["spanId"])
+        self.assertEqual(mongo["kind"], 3)
+        self.assertIn({"key": "db.mongodb.collection", "value": {"stringValue": "mywin_posts"}}, mongo["attributes"])
+        self.assertEqual(int(mongo["endTimeUnixNano"]) - int(mongo["startTimeUnixNano"]), 1_500_000)
+
+
+class SubmissionTraceTests(unittest.IsolatedAsyncioTestCase):
+    async def test_submission_is_traced_with_update_and_user(self):
+        tracer = _tracer()
+
+        async def moderate(_messages, _context):
+            main._stage("quality")
+            with main._span("analyze_image"):
+                pass
+
+        message = SimpleNamespace(media_group_id=None, chat_id=100, from_user=SimpleNamespace(id=5))
+        with patch.object(main, "tracer", tracer), patch.object(main, "_moderate_submission", moderate):
+            await main.filter_mywin_media(SimpleNamespace(update_id=9, message=message), None)
+        tracer.exporter.flush()
+        with open(tracer.exporter.path, encoding="utf-8") as fh:
+            spans = json.loads(fh.readline())["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        self.assertEqual([s["name"] for s in spans], ["mywin.submission", "stage.quality", "analyze_image"])
+        self.assertIn({"key": "user_id", "value": {"intValue": "5"}}, spans[0]["attributes"])
+        self.assertIn({"key": "update_id", "value": {"intValue": "9"}}, spans[0]["attributes"])
+
+
+if __name__ == "__main__":
+    unittest.main()
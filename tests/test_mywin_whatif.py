@@ -0,0 +1,99 @@
+import unittest
+
+from bson import ObjectId
+
+from mywin_quality import (
+    MyWinImageMetrics,
+    MyWinImageQualityConfig,
+    compact_metrics,
+    decide_mywin_image_quality,
+    expand_metrics,
+    store_hash_record,
+)
+from mywin_whatif import apply_config_overrides, evaluate_quality_config, format_report
+
+
+class _Cursor(list):
+    def batch_size(self, _n):
+        return self
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    def insert_one(self, doc):
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(doc)
+
+    def find(self, query, _projection):
+        def matches(doc, key, value):
+            return key in doc if value == {"$exists": True} else doc.get(key) == value
+
+        return _Cursor(d for d in self.docs if all(matches(d, k, v) for k, v in query.items()))
+
+
+def _metrics(blur, image_hash="ffffffffffffffff"):
+    return MyWinImageMetrics(800, 800, 100_000, blur, 40.0, 0.3, image_hash)
+
+
+class WhatIfTests(unittest.TestCase):
+    def setUp(self):
+        self.cfg = MyWinImageQualityConfig()
+        self.hashes = FakeCollection()
+        for blur, duplicate in ((70.0, False), (150.0, False), (500.0, False), (500.0, True)):
+            metrics = _metrics(blur)
+            decision = decide_mywin_image_quality(metrics, duplicate, self.cfg)
+            store_hash_record(
+                self.hashes, 1, 1, metrics.image_hash, decision.decision, chat_id=1,
+                metrics=metrics, duplicate_match=duplicate,
+            )
+        store_hash_record(self.hashes, 1, 2, "0000000000000000", "PASS", chat_id=1)  # stored before metrics were kept
+
+    def test_metrics_are_stored_compactly_and_round_trip(self):
+        doc = self.hashes.docs[0]
+        self.assertEqual(doc["metrics"], {"w": 800, "h": 800, "fs": 100_000, "bl": 70.0, "bk": 40.0, "sat": 0.3})
+        self.assertEqual(expand_metrics(doc["metrics"], doc["hash"]), _metrics(70.0))
+        partial = MyWinImageMetrics(800, 800, 100_000, None, None, None, "ffffffffffffffff")
+        store_hash_record(self.hashes, 1, 3, partial.image_hash, "PASS", metrics=partial, duplicate_match=False)
+        self.assertEqual(self.hashes.docs[-1]["metrics"], {"w": 800, "h": 800, "fs": 100_000})
+
+    def test_unchanged_config_changes_nothing(self):
+        with self.assertLogs(level="INFO"):
+            report = evaluate_quality_config(self.hashes, self.cfg)
+        self.assertEqual((report["evaluated"], report["changed"]), (4, 0))
+
+    def test_lower_blur_thresholds_move_decisions(self):
+        candidate = apply_config_overrides(self.cfg, "reject_blur_threshold=60, ignore_blur_threshold=100")
+        with self.assertLogs(level="INFO"):
+            report = evaluate_quality_config(self.hashes, candidate)
+        self.assertEqual(report["transitions"], {"REJECT->IGNORE": 1, "IGNORE->PASS": 1})
+        self.assertEqual(report["after"], {"IGNORE": 1, "PASS": 2, "REJECT": 1})
+        self.assertEqual(report["reasons"]["duplicate_image"], 1)
+        self.assertIn("REJECT->IGNORE=1", format_report(report))
+
+    def test_backfilled_posts_are_replayed_as_non_duplicates(self):
+        posts = FakeCollection([
+            {"_id": 1, "tag": "mywin", "quality_decision": "PASS",
+             "image_metrics": compact_metrics(_metrics(500.0)), "image_hash": "ffffffffffffffff"},
+            {"_id": 2, "tag": "mywin", "quality_decision": "PASS"},  # not backfilled
+            {"_id": 3, "tag": "comebackisreal", "quality_decision": "PASS", "image_metrics": {"w": 10}},
+        ])
+        candidate = apply_config_overrides(self.cfg, "min_file_size_bytes=200000")
+        with self.assertLogs(level="INFO"):
+            report = evaluate_quality_config(posts, candidate, source="posts")
+        self.assertEqual((report["evaluated"], report["transitions"]), (1, {"PASS->REJECT": 1}))
+        self.assertEqual(report["reasons"], {"small_file_size": 1})
+
+    def test_overrides_are_typed_and_validated(self):
+        candidate = apply_config_overrides(self.cfg, "enabled=0,min_width=320")
+        self.assertEqual((candidate.enabled, candidate.min_width), (False, 320))
+        with self.assertRaises(ValueError):
+            apply_config_overrides(self.cfg, "no_such_field=1")
+        with self.assertLogs(level="WARNING") as captured:
+            apply_config_overrides(self.cfg, "duplicate_scope=chat")
+        self.assertIn("override_not_replayed field=duplicate_scope", captured.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import asyncio
+import multiprocessing
+import unittest
+from types import SimpleNamespace
+
+from mywin_workers import WorkerPool, consume, shard_key
+
+
+def _counting_worker(index, work_queue, processed):
+    async def handle(payload):
+        if payload == "boom":
+            raise RuntimeError(payload)
+
+    asyncio.run(consume(work_queue, handle, processed))
+
+
+def _update(user_id=None, chat_id=None, update_id=1):
+    return SimpleNamespace(
+        update_id=update_id,
+        effective_user=SimpleNamespace(id=user_id) if user_id is not None else None,
+        effective_chat=SimpleNamespace(id=chat_id) if chat_id is not None else None,
+    )
+
+
+class ShardKeyTests(unittest.TestCase):
+    def test_user_then_chat_then_update_id(self):
+        self.assertEqual(shard_key(_update(user_id=5, chat_id=-100)), 5)
+        self.assertEqual(shard_key(_update(chat_id=-100)), -100)
+        self.assertEqual(shard_key(_update(update_id=9)), 9)
+
+
+class ConsumeTests(unittest.IsolatedAsyncioTestCase):
+    async def test_payloads_are_handled_in_order_until_sentinel(self):
+        work_queue = multiprocessing.get_context("spawn").Queue()
+        processed = multiprocessing.get_context("spawn").Value("q", 0)
+        for payload in ("a", "boom", "b", None, "after"):
+            work_queue.put(payload)
+        seen = []
+
+        async def handle(payload):
+            seen.append(payload)
+            if payload == "boom":
+                raise RuntimeError(payload)
+
+        with self.assertLogs(level="ERROR"):
+            await consume(work_queue, handle, processed)
+        self.assertEqual(seen, ["a", "boom", "b"])
+        self.assertEqual(processed.value, 3)
+
+
+class WorkerPoolTests(unittest.IsolatedAsyncioTestCase):
+    async def test_updates_are_sharded_and_counted_per_worker(self):
+        pool = WorkerPool(2, _counting_worker, queue_size=10)
+        pool.start()
+        try:
+            for key in (1, 3, 5, 2, 1):
+                await pool.dispatch(key, {"key": key})
+            self.assertEqual(pool.dispatched, [1, 4])
+        finally:
+            pool.stop(timeout=30)
+        stats = pool.stats()
+        self.assertEqual([row["processed"] for row in stats], [1, 4])
+        self.assertEqual([row["backlog"] for row in stats], [0, 0])
+        self.assertFalse(any(row["alive"] for row in stats))
+
+
+class FanOutTests(unittest.IsolatedAsyncioTestCase):
+    async def test_ingress_dispatches_serialized_update_by_sender(self):
+        import main
+
+        dispatched = []
+
+        class FakePool:
+            async def dispatch(self, key, payload):
+                dispatched.append((key, payload))
+
+        update = SimpleNamespace(
+            update_id=3,
+            effective_user=SimpleNamespace(id=42),
+            effective_chat=SimpleNamespace(id=-100),
+            to_dict=lambda: {"update_id": 3},
+        )
+        context = SimpleNamespace(bot_data={"worker_pool": FakePool()})
+        await main._fan_out(update, context)
+        self.assertEqual(dispatched, [(42, {"update_id": 3})])
+
+
+if __name__ == "__main__":
+    unittest.main()
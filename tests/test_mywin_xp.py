@@ -0,0 +1,151 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import main
+from mywin_xp import (
+    XpTotalsBuffer,
+    active_xp_writers,
+    heartbeat_xp_writer,
+    reconcile_xp_totals,
+    release_xp_writer,
+)
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, _direction):
+        return _Cursor(sorted(self.docs, key=lambda d: d[key]))
+
+    def batch_size(self, _n):
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class _Collection:
+    def __init__(self, docs=None, key="_id"):
+        self.docs = list(docs or [])
+        self.key = key
+        self.bulk_ops = []
+
+    def find(self, query=None, _projection=None):
+        if query and self.key in query:
+            wanted = set(query[self.key]["$in"])
+            return _Cursor([d for d in self.docs if d[self.key] in wanted])
+        return _Cursor(list(self.docs))
+
+    def bulk_write(self, ops, ordered=True):
+        self.bulk_ops.extend(ops)
+
+
+class XpTotalsBufferTests(unittest.TestCase):
+    def test_increments_merge_per_user_into_one_write(self):
+        buffer = XpTotalsBuffer()
+        buffer.record(1, 20, "mywin_submission")
+        buffer.record(1, 20, "comeback_submission")
+        buffer.record(2, 20, "mywin_submission")
+        totals, members = _Collection(), _Collection(key="uid")
+        self.assertEqual(buffer.flush(totals, members), 2)
+        self.assertEqual(len(totals.bulk_ops), 2)
+        user_1 = totals.bulk_ops[0]._doc["$inc"]
+        self.assertEqual(user_1, {"xp": 40, "events": 2, "mywin": 1, "cbir": 1})
+        self.assertEqual(members.bulk_ops[0]._doc["$inc"], {"kpi.mywin": 1, "kpi.cbir": 1})
+        self.assertEqual(len(buffer), 0)
+
+    def test_quality_reversal_takes_the_kpi_back(self):
+        buffer = XpTotalsBuffer()
+        buffer.record(1, -20, "mywin_quality_reversal")
+        buffer.record(2, 20, "mywin_submission")
+        buffer.record(2, -20, "mywin_quality_reversal")
+        totals, members = _Collection(), _Collection(key="uid")
+        buffer.flush(totals, members)
+        self.assertEqual(totals.bulk_ops[0]._doc["$inc"], {"xp": -20, "events": 1, "mywin": -1, "cbir": 0})
+        self.assertEqual([op._doc["$inc"] for op in members.bulk_ops], [{"kpi.mywin": -1}])
+
+    def test_failed_flush_keeps_increments(self):
+        class _Failing(_Collection):
+            def bulk_write(self, ops, ordered=True):
+                raise RuntimeError("mongo down")
+
+        buffer = XpTotalsBuffer()
+        buffer.record(1, 20, "mywin_submission")
+        with self.assertRaises(RuntimeError):
+            buffer.flush(_Failing(), _Collection(key="uid"))
+        self.assertEqual(len(buffer), 1)
+
+
+class ReconcileXpTotalsTests(unittest.TestCase):
+    def setUp(self):
+        self.xp_events = _Collection([
+            {"user_id": 2, "xp": 20, "reason": "comeback_submission"},
+            {"user_id": 1, "xp": 20, "reason": "mywin_submission"},
+            {"user_id": 1, "xp": 20, "reason": "mywin_submission"},
+        ])
+        self.totals = _Collection([
+            {"_id": 1, "xp": 40, "events": 2, "mywin": 2, "cbir": 0},
+            {"_id": 2, "xp": 0, "events": 0, "mywin": 0, "cbir": 0},
+        ])
+        self.members = _Collection(
+            [{"uid": 1, "kpi": {"mywin": 2, "cbir": 0}}, {"uid": 2, "kpi": {"mywin": 0, "cbir": 0}}],
+            key="uid",
+        )
+
+    def test_reports_drift_without_writing(self):
+        summary = reconcile_xp_totals(self.xp_events, self.totals, self.members, chunk_size=1)
+        self.assertEqual(summary["users"], 2)
+        self.assertEqual(summary["events"], 3)
+        self.assertEqual(summary["totals_drift"], 1)
+        self.assertEqual(summary["kpi_drift"], 1)
+        self.assertEqual(self.totals.bulk_ops, [])
+
+    def test_apply_rewrites_drifting_documents(self):
+        summary = reconcile_xp_totals(self.xp_events, self.totals, self.members, apply=True)
+        self.assertEqual(summary["fixed"], 2)
+        self.assertEqual(self.totals.bulk_ops[0]._doc["$set"]["xp"], 20)
+
+
+class _Leases:
+    def __init__(self):
+        self.docs = {}
+
+    def update_one(self, filt, update, upsert=False):
+        self.docs.setdefault(filt["_id"], {"_id": filt["_id"]}).update(update["$set"])
+
+    def delete_one(self, filt):
+        self.docs.pop(filt["_id"], None)
+
+    def find(self, query, _projection=None):
+        prefix = query["_id"]["$regex"].lstrip("^")
+        return [
+            d for d in self.docs.values()
+            if d["_id"].startswith(prefix) and d["expires_at"] > query["expires_at"]["$gt"]
+        ]
+
+
+class XpWriterHeartbeatTests(unittest.TestCase):
+    def test_live_heartbeats_are_listed_until_released_or_expired(self):
+        leases = _Leases()
+        heartbeat_xp_writer(leases, "host:1", ttl_seconds=90)
+        heartbeat_xp_writer(leases, "host:2", ttl_seconds=90)
+        leases.docs["xp_totals_writer:host:2"]["expires_at"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+        leases.docs["job"] = {"_id": "job", "owner": "x", "expires_at": datetime.now(timezone.utc) + timedelta(hours=1)}
+        self.assertEqual(active_xp_writers(leases), ["host:1"])
+        release_xp_writer(leases, "host:1")
+        self.assertEqual(active_xp_writers(leases), [])
+
+    def test_apply_is_refused_while_a_bot_is_running(self):
+        leases = _Leases()
+        heartbeat_xp_writer(leases, "host:1", ttl_seconds=90)
+        with patch.object(main, "_install_logging"), patch.object(main, "job_leases", leases), \
+                patch.object(main, "reconcile_xp_totals", side_effect=AssertionError("reconciled")):
+            with self.assertLogs(level="ERROR"), self.assertRaises(SystemExit) as ctx:
+                main.main(["--reconcile-xp-totals", "--apply"])
+        self.assertEqual(ctx.exception.code, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import main
+
+
+class _FakeMigrations:
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, _filter, _projection):
+        return [{"_id": k} for k in self.docs]
+
+    def update_one(self, filt, update, upsert=False):
+        self.docs.setdefault(filt["_id"], dict(update["$setOnInsert"]))
+        return SimpleNamespace(upserted_id=filt["_id"])
+
+
+class _FakePosts:
+    name = "mywin_posts"
+
+    def __init__(self, indexes=None):
+        self.indexes = dict(indexes or {})
+        self.aggregations = 0
+
+    def index_information(self):
+        return self.indexes
+
+    def aggregate(self, _pipeline):
+        self.aggregations += 1
+        return []
+
+    def create_index(self, keys, name, **kwargs):
+        self.indexes[name] = {"key": keys, **kwargs}
+
+
+class SchemaMigrationTests(unittest.TestCase):
+    def setUp(self):
+        self.migrations = _FakeMigrations()
+        p = patch.object(main, "schema_migrations", self.migrations)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def test_migration_runs_once_and_is_recorded(self):
+        posts = _FakePosts()
+        with patch.object(main, "mywin_posts", posts):
+            main.apply_schema_migrations()
+            main.apply_schema_migrations()
+        self.assertEqual(posts.aggregations, 1)
+        self.assertIn("uq_mywin_playback_id", posts.indexes)
+        self.assertIn("0001_unique_playback_id", self.migrations.docs)
+
+    def test_existing_unique_index_skips_collection_scan(self):
+        posts = _FakePosts(indexes={"uq_mywin_playback_id": {"unique": True}})
+        with patch.object(main, "mywin_posts", posts):
+            main.apply_schema_migrations()
+        self.assertEqual(posts.aggregations, 0)
+        self.assertIn("0001_unique_playback_id", self.migrations.docs)
+
+    def test_ensure_index_skips_existing_index(self):
+        posts = _FakePosts(indexes={"uq_mywin_playback_id": {"unique": True}})
+        self.assertFalse(main._ensure_index(posts, [("playback_id", 1)], name="uq_mywin_playback_id"))
+        self.assertTrue(main._ensure_index(posts, [("file_id", 1)], name="idx_mywin_posts_file_id"))
+
+    def test_ensure_index_keeps_same_keys_under_another_name(self):
+        posts = _FakePosts(indexes={"file_id_1": {"key": [("file_id", 1.0)]}})
+        with self.assertLogs(level="WARNING") as captured:
+            self.assertFalse(main._ensure_index(posts, [("file_id", 1)], name="idx_mywin_posts_file_id"))
+        self.assertNotIn("idx_mywin_posts_file_id", posts.indexes)
+        self.assertIn("existing=file_id_1", captured.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import subprocess
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
+
+import main
+from mywin_quality import MyWinImageQualityConfig
+
+
+class _Message:
+    def __init__(self, caption):
+        self.caption = caption
+        self.photo = [SimpleNamespace(file_unique_id="photo_1", file_id="photo_1_full")]
+        self.document = None
+        self.media_group_id = None
+        self.from_user = SimpleNamespace(id=1)
+        self.chat_id = 100
+        self.message_id = 1
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+
+
+class _Posts:
+    def __init__(self):
+        self.lookups = 0
+
+    def find(self, _filter, _projection):
+        self.lookups += 1
+        return [{"_id": 1, "file_id": "photo_1"}]
+
+
+class DbReadinessGateTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.posts = _Posts()
+        self.gate = asyncio.Event()
+        for p in (
+            patch.object(main, "_db_ready", self.gate),
+            patch.object(main, "mywin_posts", self.posts),
+            patch.object(main, "load_mywin_quality_config", return_value=MyWinImageQualityConfig(enabled=False)),
+        ):
+            p.start()
+            self.addCleanup(p.stop)
+
+    async def test_invalid_caption_is_deleted_without_waiting_for_db(self):
+        message = _Message("hello")
+        await asyncio.wait_for(main.filter_mywin_media(SimpleNamespace(update_id=1, message=message), None), timeout=1)
+        self.assertTrue(message.deleted)
+
+    async def test_valid_submission_waits_for_db_ready(self):
+        message = _Message("#mywin Zeus Rising")
+        task = asyncio.create_task(main.filter_mywin_media(SimpleNamespace(update_id=1, message=message), None))
+        await asyncio.sleep(0.05)
+        self.assertFalse(task.done())
+        self.assertEqual(self.posts.lookups, 0)
+        self.gate.set()
+        await asyncio.wait_for(task, timeout=1)
+        self.assertEqual(self.posts.lookups, 1)
+
+    async def test_prepare_db_retries_then_opens_gate(self):
+        calls = []
+
+        def flaky_ping(_name):
+            calls.append(1)
+            if len(calls) == 1:
+                raise ServerSelectionTimeoutError("mongo down")
+
+        fake_client = SimpleNamespace(admin=SimpleNamespace(command=flaky_ping))
+        with patch.object(main, "client", fake_client), patch.object(main, "ensure_indexes", lambda: None):
+            with self.assertLogs(level="INFO"):
+                await main._prepare_db(0.0, retry_delay=0)
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(self.gate.is_set())
+
+    async def test_prepare_db_does_not_retry_permanent_failures(self):
+        calls = []
+
+        def conflicting_indexes():
+            calls.append(1)
+            raise OperationFailure("Index already exists with a different name: file_id_1", code=85)
+
+        fake_client = SimpleNamespace(admin=SimpleNamespace(command=lambda _name: None))
+        with patch.object(main, "client", fake_client), patch.object(main, "ensure_indexes", conflicting_indexes):
+            with self.assertLogs(level="ERROR") as captured:
+                await asyncio.wait_for(main._prepare_db(0.0, retry_delay=0), timeout=1)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(self.gate.is_set())
+        self.assertIn("db_prepare_failed_permanently", captured.output[0])
+
+
+class LazyImportTests(unittest.TestCase):
+    def test_importing_main_does_not_import_pillow(self):
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, main; print('PIL' in sys.modules)"],
+            cwd=repo_root,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "False")
+
+    def test_importing_main_does_not_import_multiprocessing(self):
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(
+            [
+                sys.executable, "-c",
+                "import sys, main; print(sorted(m for m in ('multiprocessing', 'concurrent.futures.process',"
+                " 'mywin_backfill', 'mywin_workers', 'mywin_whatif', 'mywin_cachesync') if m in sys.modules))",
+            ],
+            cwd=repo_root,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_parse_importtime_skips_header(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   mywin_quality\n"
+            "import time:      1500 |      90000 | main\n"
+        )
+        rows = main._parse_importtime(stderr)
+        self.assertEqual(rows, [("mywin_quality", 120, 120), ("main", 1500, 90000)])
+
+
+if __name__ == "__main__":
+    unittest.main()